@@ -0,0 +1,313 @@
+import asyncio
+import time
+from typing import List, Union
+
+import aiomysql
+
+import cost
+import dependencies
+import plan
+import schema
+from config import SyncConfig
+from manager import ONLINE_DDL_ALGORITHMS, UNSUPPORTED_ALGORITHM_ERRORS, BlockingDDLError, hold_foreign_keys
+
+
+# Настройки синхронного ProdManager, которые асинхронный режим не выполняет (о них предупреждается при запуске)
+UNSUPPORTED_SETTINGS = ('journal_path', 'incremental', 'copy_data', 'shadow_copy', 'throttle')
+
+
+class AsyncBaseManager:
+    """
+    Асинхронный вариант менеджера БД: запросы выполняются через пул соединений aiomysql,
+    независимые запросы отправляются одновременно на разных соединениях пула
+    """
+    def __init__(self, db_config: dict, pool_size: int = 4):
+        """
+        :param db_config: параметры подключения (host, port, user, password, database)
+        :param pool_size: число соединений пула - предел одновременно выполняемых запросов
+        """
+        self.config = db_config
+        self.pool_size = pool_size
+        self.pool = None
+        self.schema = None
+
+    async def connect(self):
+        """
+        Создание пула соединений
+        """
+        config = dict(self.config)
+        config['db'] = config.pop('database')
+        self.pool = await aiomysql.create_pool(minsize=1, maxsize=self.pool_size, autocommit=False, **config)
+        print(f"Пул соединений с сервером MySQL создан: {self.config['database']} ({self.pool_size} соединений)")
+
+    async def disconnect(self):
+        """
+        Закрытие пула соединений
+        """
+        self.pool.close()
+        await self.pool.wait_closed()
+        print(f"Соединения с базой данных {self.config['database']} закрыты")
+
+    async def __aenter__(self):
+        await self.connect()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.disconnect()
+
+    @staticmethod
+    async def _execute(connection, query: str, params: Union[None, list] = None) -> list:
+        """ Выполнение запроса на заданном соединении с получением результата """
+        async with connection.cursor() as cursor:
+            await cursor.execute(query, params or None)
+            return await cursor.fetchall()
+
+    async def fetch(self, query: str, params: Union[None, list] = None) -> list:
+        """
+        Выполнение запроса на свободном соединении пула
+        :return: строки результата
+        """
+        async with self.pool.acquire() as connection:
+            return await self._execute(connection, query, params)
+
+    async def send_to_db(self, query: str, params: Union[None, list] = None):
+        """
+        Выполнение SQL запроса и закрепление результата
+        :param query: Строка со SQL-запросом
+        :param params: Параметры для массовой записи (опционально)
+        """
+        async with self.pool.acquire() as connection:
+            async with connection.cursor() as cursor:
+                if params:
+                    await cursor.executemany(query, params)
+                else:
+                    await cursor.execute(query)
+            await connection.commit()
+
+    async def send_many(self, queries: List[str]):
+        """
+        Одновременное выполнение независимых SQL запросов на разных соединениях пула
+        :param queries: список запросов (порядок выполнения не гарантируется)
+        """
+        await asyncio.gather(*(self.send_to_db(query) for query in queries))
+
+    async def get_schema(self, tables: list = None) -> schema.SchemaSnapshot:
+        """
+        Загрузка полной структуры БД: запросы к information_schema и проверки пустоты выполняются одновременно
+        :param tables: загрузить столбцы и индексы только этих таблиц (по умолчанию - всех)
+        :return: датакласс со структурой БД
+        """
+        requests = schema.schema_requests(tables)
+        results = await asyncio.gather(*(self.fetch(query, params) for key, query, params in requests
+                                         if query is not None))
+        results = iter(results)
+        rows = {key: next(results) if query is not None else [] for key, query, params in requests}
+        snapshot = schema.build_snapshot(self.config['database'], rows)
+        if tables is not None:
+            snapshot.partial = sorted(set(snapshot.tables) - set(tables))
+
+        detailed = [table for table in snapshot.tables if table not in snapshot.partial]
+        probes = await asyncio.gather(*(self.fetch(query, params)
+                                        for query, params in schema.emptiness_requests(detailed)))
+        for table_name, has_rows in (row for batch in probes for row in batch):
+            snapshot.tables[schema.as_text(table_name)].stats.is_empty = not bool(has_rows)
+        self.schema = snapshot
+        #
+        return snapshot
+
+    async def get_structure(self) -> dict:
+        """
+        Сбор данных о структуре БД
+        :return: Словарь данными о таблицах, столбцах внутри и статистикой (оценки размера и признак пустоты)
+        """
+        snapshot = await self.get_schema()
+        return {
+            table_name: {
+                'is_empty': table.stats.is_empty,
+                'columns': list(table.columns),
+                'rows_estimate': table.stats.rows_estimate,
+                'data_length': table.stats.data_length,
+                'index_length': table.stats.index_length,
+            }
+            for table_name, table in snapshot.tables.items()
+        }
+
+    async def drop_tables(self):
+        """
+        Удаление всех таблиц - очистка БД: пакетами по графу внешних ключей, один DROP TABLE на пакет
+        """
+        snapshot = await self.get_schema()
+        graph = dependencies.get_dependencies(snapshot)
+        for batch in dependencies.drop_batches(snapshot.tables, graph):
+            await self.send_to_db(f"DROP TABLE {', '.join(schema.quote_name(table) for table in batch)}")
+
+
+class AsyncProdManager(AsyncBaseManager):
+    """
+    Асинхронное приведение боевой БД к виду тестовой. Обе структуры загружаются одновременно,
+    независимые изменения (разные группы таблиц, внешние ключи разных таблиц) выполняются параллельно
+    """
+    def __init__(self, db_config: dict, sync_config: SyncConfig = None):
+        self.sync_config = sync_config or SyncConfig()
+        self.ddl_log = []
+        self.errors = {}
+        # таблицы, созданные в этом запуске (пустые): их внешние ключи добавляются без проверки строк
+        self.empty_tables = set()
+        self.budget_exceeded = False
+        super().__init__(db_config, pool_size=max(self.sync_config.workers, 1))
+
+    async def _alter_table(self, connection, table_change: plan.TableChange) -> str:
+        """
+        Выполнение изменений таблицы одним ALTER TABLE; в режиме online DDL алгоритм перебирается
+        от INSTANT к INPLACE (LOCK=NONE), COPY - только если он разрешен
+        :param connection: соединение из пула
+        :param table_change: набор изменений таблицы
+        :return: имя фактически использованного алгоритма
+        """
+        if not self.sync_config.online_ddl:
+            await self._execute(connection, table_change.to_sql())
+            self.ddl_log.append({'table': table_change.table, 'algorithm': 'DEFAULT'})
+            return 'DEFAULT'
+
+        for algorithm, clause in ONLINE_DDL_ALGORITHMS:
+            if algorithm == 'COPY' and not self.sync_config.allow_copy:
+                raise BlockingDDLError(f'Изменение таблицы {table_change.table} требует ALGORITHM=COPY, '
+                                       f'который блокирует запись (разрешается настройкой sync.allow_copy)')
+            try:
+                await self._execute(connection, f'{table_change.to_sql()}, {clause}')
+            except aiomysql.Error as exp:
+                if exp.args and exp.args[0] in UNSUPPORTED_ALGORITHM_ERRORS:
+                    continue
+                raise exp
+            self.ddl_log.append({'table': table_change.table, 'algorithm': algorithm})
+            return algorithm
+
+    async def _sync_group(self, tables: List[str], migration: plan.MigrationPlan):
+        """
+        Последовательное изменение группы связанных внешними ключами таблиц на одном соединении пула
+        """
+        async with self.pool.acquire() as connection:
+            for table in tables:
+                table_change = migration.table_changes[table]
+                lines = [' '*4 + f'В таблице {table} :']
+                lines.extend(' '*7 + f'Требует проверки разработчиком: {item}' for item in table_change.review)
+                if table_change.changes:
+                    try:
+                        algorithm = await self._alter_table(connection, table_change)
+                        lines.append(' '*7 + f'Изменений выполнено одним ALTER TABLE: {len(table_change.changes)}, '
+                                             f'алгоритм: {algorithm}')
+                    except (BlockingDDLError, aiomysql.Error) as exp:
+                        # теневая копия (sync.shadow_copy) доступна только в синхронном ProdManager
+                        self.errors[table] = exp
+                        lines.append(' '*7 + f'Изменения не применены: {exp}')
+                print('\n'.join(lines))
+
+    async def _apply_foreign_keys(self, table_change: plan.TableChange, adding: bool = False):
+        """
+        Удаление или добавление внешних ключей одной таблицы на отдельном соединении пула
+        """
+        validate = self.sync_config.validate_foreign_keys and table_change.table not in self.empty_tables
+        skip_checks = adding and not validate
+        names = ', '.join(change.name for change in table_change.changes)
+        async with self.pool.acquire() as connection:
+            try:
+                if skip_checks:
+                    # переменная сессии - действует только на этом соединении
+                    await self._execute(connection, 'SET FOREIGN_KEY_CHECKS = 0')
+                algorithm = await self._alter_table(connection, table_change)
+                print(' '*3, f'{"Добавлены" if adding else "Удалены"} внешние ключи {names} '
+                             f'таблицы {table_change.table}, алгоритм: {algorithm}')
+            except (BlockingDDLError, aiomysql.Error) as exp:
+                self.errors[table_change.table] = exp
+                print(' '*3, f'Внешние ключи {names} таблицы {table_change.table} не изменены: {exp}')
+            finally:
+                if skip_checks:
+                    await self._execute(connection, 'SET FOREIGN_KEY_CHECKS = 1')
+
+    async def _create_tables(self, tables: List[str], test_schema: schema.SchemaSnapshot):
+        """
+        Создание новых таблиц по модели образца в порядке зависимостей. Таблицы создаются без внешних ключей -
+        они добавляются последними, вместе с остальными ключами
+        """
+        ordered, cyclic = dependencies.creation_order(tables, dependencies.get_dependencies(test_schema))
+        async with self.pool.acquire() as connection:
+            for table in ordered + cyclic:
+                await self._execute(connection, test_schema.tables[table].to_create_sql(foreign_keys=False))
+                print(' '*3, 'Создана:', table)
+
+    async def compare_and_fit(self, test_db: Union[AsyncBaseManager, schema.SchemaSnapshot]) -> plan.MigrationPlan:
+        """
+        Комплекс операций по сравнению текущей БД (боевой) с заданной тестовой и приведению к единому виду
+        :param test_db: тестовая БД (асинхронный менеджер) или снимок ее структуры
+        :return: план миграции
+        """
+        print('\nНачинаем сравнивать и приводить боевую БД к виду тестовой')
+        unsupported = [name for name in UNSUPPORTED_SETTINGS if getattr(self.sync_config, name)]
+        if unsupported:
+            print(f'Внимание: асинхронный режим не поддерживает настройки sync {unsupported} - они не учитываются. '
+                  f'Для них используйте синхронный режим (merge без --async)')
+        started = time.perf_counter()
+        if isinstance(test_db, schema.SchemaSnapshot):
+            test_schema, prod_schema = test_db, await self.get_schema()
+        else:
+            test_schema, prod_schema = await asyncio.gather(test_db.get_schema(), self.get_schema())
+        migration = plan.build_plan(source=test_schema, target=prod_schema, renames=self.sync_config.renames,
+                                    detect_renames=self.sync_config.detect_renames)
+        print(f'Сравнение структур заняло {time.perf_counter() - started:.2f} с')
+
+        # новые таблицы создаются по модели пустыми; ключи, которые нельзя добавить без COPY, не трогаются
+        self.empty_tables = set(migration.added_tables)
+        for table, exp in hold_foreign_keys(migration, self.sync_config, self.empty_tables).items():
+            print(' '*3, f'Внешние ключи таблицы {table} не изменены: {exp}')
+            self.errors.setdefault(table, exp)
+
+        # бюджет времени проверяется до каких-либо изменений (оценка - без учета параллельной работы)
+        estimates = cost.estimate_plan(migration, test_schema, prod_schema,
+                                       validate_foreign_keys=self.sync_config.validate_foreign_keys)
+        projected = sum(estimate.seconds for estimate in estimates)
+        if self.sync_config.cost_budget and projected > self.sync_config.cost_budget:
+            print(f'Оценка времени (~{projected:.1f} с) превышает бюджет ({self.sync_config.cost_budget} с), '
+                  f'изменения не вносятся. Разбейте миграцию или увеличьте sync.cost_budget.')
+            self.budget_exceeded = True
+            return migration
+
+        if migration.added_tables:
+            print(f'Добавленных таблиц в тестовую БД: [{len(migration.added_tables)}]. Создаю их на боевой версии.')
+            await self._create_tables(migration.added_tables, test_schema)
+
+        if migration.foreign_key_drops:
+            print(f'Удаляемых внешних ключей в таблицах: [{len(migration.foreign_key_drops)}].')
+            await asyncio.gather(*(self._apply_foreign_keys(table_change)
+                                   for table_change in migration.foreign_key_drops.values()))
+
+        if migration.dropped_tables:
+            print(f'Удаленных таблиц в тестовой БД: [{len(migration.dropped_tables)}]. Пробую удалить их с боевой.')
+            dropped_fks = {table: {change.name for change in table_change.changes}
+                           for table, table_change in migration.foreign_key_drops.items()}
+            prod_graph = dependencies.get_dependencies(prod_schema, exclude=dropped_fks)
+            blocked = dependencies.blocked_drops(migration.dropped_tables, prod_graph)
+            for table, children in blocked.items():
+                print(' '*3, 'Не удалось удалить таблицу в автоматическом режиме:', table,
+                      f'на нее ссылаются таблицы {children}, требуется внимание разработчика.')
+            droppable = [table for table in migration.dropped_tables if table not in blocked]
+            for batch in dependencies.drop_batches(droppable, prod_graph):
+                await self.send_to_db(f"DROP TABLE {', '.join(schema.quote_name(table) for table in batch)}")
+                print(' '*3, 'Удалил:', ', '.join(batch))
+
+        print(f'Общих таблиц в тестовой и боевой БД: [{len(migration.intersecting_tables)}]. Проверяю столбцы.')
+        groups = plan.group_linked_tables(list(migration.table_changes), test_schema, prod_schema)
+        await asyncio.gather(*(self._sync_group(group, migration) for group in groups))
+
+        if migration.foreign_key_adds:
+            print(f'Добавляемых внешних ключей в таблицах: [{len(migration.foreign_key_adds)}].')
+            await asyncio.gather(*(self._apply_foreign_keys(table_change, adding=True)
+                                   for table_change in migration.foreign_key_adds.values()))
+
+        if self.errors:
+            print(f'\nНе удалось изменить таблиц: [{len(self.errors)}], требуется внимание разработчика')
+            for table, exp in self.errors.items():
+                print(' '*3, table, ':', exp)
+            return migration
+        print(f'\n\nГотово! Структура боевой БД приведена к виду тестовой за {time.perf_counter() - started:.2f} с')
+        #
+        return migration
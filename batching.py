@@ -0,0 +1,91 @@
+from typing import List, Union
+
+
+class StatementBatch:
+    """
+    Пакетный режим send_to_db: запросы копятся и уходят на сервер по pipeline_size штук одним
+    многозапросным обращением (через ';'), транзакция фиксируется не после каждого запроса,
+    а после transaction_size запросов (строк для массовой записи) и при выходе из блока.
+    Порядок выполнения запросов сохраняется. Используется как контекстный менеджер:
+
+        with manager.batch(transaction_size=1000):
+            manager.send_to_db(...)
+
+    При исключении внутри блока неотправленные запросы отбрасываются, незафиксированная часть
+    транзакции откатывается (DDL в MySQL фиксируется неявно и не откатывается)
+    """
+    def __init__(self, manager, transaction_size: int = 1000, pipeline_size: int = 50):
+        """
+        :param manager: менеджер БД (экземпляр класса менеджера)
+        :param transaction_size: число запросов между фиксациями транзакции
+        :param pipeline_size: число запросов, отправляемых одним обращением к серверу
+        """
+        self.manager = manager
+        self.transaction_size = max(transaction_size, 1)
+        self.pipeline_size = max(pipeline_size, 1)
+        #
+        self.pending: List[str] = []
+        self.uncommitted = 0
+        self.statements = 0
+        self.round_trips = 0
+        self.commits = 0
+
+    def __enter__(self):
+        if self.manager.active_batch is not None:
+            raise RuntimeError('Пакетный режим уже включен для этого соединения')
+        self.manager.active_batch = self
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.manager.active_batch = None
+        if exc_type is not None:
+            self.pending = []
+            self.manager.connection.rollback()
+            return False
+        self.commit()
+        return False
+
+    def send(self, query: str, params: Union[None, list] = None):
+        """
+        Постановка запроса в пакет. Запрос с параметрами массовой записи выполняется сразу (после уже
+        накопленных), т.к. драйвер и так отправляет его одним обращением
+        :param query: Строка со SQL-запросом
+        :param params: Параметры для массовой записи (опционально)
+        """
+        if params:
+            self.flush()
+            self.manager.cursor.executemany(query, params)
+            self.round_trips += 1
+            self.statements += len(params)
+            self._written(len(params))
+            return
+        self.pending.append(query.strip().rstrip(';'))
+        if len(self.pending) >= self.pipeline_size:
+            self.flush()
+
+    def flush(self):
+        """ Отправка накопленных запросов одним обращением к серверу """
+        if not self.pending:
+            return
+        statements, self.pending = self.pending, []
+        if len(statements) == 1:
+            self.manager.cursor.execute(statements[0])
+        else:
+            self.manager.cursor.execute_multi(';\n'.join(statements))
+        self.round_trips += 1
+        self.statements += len(statements)
+        self._written(len(statements))
+
+    def _written(self, count: int):
+        self.uncommitted += count
+        if self.uncommitted >= self.transaction_size:
+            self.manager.connection.commit()
+            self.commits += 1
+            self.uncommitted = 0
+
+    def commit(self):
+        """ Отправка накопленных запросов и фиксация транзакции """
+        self.flush()
+        self.manager.connection.commit()
+        self.commits += 1
+        self.uncommitted = 0
@@ -0,0 +1,144 @@
+import argparse
+import contextlib
+import dataclasses
+import io
+import json
+import sys
+import time
+
+import config
+import plan
+import utils
+from manager import ProdManager, TestManager
+
+
+# Этапы compare_and_fit, относящиеся к выполнению DDL
+DDL_PHASES = ('create', 'fk_drop', 'drop', 'alter', 'fk_add')
+# Показатели, по которым ищутся регрессии
+TRACKED_METRICS = ('introspection', 'diff', 'ddl', 'total', 'round_trips')
+# Изменения меньше этого порога (сек) считаются шумом
+NOISE_SECONDS = 0.05
+
+
+def prepare(db_test: TestManager, db_prod: ProdManager, tables: int, columns: int, indexes: int, fk_chain: int,
+            drift: float, seed: int):
+    """
+    Подготовка пары БД: одинаковая синтетическая схема на обеих и расхождения в тестовой
+    """
+    # подготовка не замеряется: запросы отправляются пакетами, по несколько за одно обращение к серверу
+    for db in (db_test, db_prod):
+        db.drop_tables(batched=True)
+        with db.batch():
+            for query in utils.get_synthetic_tables(tables, columns, indexes, fk_chain, seed):
+                db.send_to_db(query)
+    with db_test.batch():
+        for query in utils.get_synthetic_drift(tables, columns, fk_chain, drift, seed):
+            db_test.send_to_db(query)
+
+
+def run_case(db_test: TestManager, db_prod: ProdManager, tables: int, columns: int, indexes: int, fk_chain: int,
+             drift: float, seed: int) -> dict:
+    """
+    Один замер: подготовка схемы, сравнение и приведение боевой БД к виду тестовой
+    :return: словарь с параметрами случая и замеренными показателями
+    """
+    with contextlib.redirect_stdout(io.StringIO()):
+        prepare(db_test, db_prod, tables, columns, indexes, fk_chain, drift, seed)
+        test_schema, prod_schema = db_test.get_schema(), db_prod.get_schema()
+
+        started = time.perf_counter()
+        plan.build_plan(test_schema, prod_schema)
+        diff_time = time.perf_counter() - started
+
+        db_prod.metrics.reset()
+        started = time.perf_counter()
+        db_prod.compare_and_fit(test_db=db_test)
+        total = time.perf_counter() - started
+
+    summary = db_prod.metrics.summary()
+    #
+    return {
+        'tables': tables, 'columns': columns, 'indexes': indexes, 'fk_chain': fk_chain, 'drift': drift,
+        'introspection': summary.get('introspection', {}).get('phase_time', 0.0),
+        'diff': diff_time,
+        'ddl': sum(summary.get(phase, {}).get('phase_time', 0.0) for phase in DDL_PHASES),
+        'total': total,
+        'round_trips': sum(item['round_trips'] for item in summary.values()),
+        'queries': sum(item['queries'] for item in summary.values()),
+    }
+
+
+def case_key(result: dict) -> tuple:
+    return tuple(result[key] for key in ('tables', 'columns', 'indexes', 'fk_chain', 'drift'))
+
+
+def compare(results: list, baseline: list, threshold: float) -> list:
+    """
+    Поиск регрессий относительно сохраненных результатов
+    :param results: текущие результаты
+    :param baseline: сохраненные результаты
+    :param threshold: допустимое отношение текущего значения к сохраненному
+    :return: строки с описанием регрессий
+    """
+    previous = {case_key(result): result for result in baseline}
+    regressions = []
+    for result in results:
+        old = previous.get(case_key(result))
+        if old is None:
+            continue
+        for metric in TRACKED_METRICS:
+            value, old_value = result[metric], old.get(metric, 0)
+            noise = 0 if metric == 'round_trips' else NOISE_SECONDS
+            if value > old_value * threshold and value - old_value > noise:
+                regressions.append(f'{case_key(result)} {metric}: {old_value:.3f} -> {value:.3f}')
+    #
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Замеры скорости сравнения и синхронизации на синтетических схемах '
+                                                 '(запускать только на локальном сервере MySQL!)')
+    parser.add_argument('--config', default='config.yml', help='конфиг с тестовой и боевой (локальными) БД')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10, 50, 200], help='число таблиц в схеме')
+    parser.add_argument('--columns', type=int, default=10)
+    parser.add_argument('--indexes', type=int, default=2)
+    parser.add_argument('--fk-chain', type=int, default=5)
+    parser.add_argument('--drift', type=float, default=0.1, help='доля измененных таблиц')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default='bench_results.json', help='файл для сохранения результатов')
+    parser.add_argument('--baseline', help='файл с прошлыми результатами для поиска регрессий')
+    parser.add_argument('--threshold', type=float, default=1.2, help='допустимое замедление (1.2 - на 20%%)')
+    args = parser.parse_args()
+
+    configs = config.get_config(args.config)
+    # кэш отпечатков, бюджет, ограничитель нагрузки и журнал (продолжение прерванного прогона) искажали бы замеры
+    sync_config = dataclasses.replace(configs.sync, incremental=False, cost_budget=0, throttle=False,
+                                      metrics_path='', journal_path='')
+    with contextlib.redirect_stdout(io.StringIO()):
+        db_test = TestManager(configs.database_test.to_dict())
+        db_prod = ProdManager(configs.database_prod.to_dict(), sync_config)
+
+    results = []
+    for tables in args.sizes:
+        result = run_case(db_test, db_prod, tables, args.columns, args.indexes, args.fk_chain, args.drift, args.seed)
+        results.append(result)
+        print(f'таблиц {tables:>5}: структура {result["introspection"]:.3f} с, сравнение {result["diff"]:.3f} с, '
+              f'DDL {result["ddl"]:.3f} с, всего {result["total"]:.3f} с, обращений {result["round_trips"]}')
+
+    with open(args.output, mode='w', encoding='utf-8') as f:
+        json.dump({'created': time.strftime('%Y-%m-%d %H:%M:%S'), 'results': results}, f, indent=2)
+    print(f'Результаты сохранены в {args.output}')
+
+    if args.baseline:
+        with open(args.baseline, mode='r', encoding='utf-8') as f:
+            baseline = json.load(f)['results']
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print('Обнаружены регрессии:')
+            print('\n'.join(' '*4 + line for line in regressions))
+            sys.exit(1)
+        print('Регрессий нет')
+
+
+if __name__ == '__main__':
+    main()
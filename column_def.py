@@ -0,0 +1,289 @@
+import re
+from decimal import Decimal, InvalidOperation
+from typing import List, Optional
+
+from schema import NUMERIC_TYPES, ColumnInfo
+
+
+# Целочисленные типы, у которых ширина отображения (int(11)) не влияет на хранение и с 8.0.19 не выводится
+INTEGER_TYPES = {'tinyint', 'smallint', 'mediumint', 'int', 'bigint'}
+
+# Синонимы типов, которые сервер приводит к каноническому имени
+TYPE_SYNONYMS = {
+    'integer': 'int',
+    'bool': 'tinyint',
+    'boolean': 'tinyint',
+    'dec': 'decimal',
+    'numeric': 'decimal',
+    'fixed': 'decimal',
+    'real': 'double',
+    'double precision': 'double',
+}
+
+# Синонимы текущего времени в значениях по умолчанию и ON UPDATE
+CURRENT_TIMESTAMP_RE = re.compile(r'^(current_timestamp|now|localtime|localtimestamp)\s*(\(\s*(\d*)\s*\))?$', re.I)
+
+# Разбор определения столбца на лексемы: строки в кавычках, имена в обратных кавычках, скобки и слова
+TOKEN_RE = re.compile(r"\s*('(?:[^'\\]|\\.|'')*'|`(?:[^`]|``)*`|\(|\)|,|[^\s(),'`]+)")
+
+
+def _normalize_charset(name: Optional[str]) -> Optional[str]:
+    """ utf8 - устаревший псевдоним utf8mb3 (в 8.0.30 переименован в information_schema) """
+    if not name:
+        return None
+    name = name.lower()
+    if name == 'utf8':
+        return 'utf8mb3'
+    if name.startswith('utf8_'):
+        return 'utf8mb3_' + name[len('utf8_'):]
+    return name
+
+
+def _split_type(column_type: str):
+    """ Разделение типа на имя, аргументы в скобках и атрибуты (unsigned, zerofill) """
+    match = re.match(r'^\s*([a-z ]+?)\s*(\((.*)\))?\s*((?:unsigned|signed|zerofill|\s)*)$', column_type, re.I | re.S)
+    if not match:
+        return column_type.strip().lower(), None, ''
+    base = ' '.join(match.group(1).lower().split())
+    return base, match.group(3), ' '.join(match.group(4).lower().split())
+
+
+def normalize_type(column_type: str) -> str:
+    """
+    Приведение типа к каноническому виду: синонимы, регистр, пробелы, ширина отображения целых чисел
+    :param column_type: тип в виде COLUMN_TYPE ('int(11) unsigned', 'DECIMAL(10, 2)', "enum('a','b')")
+    :return: нормализованный тип
+    """
+    base, args, attributes = _split_type(column_type)
+    base = TYPE_SYNONYMS.get(base, base)
+    if base in INTEGER_TYPES and 'zerofill' not in attributes:
+        args = None
+    elif base == 'decimal' and args is None:
+        args = '10,0'
+    elif args is not None and base in ('enum', 'set'):
+        args = ','.join(token for token in _tokens(args) if token != ',')
+    elif args is not None:
+        args = ','.join(part.strip() for part in args.split(','))
+    # signed - значение по умолчанию, явное указание ничего не меняет
+    attributes = ' '.join(word for word in attributes.split() if word != 'signed')
+    result = base + (f'({args})' if args is not None else '')
+    return f'{result} {attributes}'.strip()
+
+
+def _unquote(value: str) -> str:
+    """ Снятие кавычек со строкового литерала SQL """
+    body = value[1:-1]
+    return re.sub(r"\\(.)|''", lambda m: m.group(1) if m.group(1) is not None else "'", body)
+
+
+def normalize_default(column: ColumnInfo) -> Optional[str]:
+    """
+    Приведение значения по умолчанию к каноническому виду: DEFAULT NULL / 'NULL' / отсутствие, кавычки
+    (MariaDB хранит литералы в кавычках), синонимы CURRENT_TIMESTAMP, представление чисел
+    :param column: описание столбца
+    :return: нормализованное значение или None
+    """
+    default = column.default
+    if default is None or default.upper() == 'NULL':
+        return None
+    if len(default) >= 2 and default[0] == default[-1] == "'":
+        default = _unquote(default)
+    match = CURRENT_TIMESTAMP_RE.match(default.strip())
+    if match:
+        precision = match.group(3)
+        return f'CURRENT_TIMESTAMP({precision})' if precision and precision != '0' else 'CURRENT_TIMESTAMP'
+    if column.data_type.lower() in NUMERIC_TYPES - {'bit'}:
+        try:
+            return str(Decimal(default).normalize())
+        except InvalidOperation:
+            return default
+    return default
+
+
+def normalize_extra(extra: str) -> str:
+    """ Приведение дополнительных атрибутов (auto_increment, on update ...) к каноническому виду """
+    extra = ' '.join(extra.lower().replace('default_generated', '').split())
+    extra = re.sub(r'on update (current_timestamp|now|localtimestamp|localtime)\s*(\(\s*\))?',
+                   'on update current_timestamp', extra)
+    extra = re.sub(r'(virtual|stored) generated', '', extra)
+    return ' '.join(extra.split())
+
+
+def normalize_column(column: ColumnInfo, table_collation: Optional[str] = None) -> tuple:
+    """
+    Семантическое представление столбца для сравнения
+    :param column: описание столбца
+    :param table_collation: collation таблицы - неявные charset/collation столбца берутся из него
+    :return: кортеж (тип, допускает NULL, значение по умолчанию, collation, атрибуты, комментарий, выражение)
+    """
+    collation = _normalize_charset(column.collation)
+    if collation is not None and collation == _normalize_charset(table_collation):
+        # совпадающий с таблицей collation и явно, и неявно означает одно и то же
+        collation = None
+    generation = ' '.join((column.generation_expression or '').split()).lower()
+    return (
+        normalize_type(column.column_type),
+        column.is_nullable,
+        None if generation else normalize_default(column),
+        collation,
+        normalize_extra(column.extra),
+        column.comment or '',
+        generation,
+    )
+
+
+COLUMN_ASPECTS = ('type', 'nullable', 'default', 'collation', 'extra', 'comment', 'generated')
+
+
+def column_differences(source: ColumnInfo, source_collation: Optional[str],
+                       target: ColumnInfo, target_collation: Optional[str]) -> List[str]:
+    """
+    Сравнение двух определений столбца по существу
+    :return: список различающихся характеристик (пустой - столбцы эквивалентны)
+    """
+    source_key = normalize_column(source, source_collation)
+    target_key = normalize_column(target, target_collation)
+    return [aspect for aspect, a, b in zip(COLUMN_ASPECTS, source_key, target_key) if a != b]
+
+
+def _tokens(definition: str) -> List[str]:
+    tokens = []
+    position = 0
+    definition = definition.strip().rstrip(',')
+    while position < len(definition):
+        match = TOKEN_RE.match(definition, position)
+        if not match or not match.group(1):
+            break
+        tokens.append(match.group(1))
+        position = match.end()
+    return tokens
+
+
+def _take_group(tokens: List[str], index: int):
+    """ Сборка выражения в скобках, начиная с '(' на позиции index """
+    depth = 0
+    parts = []
+    while index < len(tokens):
+        token = tokens[index]
+        depth += token == '('
+        depth -= token == ')'
+        parts.append(token)
+        index += 1
+        if depth == 0:
+            break
+    text = ''
+    previous = ''
+    for part in parts:
+        # пробел ставится между операндами, но не перед скобкой вызова функции и не внутри скобок по краям
+        function_call = part == '(' and re.match(r'^\w+$', previous)
+        if text and previous != '(' and part not in (')', ',') and not function_call:
+            text += ' '
+        text += part
+        previous = part
+    return text, index
+
+
+def parse_column_definition(definition: str, position: int = 0) -> ColumnInfo:
+    """
+    Разбор определения столбца из SHOW CREATE TABLE
+    :param definition: строка вида "`name` varchar(32) CHARACTER SET utf8mb4 NOT NULL DEFAULT 'x' COMMENT '...'"
+    :param position: порядковый номер столбца в таблице
+    :return: описание столбца
+    """
+    tokens = _tokens(definition)
+    if not tokens:
+        raise ValueError(f'Пустое определение столбца: {definition!r}')
+    name = tokens[0]
+    if name.startswith('`'):
+        name = name[1:-1].replace('``', '`')
+
+    # тип: имя (возможно из нескольких слов), аргументы в скобках, unsigned / zerofill
+    index = 1
+    type_words = []
+    while index < len(tokens) and re.match(r'^[a-z]+$', tokens[index], re.I) and (
+            not type_words or tokens[index].lower() in ('precision', 'varying', 'unsigned', 'signed', 'zerofill')):
+        type_words.append(tokens[index].lower())
+        index += 1
+    column_type = ' '.join(w for w in type_words if w not in ('unsigned', 'signed', 'zerofill'))
+    data_type = TYPE_SYNONYMS.get(column_type, column_type)
+    if index < len(tokens) and tokens[index] == '(':
+        args, index = _take_group(tokens, index)
+        column_type += args.replace(' ', '') if data_type not in ('enum', 'set') else args
+    while index < len(tokens) and tokens[index].lower() in ('unsigned', 'signed', 'zerofill'):
+        type_words.append(tokens[index].lower())
+        index += 1
+    attributes = [w for w in type_words if w in ('unsigned', 'zerofill')]
+    if attributes:
+        column_type += ' ' + ' '.join(attributes)
+
+    column = ColumnInfo(name=name, position=position, data_type=data_type, column_type=column_type)
+    extra = []
+    while index < len(tokens):
+        word = tokens[index].upper()
+        nxt = tokens[index + 1].upper() if index + 1 < len(tokens) else ''
+        if word == 'CHARACTER' and nxt == 'SET' or word == 'CHARSET':
+            index += 2 if word == 'CHARACTER' else 1
+            column.charset = tokens[index].lower()
+            index += 1
+        elif word == 'COLLATE':
+            column.collation = tokens[index + 1].lower()
+            if column.charset is None:
+                column.charset = column.collation.split('_')[0]
+            index += 2
+        elif word == 'NOT' and nxt == 'NULL':
+            column.is_nullable = False
+            index += 2
+        elif word == 'NULL':
+            index += 1
+        elif word == 'DEFAULT':
+            index += 1
+            if tokens[index] == '(':
+                value, index = _take_group(tokens, index)
+                column.default = value[1:-1]
+                extra.append('DEFAULT_GENERATED')
+            else:
+                value = tokens[index]
+                index += 1
+                if index < len(tokens) and tokens[index] == '(':
+                    args, index = _take_group(tokens, index)
+                    value += args
+                if value.upper() == 'NULL':
+                    column.default = None
+                elif value.startswith("'"):
+                    column.default = _unquote(value)
+                else:
+                    column.default = value
+                    if CURRENT_TIMESTAMP_RE.match(value):
+                        extra.append('DEFAULT_GENERATED')
+        elif word == 'ON' and nxt == 'UPDATE':
+            value = tokens[index + 2]
+            index += 3
+            if index < len(tokens) and tokens[index] == '(':
+                args, index = _take_group(tokens, index)
+                value += args
+            extra.append(f'on update {value}')
+        elif word == 'AUTO_INCREMENT':
+            extra.append('auto_increment')
+            index += 1
+        elif word == 'COMMENT':
+            column.comment = _unquote(tokens[index + 1])
+            index += 2
+        elif word in ('GENERATED', 'AS'):
+            while tokens[index] != '(':
+                index += 1
+            expression, index = _take_group(tokens, index)
+            column.generation_expression = expression[1:-1]
+            kind = tokens[index].upper() if index < len(tokens) else 'VIRTUAL'
+            if kind in ('VIRTUAL', 'STORED'):
+                index += 1
+            else:
+                kind = 'VIRTUAL'
+            extra.append(f'{kind} GENERATED')
+        else:
+            # из прочих атрибутов значим только INVISIBLE, остальные (SRID, /*!...*/) на сравнение не влияют
+            if word == 'INVISIBLE':
+                extra.append('invisible')
+            index += 1
+    column.extra = ' '.join(extra)
+    #
+    return column
@@ -1,5 +1,6 @@
 import yaml
-from dataclasses import dataclass
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
 
 
 @dataclass
@@ -14,21 +15,54 @@ class DatabaseConfig:
         return self.__dict__
 
 
+@dataclass
+class SyncConfig:
+    online_ddl: bool = False
+    allow_copy: bool = False
+    shadow_copy: bool = False
+    chunk_size: int = 1000
+    chunk_sleep: float = 0.0
+    workers: int = 1
+    incremental: bool = False
+    fingerprint_cache: str = '.schema_cache.json'
+    detect_renames: bool = True
+    renames: Dict[str, Dict[str, str]] = field(default_factory=dict)
+    validate_foreign_keys: bool = True
+    cost_budget: float = 0.0
+    throttle: bool = False
+    max_threads_running: int = 32
+    max_history_length: int = 100000
+    max_replica_lag: float = 10.0
+    throttle_max_wait: float = 600.0
+    replica: Optional[DatabaseConfig] = None
+    shard_workers: int = 4
+    metrics_path: str = ''
+    copy_data: bool = False
+    journal_path: str = ''
+
+
 @dataclass
 class Config:
     database_test: DatabaseConfig
     database_prod: DatabaseConfig
+    sync: SyncConfig = field(default_factory=SyncConfig)
+    # боевые шарды с одинаковой схемой: если заданы, синхронизируются все они (вместо database_prod)
+    database_shards: List[DatabaseConfig] = field(default_factory=list)
 
 
 def get_config(config_path: str = 'config.yml'):
     """
     Чтение и распарсинг yaml файла с данными конфигов БД
     :param config_path: имя yaml файла
-    :return: датакласс с данными для подключения к тестовой и боевой БД
+    :return: датакласс с данными для подключения к тестовой и боевой БД (шардам) и настройками синхронизации
     """
     with open(config_path, mode='r') as f:
         raw_config = yaml.safe_load(f)
 
+    raw_sync = dict(raw_config.get('sync') or {})
+    if raw_sync.get('replica'):
+        raw_sync['replica'] = DatabaseConfig(**raw_sync['replica'])
+
     return Config(
         database_test=DatabaseConfig(
             host=raw_config['database_test']['host'],
@@ -43,5 +77,7 @@ def get_config(config_path: str = 'config.yml'):
             user=raw_config['database_prod']['user'],
             password=raw_config['database_prod']['password'],
             database=raw_config['database_prod']['database'],
-        )
+        ),
+        sync=SyncConfig(**raw_sync),
+        database_shards=[DatabaseConfig(**shard) for shard in raw_config.get('database_shards') or []],
     )
@@ -0,0 +1,215 @@
+from dataclasses import dataclass
+from typing import Dict, List
+
+import column_def
+import plan
+from schema import SchemaSnapshot, TableInfo
+
+
+# Классы алгоритмов ALTER TABLE по возрастанию стоимости
+ALGORITHM_RANK = {'INSTANT': 0, 'INPLACE': 1, 'SHADOW': 2, 'COPY': 2}
+
+# Ориентировочная производительность сервера (байт/с) - порядок величин для планирования, а не точный прогноз
+COPY_THROUGHPUT = 20 * 1024 * 1024
+REBUILD_THROUGHPUT = 40 * 1024 * 1024
+INDEX_BUILD_THROUGHPUT = 60 * 1024 * 1024
+# Время операций, меняющих только метаданные (создание/удаление таблицы, INSTANT, удаление индекса)
+METADATA_SECONDS = 0.1
+# Каждый вторичный индекс замедляет перестроение таблицы: его приходится строить заново
+INDEX_REBUILD_FACTOR = 0.3
+# Перенос через теневую копию медленнее обычного копирования: порции, триггеры, паузы
+SHADOW_FACTOR = 1.5
+
+# Изменения параметров столбца, которые не требуют перестроения таблицы / требуют его без копирования
+INSTANT_ASPECTS = {'default', 'comment'}
+INPLACE_ASPECTS = {'nullable'}
+
+
+@dataclass
+class OperationEstimate:
+    """
+    Оценка стоимости одной операции плана миграции
+    """
+    table: str
+    operation: str  # 'create' | 'drop' | 'alter' | 'fk_drop' | 'fk_add'
+    algorithm: str  # 'INSTANT' | 'INPLACE' | 'COPY' | 'SHADOW'
+    seconds: float
+    size: int = 0
+    indexes: int = 0
+    rebuild: bool = False
+
+    @property
+    def is_instant(self) -> bool:
+        return self.algorithm == 'INSTANT'
+
+    @property
+    def blocking(self) -> bool:
+        """ Операция блокирует запись в таблицу на все время выполнения """
+        return self.algorithm == 'COPY'
+
+    def describe(self) -> str:
+        return (f'{self.table}: {self.operation}, {self.algorithm}{" (перестроение)" if self.rebuild else ""}, '
+                f'~{self.seconds:.1f} с, размер {self.size / 1024 / 1024:.1f} МБ, индексов {self.indexes}')
+
+
+def change_algorithm(change, validate_foreign_keys: bool = True) -> tuple:
+    """
+    Алгоритм, которого требует отдельное изменение (для MySQL 8.0.29+)
+    :param change: изменение столбца, индекса или внешнего ключа
+    :param validate_foreign_keys: проверяются ли существующие строки при добавлении внешних ключей
+    :return: кортеж (алгоритм, нужно ли перестроение таблицы)
+    """
+    if isinstance(change, plan.ForeignKeyChange):
+        if change.action == 'add' and validate_foreign_keys:
+            # с FOREIGN_KEY_CHECKS=1 внешний ключ добавляется только копированием таблицы
+            return 'COPY', True
+        return 'INPLACE', False
+    if isinstance(change, plan.IndexChange):
+        # таблица InnoDB упорядочена по первичному ключу - его смена перестраивает таблицу,
+        # вторичные индексы строятся и удаляются без перестроения
+        return 'INPLACE', change.name == 'PRIMARY'
+    if change.action in ('drop', 'rename') and not change.differences:
+        return 'INSTANT', False
+    if change.action == 'add':
+        extra = column_def.parse_column_definition(change.definition).extra.lower()
+        if 'auto_increment' in extra or 'stored' in extra:
+            return 'COPY', True
+        return 'INSTANT', False
+    differences = set(change.differences)
+    if differences <= INSTANT_ASPECTS:
+        return 'INSTANT', False
+    if differences <= INSTANT_ASPECTS | INPLACE_ASPECTS:
+        return 'INPLACE', True
+    # смена типа, collation, auto_increment, выражения генерируемого столбца
+    return 'COPY', True
+
+
+def estimate_table_change(table_change: plan.TableChange, target: TableInfo, source: TableInfo = None,
+                          operation: str = 'alter', validate_foreign_keys: bool = True,
+                          shadow_copy: bool = False) -> OperationEstimate:
+    """
+    Оценка одного ALTER TABLE: алгоритм определяется самым дорогим изменением, время - размером таблицы
+    и числом индексов, которые придется строить
+    :param table_change: изменения таблицы
+    :param target: изменяемая таблица (со статистикой)
+    :param source: таблица-образец - число индексов после изменения
+    :param operation: вид операции в отчете
+    :param validate_foreign_keys: проверяются ли существующие строки при добавлении внешних ключей
+    :param shadow_copy: копирование будет выполнено через теневую таблицу
+    :return: оценка операции
+    """
+    algorithm, rebuild = 'INSTANT', False
+    for change in table_change.changes:
+        change_alg, change_rebuild = change_algorithm(change, validate_foreign_keys)
+        if ALGORITHM_RANK[change_alg] > ALGORITHM_RANK[algorithm]:
+            algorithm = change_alg
+        rebuild = rebuild or change_rebuild
+
+    stats = target.stats
+    indexes = len([index for index in (source or target).indexes.values() if not index.is_primary])
+    added_indexes = len([change for change in table_change.changes
+                         if isinstance(change, plan.IndexChange) and change.action == 'add'])
+    if algorithm == 'COPY':
+        seconds = stats.total_length / COPY_THROUGHPUT * (1 + INDEX_REBUILD_FACTOR * indexes)
+        if shadow_copy:
+            algorithm = 'SHADOW'
+            seconds *= SHADOW_FACTOR
+    elif rebuild:
+        seconds = stats.total_length / REBUILD_THROUGHPUT * (1 + INDEX_REBUILD_FACTOR * indexes)
+    else:
+        # без перестроения время уходит только на построение новых индексов: чтение таблицы на каждый индекс
+        seconds = stats.data_length / INDEX_BUILD_THROUGHPUT * added_indexes
+    #
+    return OperationEstimate(table=table_change.table, operation=operation, algorithm=algorithm,
+                             seconds=seconds + METADATA_SECONDS, size=stats.total_length, indexes=indexes,
+                             rebuild=rebuild)
+
+
+def estimate_plan(migration: plan.MigrationPlan, source: SchemaSnapshot, target: SchemaSnapshot,
+                  validate_foreign_keys: bool = True, shadow_copy: bool = False) -> List[OperationEstimate]:
+    """
+    Оценка стоимости всех операций плана миграции
+    :param migration: план миграции
+    :param source: структура БД-образца (тестовой)
+    :param target: структура целевой БД (боевой), со статистикой таблиц
+    :param validate_foreign_keys: проверяются ли существующие строки при добавлении внешних ключей
+    :param shadow_copy: разрешена ли миграция через теневую таблицу вместо блокирующего копирования
+    :return: список оценок операций
+    """
+    estimates = [OperationEstimate(table=table, operation='create', algorithm='INSTANT', seconds=METADATA_SECONDS)
+                 for table in migration.added_tables]
+    for table in migration.dropped_tables:
+        size = target.tables[table].stats.total_length
+        estimates.append(OperationEstimate(table=table, operation='drop', algorithm='INSTANT',
+                                           seconds=METADATA_SECONDS, size=size))
+    for operation, changes in (('fk_drop', migration.foreign_key_drops),
+                               ('alter', migration.table_changes),
+                               ('fk_add', migration.foreign_key_adds)):
+        for table, table_change in changes.items():
+            if not table_change.changes:
+                continue
+            # новая таблица (внешние ключи добавляются после ее создания) в целевой БД еще пуста
+            target_table = target.tables.get(table) or TableInfo(name=table)
+            estimates.append(estimate_table_change(table_change, target_table, source.tables.get(table),
+                                                   operation=operation, validate_foreign_keys=validate_foreign_keys,
+                                                   shadow_copy=shadow_copy and operation == 'alter'))
+    #
+    return estimates
+
+
+def order_tables(tables: List[str], costs: Dict[str, OperationEstimate]) -> List[str]:
+    """
+    Порядок последовательной обработки: сначала мгновенные изменения, затем по возрастанию стоимости
+    """
+    def key(table):
+        estimate = costs.get(table)
+        if estimate is None:
+            return -1, 0.0
+        return ALGORITHM_RANK[estimate.algorithm], estimate.seconds
+    return sorted(tables, key=key)
+
+
+def schedule_groups(groups: List[List[str]], costs: Dict[str, OperationEstimate], workers: int):
+    """
+    Распределение групп таблиц по соединениям: мгновенные группы - в начало очередей,
+    остальные - от самой дорогой к самой дешевой на наименее загруженное соединение (LPT),
+    чтобы крупные копирования не оказались в одной очереди
+    :param groups: группы связанных таблиц (обрабатываются целиком одним соединением)
+    :param costs: оценки операций {таблица: оценка}
+    :param workers: число соединений
+    :return: кортеж (очереди таблиц по соединениям, оценка общего времени)
+    """
+    def group_cost(group):
+        return sum(costs[table].seconds for table in group if table in costs)
+
+    def is_instant(group):
+        return all(costs[table].is_instant for table in group if table in costs)
+
+    lanes = [[] for _ in range(max(workers, 1))]
+    loads = [0.0] * len(lanes)
+    instant = [group for group in groups if is_instant(group)]
+    heavy = sorted((group for group in groups if not is_instant(group)), key=group_cost, reverse=True)
+    for group in instant + heavy:
+        lane = loads.index(min(loads))
+        lanes[lane].extend(group)
+        loads[lane] += group_cost(group)
+    #
+    return [lane for lane in lanes if lane], max(loads)
+
+
+def describe_estimates(estimates: List[OperationEstimate]) -> List[str]:
+    """
+    Текстовый отчет по оценкам: операции от самых дорогих и итог по классам алгоритмов
+    :param estimates: оценки операций
+    :return: строки отчета
+    """
+    lines = [' '*4 + estimate.describe() for estimate in sorted(estimates, key=lambda e: e.seconds, reverse=True)
+             if not (estimate.is_instant and estimate.operation in ('create', 'drop'))]
+    totals = {}
+    for estimate in estimates:
+        totals[estimate.algorithm] = totals.get(estimate.algorithm, 0) + 1
+    summary = ', '.join(f'{algorithm}: {count}' for algorithm, count in sorted(totals.items()))
+    lines.append(f'Операций: {len(estimates)} ({summary}), '
+                 f'суммарное время: ~{sum(estimate.seconds for estimate in estimates):.1f} с')
+    #
+    return lines
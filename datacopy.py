@@ -0,0 +1,141 @@
+import time
+from typing import Callable, Iterator, List, Optional
+
+import loader
+from schema import quote_name
+
+
+# Признак генерируемого столбца в поле Extra (DEFAULT_GENERATED - обычный столбец с выражением по умолчанию)
+GENERATED_EXTRA = ('VIRTUAL GENERATED', 'STORED GENERATED')
+
+
+class TableDataCopy:
+    """
+    Перенос строк таблицы между серверами порциями по первичному ключу (keyset pagination).
+    Каждая порция - отдельный короткий запрос на чтение, результат читается небуферизованным курсором
+    частями по batch_size строк, транзакция источника завершается после каждой порции - долгих
+    блокировок и "длинных" снимков на источнике нет. Прерванный перенос продолжается с последнего
+    ключа, уже записанного в целевую таблицу
+    """
+    def __init__(self, source_db, target_db, table: str, chunk_size: int = 1000, batch_size: int = 500,
+                 chunk_sleep: float = 0.0, load_throttle=None, checkpoint: Callable = None):
+        """
+        :param source_db: БД-донор (экземпляр класса менеджера)
+        :param target_db: БД-получатель (экземпляр класса менеджера)
+        :param table: имя таблицы (в обеих БД одинаковой структуры)
+        :param chunk_size: число строк в одном запросе к источнику
+        :param batch_size: число строк в одном INSERT
+        :param chunk_sleep: пауза между порциями в секундах
+        :param load_throttle: ограничитель нагрузки (throttle.Throttle) - проверяется перед каждой порцией
+        :param checkpoint: функция записи контрольной точки checkpoint(last_key) - вызывается после
+            каждой прочитанной порции (журнал миграции)
+        """
+        self.source_db = source_db
+        self.target_db = target_db
+        self.table = table
+        self.chunk_size = chunk_size
+        self.batch_size = batch_size
+        self.chunk_sleep = chunk_sleep
+        self.throttle = load_throttle
+        self.checkpoint = checkpoint
+        #
+        self.key = self._primary_key()
+        self.columns = self._columns()
+        self.last_key = None
+        self.copied_rows = 0
+        self.copied_chunks = 0
+
+    def _primary_key(self) -> List[str]:
+        """ Столбцы первичного ключа (из кэша определений источника - таблица уже читалась при ее создании) """
+        return self.source_db.get_definition(self.table).primary_key
+
+    def _columns(self) -> List[str]:
+        """ Столбцы для переноса: генерируемые столбцы вычисляются сервером и не записываются """
+        columns = self.source_db.get_definition(self.table).columns.values()
+        return [column.name for column in columns
+                if not any(extra in column.extra.upper() for extra in GENERATED_EXTRA)]
+
+    def resume_key(self) -> Optional[tuple]:
+        """
+        Ключ последней строки, уже записанной в целевую таблицу (строки пишутся по возрастанию ключа)
+        :return: кортеж значений ключа или None, если целевая таблица пуста
+        """
+        key_list = ', '.join(quote_name(c) for c in self.key)
+        order = ', '.join(f'{quote_name(c)} DESC' for c in self.key)
+        cursor = self.target_db.new_cursor()
+        cursor.execute(f'SELECT {key_list} FROM {quote_name(self.table)} ORDER BY {order} LIMIT 1')
+        row = cursor.fetchone()
+        cursor.close()
+        return tuple(row) if row else None
+
+    def rows(self) -> Iterator[tuple]:
+        """
+        Поток строк источника по возрастанию первичного ключа, начиная после last_key
+        """
+        column_list = ', '.join(quote_name(c) for c in self.columns)
+        key_list = ', '.join(quote_name(c) for c in self.key)
+        key_positions = [self.columns.index(c) for c in self.key]
+        while True:
+            query = f'SELECT {column_list} FROM {quote_name(self.table)}'
+            params = []
+            if self.last_key is not None:
+                query += f' WHERE ({key_list}) > ({", ".join(["%s"] * len(self.key))})'
+                params.extend(self.last_key)
+            query += f' ORDER BY {key_list} LIMIT {self.chunk_size}'
+
+            if self.throttle is not None:
+                self.throttle.wait()
+            cursor = self.source_db.new_cursor()
+            cursor.execute(query, params)
+            fetched = 0
+            while True:
+                batch = cursor.fetchmany(self.batch_size)
+                if not batch:
+                    break
+                for row in batch:
+                    self.last_key = tuple(row[i] for i in key_positions)
+                    yield row
+                fetched += len(batch)
+            cursor.close()
+            # завершение транзакции чтения: снимок данных источника не живет дольше одной порции
+            self.source_db.connection.commit()
+            self.copied_chunks += 1
+            if self.checkpoint is not None:
+                # ключ в журнале может опережать записанные строки (фиксация идет порциями загрузчика),
+                # поэтому продолжение переноса берет ключ из целевой таблицы (resume_key)
+                self.checkpoint(self.last_key)
+            if fetched < self.chunk_size:
+                return
+            if self.chunk_sleep:
+                time.sleep(self.chunk_sleep)
+
+    def _all_rows(self) -> Iterator[tuple]:
+        """ Поток всех строк таблицы без первичного ключа (одним запросом, без возможности продолжения) """
+        if self.throttle is not None:
+            self.throttle.wait()
+        cursor = self.source_db.new_cursor()
+        cursor.execute(f"SELECT {', '.join(quote_name(c) for c in self.columns)} FROM {quote_name(self.table)}")
+        while True:
+            batch = cursor.fetchmany(self.batch_size)
+            if not batch:
+                break
+            yield from batch
+        cursor.close()
+        self.source_db.connection.commit()
+
+    def run(self, resume: bool = False) -> int:
+        """
+        Перенос строк
+        :param resume: продолжить с последнего ключа целевой таблицы (иначе целевая таблица должна быть пуста)
+        :return: число перенесенных строк
+        """
+        if self.key:
+            if resume:
+                self.last_key = self.resume_key()
+            rows = self.rows()
+        else:
+            rows = self._all_rows()
+        bulk_loader = loader.BulkLoader(self.target_db, batch_size=self.batch_size, commit_every=self.batch_size)
+        self.copied_rows = bulk_loader.load(self.table, self.columns, rows)
+        #
+        return self.copied_rows
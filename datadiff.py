@@ -0,0 +1,188 @@
+from dataclasses import dataclass, field
+from typing import List, Optional
+
+from schema import SchemaSnapshot, TableInfo, quote_name
+
+
+@dataclass
+class TableDataDiff:
+    """
+    Результат сравнения данных одной таблицы: ключи строк, которых нет в целевой таблице,
+    лишних в ней и отличающихся по содержимому
+    """
+    table: str
+    missing: List[tuple] = field(default_factory=list)
+    extra: List[tuple] = field(default_factory=list)
+    changed: List[tuple] = field(default_factory=list)
+    chunks: int = 0
+    queries: int = 0
+    rows_fetched: int = 0
+    skipped: str = ''
+
+    @property
+    def is_equal(self) -> bool:
+        return not (self.missing or self.extra or self.changed or self.skipped)
+
+    def describe(self, limit: int = 10) -> List[str]:
+        if self.skipped:
+            return [f'{self.table}: не сравнивалась - {self.skipped}']
+        lines = [f'{self.table}: {"совпадает" if self.is_equal else "ОТЛИЧАЕТСЯ"} '
+                 f'(порций {self.chunks}, запросов {self.queries}, строк получено {self.rows_fetched})']
+        for title, keys in (('нет в целевой', self.missing), ('лишние в целевой', self.extra),
+                            ('отличаются', self.changed)):
+            if keys:
+                lines.append(' '*4 + f'{title}: {len(keys)} {keys[:limit]}{" ..." if len(keys) > limit else ""}')
+        #
+        return lines
+
+
+class DataDiff:
+    """
+    Сравнение данных таблиц двух БД без передачи строк на клиент: таблица делится на диапазоны
+    первичного ключа, для каждого диапазона сервер считает число строк и BIT_XOR(CRC32(строка)).
+    Диапазоны с разными контрольными суммами рекурсивно делятся пополам, пока в них не останется
+    не более leaf_size строк - только для таких диапазонов на клиент передаются ключи и суммы строк.
+    Объем передаваемых данных пропорционален числу различий, а не размеру таблицы
+    """
+    def __init__(self, source_db, target_db, chunk_size: int = 1000, leaf_size: int = 16):
+        """
+        :param source_db: БД-образец (экземпляр класса менеджера)
+        :param target_db: сравниваемая БД (экземпляр класса менеджера)
+        :param chunk_size: число строк в диапазоне верхнего уровня
+        :param leaf_size: число строк, начиная с которого различия ищутся построчно
+        """
+        self.source_db = source_db
+        self.target_db = target_db
+        self.chunk_size = chunk_size
+        self.leaf_size = leaf_size
+        #
+        self.table = None
+        self.result = None
+        self.key = []
+        self.columns = []
+
+    def _query(self, db, query: str, params: list) -> list:
+        cursor = db.new_cursor()
+        cursor.execute(query, params)
+        rows = cursor.fetchall()
+        cursor.close()
+        # короткие транзакции чтения: снимок данных не удерживается между запросами
+        db.connection.commit()
+        self.result.queries += 1
+        return rows
+
+    def _key_list(self) -> str:
+        return ', '.join(quote_name(c) for c in self.key)
+
+    def _row_checksum(self) -> str:
+        """ Выражение контрольной суммы строки; NULL учитывается отдельно, т.к. CONCAT_WS его пропускает """
+        values = ', '.join(quote_name(c) for c in self.columns)
+        nulls = ', '.join(f'ISNULL({quote_name(c)})' for c in self.columns)
+        return f"CRC32(CONCAT_WS('#', {values}, CONCAT({nulls})))"
+
+    def _where(self, lower: Optional[tuple], upper: Optional[tuple]):
+        """ Условие диапазона ключа (lower, upper]; None - без ограничения с этой стороны """
+        placeholders = ', '.join(['%s'] * len(self.key))
+        conditions, params = [], []
+        if lower is not None:
+            conditions.append(f'({self._key_list()}) > ({placeholders})')
+            params.extend(lower)
+        if upper is not None:
+            conditions.append(f'({self._key_list()}) <= ({placeholders})')
+            params.extend(upper)
+        return (f" WHERE {' AND '.join(conditions)}" if conditions else ''), params
+
+    def _checksum(self, db, lower, upper) -> tuple:
+        where, params = self._where(lower, upper)
+        query = (f'SELECT COUNT(*), COALESCE(BIT_XOR({self._row_checksum()}), 0) '
+                 f'FROM {quote_name(self.table)}{where}')
+        count, checksum = self._query(db, query, params)[0]
+        return int(count), int(checksum)
+
+    def _bound(self, db, lower, upper, offset: int) -> Optional[tuple]:
+        """ Ключ строки с номером offset (от 0) в диапазоне (lower, upper] """
+        where, params = self._where(lower, upper)
+        rows = self._query(db, f'SELECT {self._key_list()} FROM {quote_name(self.table)}{where} '
+                               f'ORDER BY {self._key_list()} LIMIT 1 OFFSET {offset}', params)
+        return tuple(rows[0]) if rows else None
+
+    def _row_checksums(self, db, lower, upper) -> dict:
+        where, params = self._where(lower, upper)
+        rows = self._query(db, f'SELECT {self._key_list()}, {self._row_checksum()} '
+                               f'FROM {quote_name(self.table)}{where}', params)
+        self.result.rows_fetched += len(rows)
+        return {tuple(row[:-1]): row[-1] for row in rows}
+
+    def _compare_rows(self, lower, upper):
+        source = self._row_checksums(self.source_db, lower, upper)
+        target = self._row_checksums(self.target_db, lower, upper)
+        self.result.missing.extend(sorted(key for key in source if key not in target))
+        self.result.extra.extend(sorted(key for key in target if key not in source))
+        self.result.changed.extend(sorted(key for key in source if key in target and source[key] != target[key]))
+
+    def _compare_range(self, lower, upper):
+        """ Рекурсивное сравнение диапазона (lower, upper] """
+        source_count, source_checksum = self._checksum(self.source_db, lower, upper)
+        target_count, target_checksum = self._checksum(self.target_db, lower, upper)
+        if (source_count, source_checksum) == (target_count, target_checksum):
+            return
+        count = max(source_count, target_count)
+        if count <= self.leaf_size:
+            self._compare_rows(lower, upper)
+            return
+        # середина берется по стороне, где строк больше
+        db = self.source_db if source_count >= target_count else self.target_db
+        middle = self._bound(db, lower, upper, count // 2 - 1)
+        if middle is None or middle == upper:
+            self._compare_rows(lower, upper)
+            return
+        self._compare_range(lower, middle)
+        self._compare_range(middle, upper)
+
+    def diff_table(self, source: TableInfo, target: TableInfo) -> TableDataDiff:
+        """
+        Сравнение данных таблицы
+        :param source: описание таблицы в БД-образце
+        :param target: описание таблицы в сравниваемой БД
+        :return: результат сравнения
+        """
+        self.table = source.name
+        self.result = TableDataDiff(table=source.name)
+        self.key = source.primary_key
+        if not self.key:
+            self.result.skipped = 'нет первичного ключа'
+            return self.result
+        if self.key != target.primary_key:
+            self.result.skipped = 'первичные ключи различаются'
+            return self.result
+        # сравниваются только общие столбцы: различия структуры - дело сравнения схем
+        self.columns = [c for c in source.columns if c in target.columns]
+
+        lower = None
+        while True:
+            upper = self._bound(self.source_db, lower, None, self.chunk_size - 1)
+            self._compare_range(lower, upper)
+            self.result.chunks += 1
+            if upper is None:
+                break
+            lower = upper
+        #
+        return self.result
+
+    def diff(self, source: SchemaSnapshot, target: SchemaSnapshot, tables: List[str] = None) -> List[TableDataDiff]:
+        """
+        Сравнение данных общих таблиц двух БД
+        :param source: структура БД-образца
+        :param target: структура сравниваемой БД
+        :param tables: сравнить только эти таблицы (по умолчанию - все общие)
+        :return: результаты по таблицам
+        """
+        names = tables or sorted(set(source.tables) & set(target.tables))
+        results = []
+        for name in names:
+            if name not in source.tables or name not in target.tables:
+                results.append(TableDataDiff(table=name, skipped='таблица есть не в обеих БД'))
+                continue
+            results.append(self.diff_table(source.tables[name], target.tables[name]))
+        #
+        return results
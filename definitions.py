@@ -0,0 +1,156 @@
+import re
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional
+
+from column_def import parse_column_definition
+from schema import ColumnInfo
+
+
+# Строки определений индексов и ограничений в SHOW CREATE TABLE
+INDEX_RE = re.compile(r'^(?:(?:UNIQUE|FULLTEXT|SPATIAL)\s+)?KEY\s+`((?:[^`]|``)*)`', re.I)
+CONSTRAINT_RE = re.compile(r'^CONSTRAINT\s+`((?:[^`]|``)*)`', re.I)
+QUOTED_NAME_RE = re.compile(r'`((?:[^`]|``)*)`')
+
+# Запросы, меняющие структуру таблиц: имя таблицы (возможно, с именем БД) после ALTER/CREATE/DROP/RENAME TABLE
+NAME = r'(?:`(?:[^`]|``)+`|\w+)'
+TABLE_NAME_RE = re.compile(rf'\s*(?:{NAME}\s*\.\s*)?({NAME})')
+DDL_RE = re.compile(r'^\s*(ALTER|CREATE|DROP|RENAME)\s+TABLE\s+(?:IF\s+(?:NOT\s+)?EXISTS\s+)?(.*)$', re.I | re.S)
+ALTER_RENAME_RE = re.compile(rf'\bRENAME\s+(?:TO|AS)\s+((?:{NAME}\s*\.\s*)?{NAME})', re.I)
+
+
+@dataclass
+class TableDefinition:
+    """
+    Разобранный текст SHOW CREATE TABLE: определения столбцов, индексов и ограничений по именам
+    """
+    name: str
+    ddl: str
+    columns: Dict[str, ColumnInfo] = field(default_factory=dict)
+    # определения в том виде, в котором их выводит сервер (без завершающей запятой)
+    column_sql: Dict[str, str] = field(default_factory=dict)
+    indexes: Dict[str, str] = field(default_factory=dict)
+    constraints: Dict[str, str] = field(default_factory=dict)
+
+    @property
+    def primary_key(self) -> List[str]:
+        """ Столбцы первичного ключа (пустой список, если ключа нет) """
+        line = self.indexes.get('PRIMARY')
+        return [name.replace('``', '`') for name in QUOTED_NAME_RE.findall(line)] if line else []
+
+
+def parse_table_definition(name: str, ddl: str) -> TableDefinition:
+    """
+    Разбор текста CREATE TABLE, выведенного SHOW CREATE TABLE (одно определение на строку)
+    :param name: имя таблицы
+    :param ddl: текст CREATE TABLE
+    :return: датакласс с определениями столбцов, индексов и ограничений
+    """
+    definition = TableDefinition(name=name, ddl=ddl)
+    # первая строка - CREATE TABLE `name` (, последняя - ) ENGINE=...
+    for line in ddl.split('\n')[1:-1]:
+        line = line.strip().rstrip(',')
+        if line.startswith('`'):
+            column = parse_column_definition(line, position=len(definition.columns) + 1)
+            definition.columns[column.name] = column
+            definition.column_sql[column.name] = line
+        elif line.upper().startswith('PRIMARY KEY'):
+            definition.indexes['PRIMARY'] = line
+        elif INDEX_RE.match(line):
+            definition.indexes[INDEX_RE.match(line).group(1).replace('``', '`')] = line
+        elif CONSTRAINT_RE.match(line):
+            definition.constraints[CONSTRAINT_RE.match(line).group(1).replace('``', '`')] = line
+    #
+    return definition
+
+
+def strip_foreign_keys(ddl: str) -> str:
+    """
+    Текст CREATE TABLE без внешних ключей (остальные ограничения, например CHECK, сохраняются)
+    :param ddl: текст CREATE TABLE, выведенный SHOW CREATE TABLE
+    :return: текст CREATE TABLE
+    """
+    lines = ddl.split('\n')
+    body = [line.rstrip().rstrip(',') for line in lines[1:-1]
+            if not (CONSTRAINT_RE.match(line.strip()) and 'FOREIGN KEY' in line.upper())]
+    #
+    return '\n'.join([lines[0], ',\n'.join(body), lines[-1]])
+
+
+def _table_name(text: str) -> Optional[str]:
+    """ Имя таблицы в начале фрагмента запроса (без имени БД и кавычек) """
+    match = TABLE_NAME_RE.match(text)
+    if not match:
+        return None
+    name = match.group(1)
+    return name[1:-1].replace('``', '`') if name.startswith('`') else name
+
+
+def ddl_tables(query: str) -> List[str]:
+    """
+    Таблицы, структуру которых меняет запрос (ALTER, CREATE, DROP, RENAME TABLE)
+    :param query: текст SQL-запроса
+    :return: имена таблиц (пустой список - запрос структуру таблиц не меняет)
+    """
+    match = DDL_RE.match(query)
+    if not match:
+        return []
+    kind, rest = match.group(1).upper(), match.group(2)
+    if kind == 'DROP':
+        names = [_table_name(part) for part in rest.split(',')]
+    elif kind == 'RENAME':
+        names = [_table_name(name) for pair in rest.split(',') for name in re.split(r'\s+TO\s+', pair, flags=re.I)]
+    else:
+        names = [_table_name(rest)]
+        if kind == 'ALTER':
+            # ALTER TABLE a RENAME TO b: устаревает и запись новой таблицы
+            names.extend(_table_name(name) for name in ALTER_RENAME_RE.findall(rest))
+    #
+    return [name for name in names if name]
+
+
+class DefinitionCache:
+    """
+    Кэш разобранных определений таблиц одного соединения: SHOW CREATE TABLE выполняется один раз на таблицу,
+    дальше определения столбцов, индексов и ограничений берутся из словарей. Менеджер сбрасывает запись
+    таблицы при каждом изменении ее структуры
+    """
+    def __init__(self):
+        self.tables: Dict[str, TableDefinition] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, table: str, load: Callable[[str], str]) -> TableDefinition:
+        """
+        Определение таблицы из кэша или с сервера
+        :param table: имя таблицы
+        :param load: функция получения текста CREATE TABLE по имени таблицы (вызывается только при промахе)
+        :return: разобранное определение таблицы
+        """
+        definition = self.tables.get(table)
+        if definition is not None:
+            self.hits += 1
+            return definition
+        self.misses += 1
+        definition = self.tables[table] = parse_table_definition(table, load(table))
+        #
+        return definition
+
+    def invalidate(self, table: Optional[str] = None):
+        """ Сброс определения таблицы (по умолчанию - всех таблиц) """
+        if table is None:
+            self.tables = {}
+        else:
+            self.tables.pop(table, None)
+
+    def invalidate_statement(self, query: str):
+        """ Сброс определений таблиц, структуру которых меняет запрос (см. ddl_tables) """
+        for table in ddl_tables(query):
+            self.invalidate(table)
+
+    @property
+    def hit_ratio(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def describe(self) -> str:
+        return f'попаданий {self.hits}, промахов {self.misses}, доля попаданий {self.hit_ratio:.0%}'
@@ -0,0 +1,95 @@
+from typing import Dict, Iterable, List, Set
+
+from schema import SchemaSnapshot
+
+
+def get_dependencies(snapshot: SchemaSnapshot, exclude: Dict[str, Set[str]] = None) -> Dict[str, Set[str]]:
+    """
+    Граф зависимостей таблиц по внешним ключам
+    :param snapshot: структура БД
+    :param exclude: внешние ключи, которые не учитываются (например, уже удаленные) {таблица: имена ключей}
+    :return: словарь {таблица: множество таблиц, на которые она ссылается} (ссылки на себя не учитываются)
+    """
+    exclude = exclude or {}
+    return {
+        name: {fk.ref_table for fk in table.foreign_keys.values()
+               if fk.ref_table != name and fk.name not in exclude.get(name, set())}
+        for name, table in snapshot.tables.items()
+    }
+
+
+def creation_order(tables: Iterable[str], dependencies: Dict[str, Set[str]]):
+    """
+    Топологический порядок создания таблиц: сначала те, на которые ссылаются
+    :param tables: создаваемые таблицы
+    :param dependencies: граф зависимостей (см. get_dependencies)
+    :return: кортеж (упорядоченный список, список таблиц с циклическими ссылками)
+    """
+    tables = set(tables)
+    pending = {table: dependencies.get(table, set()) & tables for table in tables}
+    ordered = []
+    while True:
+        ready = sorted(table for table, refs in pending.items() if not refs)
+        if not ready:
+            break
+        ordered.extend(ready)
+        for table in ready:
+            pending.pop(table)
+        for refs in pending.values():
+            refs.difference_update(ready)
+    #
+    return ordered, sorted(pending)
+
+
+def drop_batches(tables: Iterable[str], dependencies: Dict[str, Set[str]]) -> List[List[str]]:
+    """
+    Разбиение удаляемых таблиц на пакеты для DROP TABLE a, b, c: в каждый пакет попадают таблицы,
+    на которые не ссылается ни одна из еще не удаленных таблиц. Таблицы с циклическими ссылками
+    удаляются последним общим пакетом - в одном запросе MySQL допускает взаимные ссылки
+    :param tables: удаляемые таблицы
+    :param dependencies: граф зависимостей (см. get_dependencies)
+    :return: список пакетов в порядке удаления
+    """
+    tables = set(tables)
+    referenced_by = {table: set() for table in tables}
+    for table in tables:
+        for ref in dependencies.get(table, set()) & tables:
+            referenced_by[ref].add(table)
+
+    batches = []
+    while referenced_by:
+        batch = sorted(table for table, children in referenced_by.items() if not children)
+        if not batch:
+            batches.append(sorted(referenced_by))
+            break
+        batches.append(batch)
+        for table in batch:
+            referenced_by.pop(table)
+        for children in referenced_by.values():
+            children.difference_update(batch)
+    #
+    return batches
+
+
+def blocked_drops(tables: Iterable[str], dependencies: Dict[str, Set[str]]) -> Dict[str, List[str]]:
+    """
+    Поиск удаляемых таблиц, на которые ссылаются остающиеся таблицы (удалить их нельзя).
+    Оставленная таблица в свою очередь блокирует удаление таблиц, на которые ссылается она сама
+    :param tables: удаляемые таблицы
+    :param dependencies: граф зависимостей (см. get_dependencies)
+    :return: словарь {таблица: список остающихся таблиц, которые на нее ссылаются}
+    """
+    droppable = set(tables)
+    blocked = {}
+    changed = True
+    while changed:
+        changed = False
+        for table, refs in dependencies.items():
+            if table in droppable:
+                continue
+            for ref in refs & droppable:
+                blocked.setdefault(ref, []).append(table)
+                droppable.discard(ref)
+                changed = True
+    #
+    return {table: sorted(children) for table, children in blocked.items()}
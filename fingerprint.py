@@ -0,0 +1,129 @@
+import hashlib
+import json
+import os
+from typing import Dict, List, Optional
+
+from schema import TableInfo, as_text
+
+
+# Отпечатки считаются на стороне сервера: по каждой таблице возвращается одна строка с MD5 от склеенного
+# нормализованного описания столбцов / индексов / внешних ключей, сами описания по сети не передаются
+FINGERPRINT_QUERIES = {
+    'tables': """
+        SELECT TABLE_NAME, CONCAT_WS('|', IFNULL(ENGINE, ''), IFNULL(TABLE_COLLATION, ''))
+        FROM information_schema.TABLES
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_TYPE = 'BASE TABLE' {table_filter}
+    """,
+    'columns': """
+        SELECT TABLE_NAME, MD5(GROUP_CONCAT(
+            CONCAT_WS('|', COLUMN_NAME, ORDINAL_POSITION, COLUMN_TYPE, IS_NULLABLE, IFNULL(COLUMN_DEFAULT, '\\\\N'),
+                      EXTRA, IFNULL(COLLATION_NAME, ''), COLUMN_COMMENT, IFNULL(GENERATION_EXPRESSION, ''))
+            ORDER BY ORDINAL_POSITION SEPARATOR '\\n'))
+        FROM information_schema.COLUMNS
+        WHERE TABLE_SCHEMA = DATABASE() {table_filter}
+        GROUP BY TABLE_NAME
+    """,
+    'indexes': """
+        SELECT TABLE_NAME, MD5(GROUP_CONCAT(
+            CONCAT_WS('|', INDEX_NAME, NON_UNIQUE, SEQ_IN_INDEX, IFNULL(COLUMN_NAME, ''), IFNULL(SUB_PART, ''),
+                      INDEX_TYPE, IFNULL(COLLATION, ''))
+            ORDER BY INDEX_NAME, SEQ_IN_INDEX SEPARATOR '\\n'))
+        FROM information_schema.STATISTICS
+        WHERE TABLE_SCHEMA = DATABASE() {table_filter}
+        GROUP BY TABLE_NAME
+    """,
+    'foreign_keys': """
+        SELECT k.TABLE_NAME, MD5(GROUP_CONCAT(
+            CONCAT_WS('|', k.CONSTRAINT_NAME, k.COLUMN_NAME, k.REFERENCED_TABLE_NAME, k.REFERENCED_COLUMN_NAME,
+                      r.UPDATE_RULE, r.DELETE_RULE)
+            ORDER BY k.CONSTRAINT_NAME, k.ORDINAL_POSITION SEPARATOR '\\n'))
+        FROM information_schema.KEY_COLUMN_USAGE k
+        JOIN information_schema.REFERENTIAL_CONSTRAINTS r
+            ON r.CONSTRAINT_SCHEMA = k.CONSTRAINT_SCHEMA
+            AND r.CONSTRAINT_NAME = k.CONSTRAINT_NAME
+            AND r.TABLE_NAME = k.TABLE_NAME
+        WHERE k.TABLE_SCHEMA = DATABASE() AND k.REFERENCED_TABLE_NAME IS NOT NULL {table_filter}
+        GROUP BY k.TABLE_NAME
+    """,
+}
+
+# Длина GROUP_CONCAT по умолчанию (1024) мала для широких таблиц - результат обрезался бы молча
+GROUP_CONCAT_MAX_LEN = 16 * 1024 * 1024
+
+
+def load_fingerprints(cursor, tables: Optional[List[str]] = None) -> Dict[str, str]:
+    """
+    Получение отпечатков всех таблиц БД за несколько запросов
+    :param cursor: курсор подключения к БД
+    :param tables: получить отпечатки только этих таблиц (по умолчанию - всех)
+    :return: словарь {таблица: отпечаток}; у одинаковых по структуре таблиц разных БД отпечатки совпадают
+    """
+    if tables is not None and not tables:
+        return {}
+    cursor.execute(f'SET SESSION group_concat_max_len = {GROUP_CONCAT_MAX_LEN}')
+    parts = {}
+    for key, query in FINGERPRINT_QUERIES.items():
+        table_filter, params = '', []
+        if tables is not None:
+            column = 'k.TABLE_NAME' if key == 'foreign_keys' else 'TABLE_NAME'
+            table_filter = f"AND {column} IN ({', '.join(['%s'] * len(tables))})"
+            params = list(tables)
+        cursor.execute(query.format(table_filter=table_filter), params)
+        for table_name, digest in cursor.fetchall():
+            parts.setdefault(as_text(table_name), {})[key] = as_text(digest) or ''
+
+    fingerprints = {}
+    for table_name, table_parts in parts.items():
+        if 'tables' not in table_parts:
+            # представления (VIEW) не интересуют
+            continue
+        payload = '\n'.join([table_name] + [table_parts.get(key, '') for key in FINGERPRINT_QUERIES])
+        fingerprints[table_name] = hashlib.sha1(payload.encode()).hexdigest()
+    #
+    return fingerprints
+
+
+class FingerprintCache:
+    """
+    Локальный кэш описаний таблиц между запусками: описание хранится по отпечатку структуры,
+    поэтому таблица с неизменившимся отпечатком не перечитывается с сервера ни в тестовой, ни в боевой БД
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self.tables = {}
+        self.used = set()
+        #
+        if os.path.exists(path):
+            with open(path, mode='r', encoding='utf-8') as f:
+                self.tables = json.load(f)
+
+    def get(self, fingerprint: str):
+        """
+        Описание таблицы по отпечатку
+        :return: датакласс с описанием таблицы или None, если в кэше его нет
+        """
+        data = self.tables.get(fingerprint)
+        if data is None:
+            return None
+        self.used.add(fingerprint)
+        return TableInfo.from_dict(data)
+
+    def put(self, fingerprint: str, table: TableInfo):
+        data = table.to_dict(stats=False)
+        self.tables[fingerprint] = data
+        self.used.add(fingerprint)
+
+    def keep(self, fingerprint: str):
+        """ Отметка описания как актуального (чтобы оно пережило очистку кэша при сохранении) """
+        if fingerprint in self.tables:
+            self.used.add(fingerprint)
+
+    def missing(self, fingerprints: Dict[str, str], tables: List[str]) -> List[str]:
+        """ Таблицы из списка, описаний которых нет в кэше """
+        return [table for table in tables if fingerprints[table] not in self.tables]
+
+    def save(self):
+        """ Сохранение кэша; описания, не использованные в текущем запуске, отбрасываются """
+        tables = {fp: data for fp, data in self.tables.items() if fp in self.used}
+        with open(self.path, mode='w', encoding='utf-8') as f:
+            json.dump(tables, f, ensure_ascii=False, separators=(',', ':'))
@@ -0,0 +1,201 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Dict, List, Optional
+
+from schema import SchemaSnapshot, TableInfo
+
+
+# Версия формата журнала: журнал другого формата не продолжается
+JOURNAL_FORMAT = 1
+
+
+def snapshot_to_dict(snapshot: SchemaSnapshot) -> dict:
+    """ Структура БД в словарь, в том числе загруженная частично (инкрементальный режим) """
+    return {
+        'database': snapshot.database,
+        'partial': list(snapshot.partial),
+        'tables': {name: table.to_dict() for name, table in snapshot.tables.items()},
+    }
+
+
+def snapshot_from_dict(data: dict) -> SchemaSnapshot:
+    return SchemaSnapshot(
+        database=data['database'],
+        tables={name: TableInfo.from_dict(table) for name, table in data['tables'].items()},
+        partial=list(data['partial']),
+    )
+
+
+def snapshot_digest(snapshot: SchemaSnapshot) -> str:
+    """ Отпечаток структуры БД целиком (для снимка структуры вместо живой тестовой БД) """
+    payload = json.dumps(snapshot_to_dict(snapshot), ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha1(payload.encode()).hexdigest()
+
+
+class MigrationJournal:
+    """
+    Журнал миграции в локальном файле (JSON Lines, только дозапись): первая строка - план с исходными
+    данными (структуры обеих БД и отпечатки таблиц на момент построения плана), далее контрольные точки:
+    начало операции, ключ последней перенесенной порции, завершение операции с отпечатками затронутых таблиц.
+    Прерванный запуск продолжается по журналу: выполненные операции пропускаются, структура заново не загружается
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self.header = None
+        self.started: Dict[str, List[str]] = {}
+        self.progress: Dict[str, dict] = {}
+        self.done: Dict[str, dict] = {}
+        self.lock = threading.Lock()
+        self.file = None
+
+    @classmethod
+    def create(cls, path: str, source: SchemaSnapshot, target: SchemaSnapshot, source_state: dict,
+               target_fingerprints: Dict[str, str], plan_lines: List[str]) -> 'MigrationJournal':
+        """
+        Новый журнал (существующий файл перезаписывается)
+        :param path: путь к файлу журнала
+        :param source: структура тестовой БД
+        :param target: структура боевой БД
+        :param source_state: отпечатки таблиц тестовой БД (или отпечаток снимка ее структуры)
+        :param target_fingerprints: отпечатки таблиц боевой БД
+        :param plan_lines: описание плана миграции (для разработчика)
+        :return: журнал
+        """
+        journal = cls(path)
+        journal.header = {
+            'type': 'plan', 'format': JOURNAL_FORMAT, 'created': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'source_state': source_state, 'target_fingerprints': target_fingerprints,
+            'source': snapshot_to_dict(source), 'target': snapshot_to_dict(target), 'plan': plan_lines,
+        }
+        with open(path, mode='w', encoding='utf-8') as f:
+            f.write(json.dumps(journal.header, ensure_ascii=False, default=str) + '\n')
+        journal.file = open(path, mode='a', encoding='utf-8')
+        #
+        return journal
+
+    @classmethod
+    def load(cls, path: str) -> Optional['MigrationJournal']:
+        """
+        Чтение журнала прерванного запуска
+        :param path: путь к файлу журнала
+        :return: журнал или None, если файла нет или он другого формата
+        """
+        if not os.path.exists(path):
+            return None
+        journal = cls(path)
+        valid_length = 0
+        with open(path, mode='rb') as f:
+            for line in f:
+                try:
+                    record = json.loads(line.decode('utf-8'))
+                except ValueError:
+                    break
+                journal._apply(record)
+                valid_length += len(line)
+        if valid_length < os.path.getsize(path):
+            # строка, недописанная при аварийном завершении, отбрасывается - новые записи пойдут после целых
+            os.truncate(path, valid_length)
+        if journal.header is None or journal.header.get('format') != JOURNAL_FORMAT:
+            return None
+        journal.file = open(path, mode='a', encoding='utf-8')
+        #
+        return journal
+
+    def _apply(self, record: dict):
+        kind = record['type']
+        if kind == 'plan':
+            self.header = record
+        elif kind == 'start':
+            self.started[record['operation']] = record['tables']
+        elif kind == 'progress':
+            self.progress[record['operation']] = record
+        elif kind == 'done':
+            self.done[record['operation']] = record
+            self.started.pop(record['operation'], None)
+            self.progress.pop(record['operation'], None)
+
+    def _write(self, record: dict):
+        with self.lock:
+            self._apply(record)
+            self.file.write(json.dumps(record, ensure_ascii=False, default=str) + '\n')
+            # контрольная точка должна пережить аварийное завершение процесса
+            self.file.flush()
+            os.fsync(self.file.fileno())
+
+    def start(self, operation: str, tables: List[str]):
+        """ Начало операции над таблицами (до ее завершения состояние таблиц считается неизвестным) """
+        self._write({'type': 'start', 'operation': operation, 'tables': tables})
+
+    def checkpoint(self, operation: str, last_key: Optional[tuple], transient: List[str] = None):
+        """
+        Контрольная точка внутри операции: ключ последней перенесенной порции
+        :param operation: операция
+        :param last_key: значения первичного ключа последней перенесенной строки
+        :param transient: служебные таблицы операции (например теневая копия), существующие до ее завершения
+        """
+        self._write({'type': 'progress', 'operation': operation,
+                     'last_key': list(last_key) if last_key is not None else None, 'transient': transient or []})
+
+    def complete(self, operation: str, fingerprints: Dict[str, Optional[str]], **details):
+        """
+        Завершение операции
+        :param operation: операция
+        :param fingerprints: отпечатки затронутых таблиц после операции (None - таблицы больше нет)
+        :param details: дополнительные сведения об операции (например алгоритм ALTER TABLE)
+        """
+        self._write({'type': 'done', 'operation': operation, 'fingerprints': fingerprints, **details})
+
+    def is_done(self, operation: str) -> bool:
+        return operation in self.done
+
+    def is_pending(self, operation: str) -> bool:
+        """ Операция была начата, но не завершена """
+        return operation in self.started
+
+    @property
+    def source_state(self) -> dict:
+        return self.header['source_state']
+
+    def snapshots(self) -> tuple:
+        """ Структуры тестовой и боевой БД на момент построения плана """
+        return snapshot_from_dict(self.header['source']), snapshot_from_dict(self.header['target'])
+
+    def pending_tables(self) -> List[str]:
+        """ Таблицы незавершенных операций """
+        return sorted({table for tables in self.started.values() for table in tables})
+
+    def expected_fingerprints(self) -> Dict[str, Optional[str]]:
+        """ Ожидаемые отпечатки таблиц боевой БД: на момент построения плана с учетом выполненных операций """
+        expected = dict(self.header['target_fingerprints'])
+        for record in self.done.values():
+            expected.update(record['fingerprints'])
+        #
+        return expected
+
+    def verify(self, fingerprints: Dict[str, str]) -> List[str]:
+        """
+        Сверка журнала с текущей структурой боевой БД
+        :param fingerprints: текущие отпечатки таблиц боевой БД
+        :return: таблицы, изменившиеся вне миграции (пустой список - журнал можно продолжать)
+        """
+        uncertain = set(self.pending_tables())
+        for record in self.progress.values():
+            uncertain.update(record['transient'])
+        expected = self.expected_fingerprints()
+        #
+        return sorted(table for table in set(expected) | set(fingerprints)
+                      if table not in uncertain and expected.get(table) != fingerprints.get(table))
+
+    def close(self, remove: bool = False):
+        """
+        Закрытие журнала
+        :param remove: удалить файл журнала (миграция завершена полностью)
+        """
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+        if remove and os.path.exists(self.path):
+            os.remove(self.path)
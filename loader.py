@@ -0,0 +1,118 @@
+import os
+import tempfile
+from itertools import islice
+from typing import Iterable, Iterator, List
+
+import mysql.connector
+
+from metrics import InstrumentedCursor
+from schema import quote_name
+
+
+def iter_batches(rows: Iterable[tuple], size: int) -> Iterator[List[tuple]]:
+    """
+    Разбиение потока строк на порции - в памяти одновременно находится только одна порция
+    :param rows: строки (любой итерируемый объект, в том числе генератор)
+    :param size: размер порции
+    """
+    iterator = iter(rows)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def to_tsv(value) -> str:
+    """ Значение в формате LOAD DATA по умолчанию: табуляция между полями, экранирование обратной косой чертой """
+    if value is None:
+        return '\\N'
+    if isinstance(value, bool):
+        return str(int(value))
+    return str(value).replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n')
+
+
+class BulkLoader:
+    """
+    Потоковая загрузка данных: строки берутся из генератора по мере надобности и записываются
+    многострочными INSERT (или через LOAD DATA LOCAL INFILE из временного файла) с фиксацией
+    каждые commit_every строк. Расход памяти не зависит от общего числа строк
+    """
+    def __init__(self, manager, batch_size: int = 1000, commit_every: int = 10000, method: str = 'insert'):
+        """
+        :param manager: менеджер БД, в которую загружаются данные
+        :param batch_size: число строк в одном INSERT
+        :param commit_every: число строк между фиксациями транзакции (и размер одного файла для LOAD DATA)
+        :param method: 'insert' - многострочные INSERT, 'infile' - LOAD DATA LOCAL INFILE
+            (нужна включенная на сервере local_infile)
+        """
+        if method not in ('insert', 'infile'):
+            raise ValueError(f'Неизвестный способ загрузки: {method}')
+        self.manager = manager
+        self.batch_size = batch_size
+        self.commit_every = max(commit_every, batch_size)
+        self.method = method
+
+    def load(self, table: str, columns: List[str], rows: Iterable[tuple]) -> int:
+        """
+        Загрузка строк в таблицу
+        :param table: имя таблицы
+        :param columns: имена столбцов (в порядке значений в строках)
+        :param rows: строки - кортежи значений
+        :return: число загруженных строк
+        """
+        if self.method == 'infile':
+            return self._load_infile(table, columns, rows)
+        return self._load_insert(table, columns, rows)
+
+    def _load_insert(self, table: str, columns: List[str], rows: Iterable[tuple]) -> int:
+        connection = self.manager.connection
+        cursor = self.manager.cursor
+        column_list = ', '.join(quote_name(c) for c in columns)
+        row_placeholder = f"({', '.join(['%s'] * len(columns))})"
+        total = 0
+        uncommitted = 0
+        for batch in iter_batches(rows, self.batch_size):
+            values = ', '.join([row_placeholder] * len(batch))
+            query = f'INSERT INTO {quote_name(table)} ({column_list}) VALUES {values}'
+            cursor.execute(query, [value for row in batch for value in row])
+            total += len(batch)
+            uncommitted += len(batch)
+            if uncommitted >= self.commit_every:
+                connection.commit()
+                uncommitted = 0
+        connection.commit()
+        #
+        return total
+
+    def _load_infile(self, table: str, columns: List[str], rows: Iterable[tuple]) -> int:
+        # LOAD DATA LOCAL разрешается только при подключении с allow_local_infile - отдельное соединение
+        connection = mysql.connector.connect(**self.manager.config, allow_local_infile=True)
+        cursor = InstrumentedCursor(connection.cursor(), self.manager.metrics, self.manager.config.get('database', ''))
+        column_list = ', '.join(quote_name(c) for c in columns)
+        iterator = iter(rows)
+        total = 0
+        try:
+            while True:
+                # строки пишутся в файл сразу из генератора, в памяти не накапливаются
+                written = 0
+                with tempfile.NamedTemporaryFile(mode='w', encoding='utf-8', suffix='.tsv', delete=False) as f:
+                    for row in islice(iterator, self.commit_every):
+                        f.write('\t'.join(to_tsv(value) for value in row) + '\n')
+                        written += 1
+                try:
+                    if written:
+                        path = f.name.replace('\\', '/')
+                        cursor.execute(f"LOAD DATA LOCAL INFILE '{path}' INTO TABLE {quote_name(table)} "
+                                       f"CHARACTER SET utf8mb4 ({column_list})")
+                        connection.commit()
+                finally:
+                    os.remove(f.name)
+                total += written
+                if written < self.commit_every:
+                    break
+        finally:
+            cursor.close()
+            connection.close()
+        #
+        return total
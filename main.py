@@ -1,5 +1,9 @@
+import argparse
+import asyncio
+
 import config
-from manager import MergeManager
+import schema
+from manager import MergeManager, ProdManager, TestManager
 
 
 def demo():
@@ -9,5 +13,93 @@ def demo():
     demo_manager.show_demo()
 
 
+def open_side(side: str, configs: config.Config):
+    """
+    Открытие стороны сравнения: 'test' / 'prod' - подключение к БД из конфига, иначе - путь к файлу снимка
+    """
+    if side == 'test':
+        return TestManager(configs.database_test.to_dict())
+    if side == 'prod':
+        return ProdManager(configs.database_prod.to_dict(), configs.sync)
+    return side
+
+
+async def merge_async(configs: config.Config, snapshot_path: str = None):
+    """
+    Слияние в асинхронном режиме: структуры обеих БД загружаются одновременно, независимые изменения
+    выполняются параллельно на соединениях пула
+    """
+    # aiomysql нужен только в этом режиме - без него остальные команды работают
+    from async_manager import AsyncBaseManager, AsyncProdManager
+
+    async with AsyncProdManager(configs.database_prod.to_dict(), configs.sync) as db_prod:
+        if snapshot_path:
+            await db_prod.compare_and_fit(schema.load_snapshot(snapshot_path))
+            return
+        async with AsyncBaseManager(configs.database_test.to_dict()) as db_test:
+            await db_prod.compare_and_fit(db_test)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Приведение структуры боевой БД к виду тестовой')
+    commands = parser.add_subparsers(dest='command')
+
+    snapshot_parser = commands.add_parser('snapshot', help='сохранить снимок структуры БД в файл')
+    snapshot_parser.add_argument('db', choices=['test', 'prod'])
+    snapshot_parser.add_argument('path', help='файл снимка (.json или .json.gz)')
+
+    diff_parser = commands.add_parser('diff', help='показать план миграции без внесения изменений')
+    diff_parser.add_argument('source', help="'test', 'prod' или файл снимка")
+    diff_parser.add_argument('target', help="'test', 'prod' или файл снимка")
+
+    seed_parser = commands.add_parser('seed', help='создать демо-таблицы и потоково наполнить их данными')
+    seed_parser.add_argument('db', choices=['test', 'prod'])
+    seed_parser.add_argument('--rows', type=int, default=5, help='строк в таблицах (в расписаниях - в 5 раз больше)')
+    seed_parser.add_argument('--method', choices=['insert', 'infile'], default='insert',
+                             help='многострочные INSERT или LOAD DATA LOCAL INFILE')
+    seed_parser.add_argument('--batch-size', type=int, default=1000)
+    seed_parser.add_argument('--commit-every', type=int, default=10000)
+    seed_parser.add_argument('--batched', action='store_true', help='создать таблицы одним обращением к серверу')
+
+    datadiff_parser = commands.add_parser('datadiff', help='сравнить данные общих таблиц тестовой и боевой БД')
+    datadiff_parser.add_argument('tables', nargs='*', help='таблицы (по умолчанию - все общие)')
+    datadiff_parser.add_argument('--chunk-size', type=int, default=1000)
+    datadiff_parser.add_argument('--leaf-size', type=int, default=16)
+
+    merge_parser = commands.add_parser('merge', help='привести боевую БД (или все шарды) к виду тестовой')
+    merge_parser.add_argument('--snapshot', help='файл снимка тестовой БД вместо подключения к ней')
+    merge_parser.add_argument('--async', dest='use_async', action='store_true',
+                              help='асинхронный режим (aiomysql), без теневых копий и ограничителя нагрузки')
+
+    args = parser.parse_args()
+    if args.command is None:
+        demo()
+        return
+
+    configs = config.get_config()
+    if args.command == 'snapshot':
+        MergeManager.save_snapshot(open_side(args.db, configs), args.path)
+    elif args.command == 'seed':
+        open_side(args.db, configs).make_initial_tables(lim=args.rows, method=args.method, batch_size=args.batch_size,
+                                                        commit_every=args.commit_every, batched=args.batched)
+    elif args.command == 'datadiff':
+        MergeManager.data_diff(open_side('test', configs), open_side('prod', configs), tables=args.tables or None,
+                               chunk_size=args.chunk_size, leaf_size=args.leaf_size)
+    elif args.command == 'diff':
+        MergeManager.diff(open_side(args.source, configs), open_side(args.target, configs))
+    elif args.command == 'merge' and args.use_async:
+        asyncio.run(merge_async(configs, snapshot_path=args.snapshot))
+    elif args.command == 'merge' and configs.database_shards:
+        db_test = None if args.snapshot else open_side('test', configs)
+        MergeManager(db_test=db_test).merge_shards(configs.database_shards, configs.sync,
+                                                   snapshot_path=args.snapshot)
+    elif args.command == 'merge':
+        db_prod = open_side('prod', configs)
+        if args.snapshot:
+            MergeManager(db_prod=db_prod).merge_from_snapshot(args.snapshot)
+        else:
+            MergeManager(db_test=open_side('test', configs), db_prod=db_prod).merge()
+
+
 if __name__ == '__main__':
-    demo()
+    main()
@@ -1,29 +1,139 @@
+import cost
+import plan
 import utils
+import schema
+import shadow
+import throttle
+import dependencies
+import metrics
+import loader
+import datacopy
+import datadiff
+import fingerprint
+import journal
+import batching
+import definitions
+import functools
+import contextlib
+import os
+import time
 import mysql.connector
-from config import Config
-from typing import Union
+import mysql.connector.pooling
+from concurrent.futures import ThreadPoolExecutor
+from config import Config, DatabaseConfig, SyncConfig
+from dataclasses import dataclass, field, replace
+from typing import List, Optional, Union
+
+
+# Порядок попыток выполнения ALTER TABLE в режиме online DDL: от мгновенного изменения метаданных
+# к перестроению таблицы без блокировки записи и, только при явном разрешении, к полному копированию
+ONLINE_DDL_ALGORITHMS = (
+    ('INSTANT', 'ALGORITHM=INSTANT'),
+    ('INPLACE', 'ALGORITHM=INPLACE, LOCK=NONE'),
+    ('COPY', 'ALGORITHM=COPY'),
+)
+# Ошибки MySQL о том, что запрошенный алгоритм/блокировка для операции недоступны
+UNSUPPORTED_ALGORITHM_ERRORS = (1800, 1845, 1846)
+
+
+class BlockingDDLError(Exception):
+    """
+    Изменение таблицы возможно только блокирующим ALGORITHM=COPY, а он не разрешен настройками
+    """
+
+
+def hold_foreign_keys(migration: plan.MigrationPlan, sync_config: SyncConfig, empty_tables: set) -> dict:
+    """
+    Исключение из плана внешних ключей, которые нельзя добавить без блокирующего COPY (online DDL без
+    sync.allow_copy). Измененный ключ удаляется до остальных изменений, а создается заново в конце - если
+    новое определение не добавить, прежний ключ не удаляется, чтобы таблица не осталась без ограничения
+    :param migration: план миграции (изменяется на месте)
+    :param sync_config: настройки синхронизации
+    :param empty_tables: таблицы, создаваемые пустыми (их ключи добавляются без проверки строк)
+    :return: словарь {таблица: ошибка BlockingDDLError} по таблицам с неизмененными ключами
+    """
+    held = {}
+    if not sync_config.online_ddl or sync_config.allow_copy:
+        return held
+    for table, table_change in list(migration.foreign_key_adds.items()):
+        validate = sync_config.validate_foreign_keys and table not in empty_tables
+        blocked = [change for change in table_change.changes if cost.change_algorithm(change, validate)[0] == 'COPY']
+        if not blocked:
+            continue
+        names = {change.name for change in blocked}
+        table_change.changes = [change for change in table_change.changes if change.name not in names]
+        if not table_change.changes:
+            del migration.foreign_key_adds[table]
+        drops = migration.foreign_key_drops.get(table)
+        kept = []
+        if drops is not None:
+            kept = [change.name for change in drops.changes if change.name in names]
+            drops.changes = [change for change in drops.changes if change.name not in names]
+            if not drops.changes:
+                del migration.foreign_key_drops[table]
+        held[table] = BlockingDDLError(f'Добавление внешних ключей {sorted(names)} таблицы {table} требует '
+                                       f'ALGORITHM=COPY (проверка существующих строк), который блокирует запись '
+                                       f'(разрешается настройкой sync.allow_copy)'
+                                       + (f', прежние ключи {kept} сохранены' if kept else ''))
+    #
+    return held
+
+
+@dataclass
+class ShardResult:
+    """
+    Итог синхронизации одного шарда
+    """
+    shard: str
+    seconds: float = 0.0
+    migration: Optional[plan.MigrationPlan] = None
+    ddl_log: List[dict] = field(default_factory=list)
+    errors: dict = field(default_factory=dict)
+    budget_exceeded: bool = False
+    error: Optional[Exception] = None
+
+    def describe(self) -> str:
+        if self.error is not None:
+            return f'{self.shard}: ОШИБКА {self.error} ({self.seconds:.1f} с)'
+        if self.budget_exceeded:
+            return f'{self.shard}: пропущен - оценка времени превышает бюджет ({self.seconds:.1f} с)'
+        algorithms = {}
+        for entry in self.ddl_log:
+            algorithms[entry['algorithm']] = algorithms.get(entry['algorithm'], 0) + 1
+        status = 'OK' if not self.errors else f'ошибок в таблицах: {len(self.errors)} {sorted(self.errors)}'
+        return (f'{self.shard}: {status}, создано таблиц {len(self.migration.added_tables)}, '
+                f'удалено {len(self.migration.dropped_tables)}, изменено {len(self.migration.table_changes)}, '
+                f'DDL {algorithms or "-"} ({self.seconds:.1f} с)')
 
 
 class BaseManager:
     """
     Базовый класс менеджера БД с общим функционалом для управления БД
     """
-    def __init__(self, db_config):
+    def __init__(self, db_config, connection=None, query_metrics: metrics.Metrics = None):
         self.config = db_config
-        self.connection = None
+        self.connection = connection
         self.cursor = None
         self.table_names = None
+        self.schema = None
+        self.metrics = query_metrics or metrics.default_metrics
+        self.active_batch = None
+        self.definitions = definitions.DefinitionCache()
         #
         self.connect()
-        self.get_tables()
+        self.get_tables(silent=connection is not None)
 
     def connect(self):
         """
-        Подключение к базе данных
+        Подключение к базе данных (или подготовка курсора, если соединение передано извне, например из пула)
         """
+        if self.connection is not None:
+            self.cursor = self.new_cursor()
+            return
+
         try:
             self.connection = mysql.connector.connect(**self.config)
-            self.cursor = self.connection.cursor()
+            self.cursor = self.new_cursor()
 
             if self.connection.is_connected():
                 db_info = self.connection.get_server_info()
@@ -32,6 +142,12 @@ class BaseManager:
         except mysql.connector.Error as exp:
             print(f"Ошибка при подключении к базе данных: {exp}")
 
+    def new_cursor(self):
+        """
+        Новый курсор соединения с учетом метрик запросов (время, число обращений, строк, этап работы)
+        """
+        return metrics.InstrumentedCursor(self.connection.cursor(), self.metrics, self.config.get('database', ''))
+
     def disconnect(self):
         """
         Закрытие соединения
@@ -70,6 +186,7 @@ class BaseManager:
         """
         if table_name in self.table_names:
             query = f"ALTER TABLE {table_name} ADD COLUMN {column_signature};"
+            self.definitions.invalidate(table_name)
             self.send_to_db(query)
 
     def _change_column(self, table: str, column_signature_test: str):
@@ -79,6 +196,7 @@ class BaseManager:
         :param column_signature_test: новые параметры для изменяемого столбца (имя, тип, прочее)
         """
         query = f'ALTER TABLE {table} MODIFY COLUMN {column_signature_test};'
+        self.definitions.invalidate(table)
         self.send_to_db(query)
 
     def _drop_column(self, table: str, column: str):
@@ -88,8 +206,17 @@ class BaseManager:
         :param column: имя столбца
         """
         query = f'ALTER TABLE {table} DROP COLUMN {column};'
+        self.definitions.invalidate(table)
         self.send_to_db(query)
 
+    def _alter_table(self, table_change: plan.TableChange):
+        """
+        Выполнение всех изменений таблицы одним SQL-запросом ALTER TABLE
+        :param table_change: набор изменений таблицы
+        """
+        self.definitions.invalidate(table_change.table)
+        self.send_to_db(table_change.to_sql())
+
     def _drop_table(self, table_name):
         """
         Формирование SQL-запроса для удаления таблицы
@@ -98,77 +225,146 @@ class BaseManager:
         """
         try:
             query = f"DROP TABLE {table_name}"
+            self.definitions.invalidate(table_name)
             self.send_to_db(query)
             self.get_tables(silent=True)
             return True, None
         except Exception as exp:
             return False, exp
 
-    def drop_tables(self):
+    def _drop_tables_batch(self, table_names: list):
+        """
+        Удаление нескольких таблиц одним SQL-запросом DROP TABLE a, b, c
+        :param table_names: имена таблиц
+        :return: Кортеж с флагом итога операции и выброшенным исключением (при возникновении)
+        """
+        try:
+            query = f"DROP TABLE {', '.join(schema.quote_name(table) for table in table_names)}"
+            for table in table_names:
+                self.definitions.invalidate(table)
+            self.send_to_db(query)
+            self.get_tables(silent=True)
+            return True, None
+        except Exception as exp:
+            return False, exp
+
+    def drop_tables(self, batched: bool = False):
         """
         Удаление всех таблиц - очистка БД
+        :param batched: отправить все DROP TABLE одним обращением к серверу (пакетный режим send_to_db)
         """
-        existing_tables = self.get_tables(silent=True)
-
-        # удаляю в while цикле поочередно пробуя каждую таблицу (из-за связей и ограничений)
-        # можно было просто в обратном порядке, но это не дает 100% гарантии
-        while existing_tables:
-            is_dropped, exp = self._drop_table(existing_tables[0])
-            if is_dropped:
-                existing_tables.pop(0)
-            elif isinstance(exp, mysql.connector.errors.DatabaseError) and exp.errno == 3730:
-                # это ошибка из-за неверной очереди удаления таблиц
-                existing_tables.append(existing_tables.pop(0))
-            else:
-                # иная ошибка, пробрасываю наверх
+        # порядок удаления берется из графа внешних ключей: сначала пакетом удаляются таблицы,
+        # на которые никто не ссылается, затем те, на которые ссылались только уже удаленные
+        existing_tables = self.get_schema().tables
+        graph = dependencies.get_dependencies(self.schema)
+        if batched:
+            self.definitions.invalidate()
+            with self.batch():
+                for batch in dependencies.drop_batches(existing_tables, graph):
+                    self.send_to_db(f"DROP TABLE {', '.join(schema.quote_name(table) for table in batch)}")
+            self.get_tables(silent=True)
+            return
+        for batch in dependencies.drop_batches(existing_tables, graph):
+            is_dropped, exp = self._drop_tables_batch(batch)
+            if not is_dropped:
                 raise exp
-            #
-            self.connection.commit()
+
+    def batch(self, transaction_size: int = 1000, pipeline_size: int = 50) -> batching.StatementBatch:
+        """
+        Пакетный режим send_to_db внутри блока with: запросы отправляются по несколько за одно обращение
+        к серверу, транзакция фиксируется раз в transaction_size запросов и при выходе из блока
+        :param transaction_size: число запросов между фиксациями транзакции
+        :param pipeline_size: число запросов, отправляемых одним обращением к серверу
+        :return: пакет запросов (контекстный менеджер)
+        """
+        return batching.StatementBatch(self, transaction_size=transaction_size, pipeline_size=pipeline_size)
 
     def send_to_db(self, query: str, params: Union[None, list] = None):
         """
-        Выполнение SQL запроса и закрепление результата
+        Выполнение SQL запроса и закрепление результата (в пакетном режиме - постановка запроса в пакет)
         :param query: Строка со SQL-запросом
         :param params: Параметры для массовой записи (опционально)
         """
+        # изменение структуры таблицы через любой запрос (в том числе вне методов менеджера) сбрасывает ее определение
+        self.definitions.invalidate_statement(query)
+        if self.active_batch is not None:
+            self.active_batch.send(query, params)
+            return
         if params:
             self.cursor.executemany(query, params)
         else:
             self.cursor.execute(query)
         self.connection.commit()
 
-    def make_initial_tables(self):
+    def make_initial_tables(self, lim: int = 5, method: str = 'insert', batch_size: int = 1000,
+                            commit_every: int = 10000, batched: bool = False):
         """
-        Наполнение БД первичными данными
-        :return:
+        Наполнение БД первичными данными. Строки генерируются лениво и загружаются потоково,
+        поэтому объем данных ограничен только временем загрузки
+        :param lim: число строк в демо-таблицах (в расписаниях - в 5 раз больше)
+        :param method: способ загрузки: 'insert' - многострочные INSERT, 'infile' - LOAD DATA LOCAL INFILE
+        :param batch_size: число строк в одном INSERT
+        :param commit_every: число строк между фиксациями транзакции
+        :param batched: создать таблицы одним обращением к серверу (пакетный режим send_to_db)
         """
         print('Создаю и наполняю демо-таблицы')
-        for table, insert, data in zip(utils.get_initial_tables(),
-                                       utils.get_sql_for_insert_rows(),
-                                       utils.get_initial_data()):
-            self.send_to_db(table)
-            self.send_to_db(insert, data)
+        with self.batch() if batched else contextlib.nullcontext():
+            for table in utils.get_initial_tables():
+                self.send_to_db(table)
+        bulk_loader = loader.BulkLoader(self, batch_size=batch_size, commit_every=commit_every, method=method)
+        for table, (columns, rows) in utils.iter_initial_data(lim).items():
+            bulk_loader.load(table, columns, rows)
         self.get_tables()
 
+    def get_schema(self, tables: list = None):
+        """
+        Загрузка полной структуры БД (таблицы, столбцы, индексы, внешние ключи) за несколько запросов
+        :param tables: загрузить столбцы и индексы только этих таблиц (по умолчанию - всех)
+        :return: датакласс со структурой БД
+        """
+        self.schema = schema.load_schema(self.cursor, self.connection.database, tables=tables)
+        return self.schema
+
+    def get_fingerprints(self, tables: list = None):
+        """
+        Получение отпечатков структуры всех таблиц БД (считаются на стороне сервера)
+        :param tables: получить отпечатки только этих таблиц (по умолчанию - всех)
+        :return: словарь {таблица: отпечаток}
+        """
+        return fingerprint.load_fingerprints(self.cursor, tables=tables)
+
+    def _show_create_table(self, table: str) -> str:
+        cursor = self.new_cursor()
+        cursor.execute(f'SHOW CREATE TABLE {schema.quote_name(table)}')
+        ddl = cursor.fetchone()[1]
+        cursor.close()
+        return ddl
+
+    def get_definition(self, table: str) -> definitions.TableDefinition:
+        """
+        Разобранное определение таблицы (SHOW CREATE TABLE) из кэша соединения: с сервера оно читается
+        один раз, до первого изменения структуры таблицы через менеджер
+        :param table: имя таблицы
+        :return: датакласс с определениями столбцов, индексов и ограничений по именам
+        """
+        return self.definitions.get(table, self._show_create_table)
+
     def get_structure(self):
         """
         Сбор данных о структуре БД
-        :return: Словарь данными о таблицах и столбцах внутри
+        :return: Словарь данными о таблицах, столбцах внутри и статистикой (оценки размера и признак пустоты)
         """
+        with self.metrics.phase('structure'):
+            snapshot = self.get_schema()
         structure = {}
-        for table_name in self.table_names:
-            self.cursor.execute(f"SELECT COUNT(*) FROM {table_name}")
-            is_empty = not bool(self.cursor.fetchone()[0])
-
-            query = f"""
-                SELECT COLUMN_NAME, DATA_TYPE
-                FROM information_schema.COLUMNS
-                WHERE TABLE_NAME = '{table_name}'
-            """
-            self.cursor.execute(query)
-            columns_info = self.cursor.fetchall()
-            columns_data = [column[0] for column in columns_info]
-            structure[table_name] = {'is_empty': is_empty, 'columns': columns_data}
+        for table_name, table in snapshot.tables.items():
+            structure[table_name] = {
+                'is_empty': table.stats.is_empty,
+                'columns': list(table.columns),
+                'rows_estimate': table.stats.rows_estimate,
+                'data_length': table.stats.data_length,
+                'index_length': table.stats.index_length,
+            }
         #
         return structure
 
@@ -219,125 +415,590 @@ class ProdManager(BaseManager):
     """
     Класс с функционалом для управления боевой версией БД и внесение в нее изменений по образцу тестовой БД
     """
-    def __init__(self, db_config):
-        super().__init__(db_config)
+    def __init__(self, db_config, sync_config: SyncConfig = None, connection=None,
+                 load_throttle: throttle.Throttle = None, query_metrics: metrics.Metrics = None):
+        self.sync_config = sync_config or SyncConfig()
+        self.ddl_log = []
+        self.errors = {}
+        self.shadowed_tables = set()
+        # таблицы, созданные в этом запуске пустыми: их внешние ключи добавляются без проверки строк
+        self.empty_tables = set()
+        self.budget_exceeded = False
+        self.journal = None
+        # ограничитель нагрузки общий для всех рабочих соединений одной синхронизации
+        self.throttle = load_throttle
+        if self.throttle is None and self.sync_config.throttle:
+            self.throttle = throttle.Throttle(
+                db_config,
+                replica_config=self.sync_config.replica.to_dict() if self.sync_config.replica else None,
+                max_threads_running=self.sync_config.max_threads_running,
+                max_history_length=self.sync_config.max_history_length,
+                max_replica_lag=self.sync_config.max_replica_lag,
+                max_wait=self.sync_config.throttle_max_wait,
+            )
+        super().__init__(db_config, connection=connection, query_metrics=query_metrics)
 
-    @staticmethod
-    def get_column_signature(column: str, table: str, bd: Union[TestManager, BaseManager]):
+    def disconnect(self):
         """
-        Извлечение строки с параметрами отдельного столбца
-        :param column: имя столбца
-        :param table: имя таблицы
-        :param bd: БД (экземпляр класса менеджера)
-        :return: строка с параметрами столбца
-        """
-        source_cursor = bd.connection.cursor()
-        query = f"SHOW CREATE TABLE {table}"
-        source_cursor.execute(query)
-        table_signature = source_cursor.fetchone()[1].split('\n')
-        column_signature = [c.strip() for c in table_signature if c.strip().startswith(f'`{column}`')][0][:-1]
-        #
-        return column_signature
+        Закрытие соединения (и служебных соединений ограничителя нагрузки)
+        """
+        if self.throttle is not None:
+            self.throttle.close()
+        super().disconnect()
+
+    def send_to_db(self, query: str, params: Union[None, list] = None):
+        """
+        Выполнение SQL запроса с предварительным ожиданием допустимой нагрузки на сервер (если включено)
+        :param query: Строка со SQL-запросом
+        :param params: Параметры для массовой записи (опционально)
+        """
+        if self.throttle is not None:
+            self.throttle.wait()
+        super().send_to_db(query, params)
 
-    def copy_table(self, table_name: str, source_db):
+    def _alter_table(self, table_change: plan.TableChange):
         """
-        Копирование таблицы (только структуры, без данных) из внешней БД
+        Выполнение изменений таблицы. В режиме online DDL алгоритм задается явно и перебирается
+        от INSTANT к INPLACE (LOCK=NONE); блокирующий запись COPY используется только если он разрешен
+        :param table_change: набор изменений таблицы
+        :return: имя фактически использованного алгоритма
+        """
+        self.definitions.invalidate(table_change.table)
+        if not self.sync_config.online_ddl:
+            super()._alter_table(table_change)
+            self.ddl_log.append({'table': table_change.table, 'algorithm': 'DEFAULT'})
+            return 'DEFAULT'
+
+        for algorithm, clause in ONLINE_DDL_ALGORITHMS:
+            if algorithm == 'COPY' and not self.sync_config.allow_copy:
+                raise BlockingDDLError(f'Изменение таблицы {table_change.table} требует ALGORITHM=COPY, '
+                                       f'который блокирует запись (разрешается настройкой sync.allow_copy)')
+            try:
+                self.send_to_db(f'{table_change.to_sql()}, {clause}')
+            except mysql.connector.Error as exp:
+                if exp.errno in UNSUPPORTED_ALGORITHM_ERRORS:
+                    # алгоритм не подходит для этих изменений - пробую следующий
+                    continue
+                raise exp
+            self.ddl_log.append({'table': table_change.table, 'algorithm': algorithm})
+            return algorithm
+
+    def copy_table(self, table_name: str, source_db, with_data: bool = False, resume: bool = False,
+                   checkpoint=None):
+        """
+        Копирование таблицы из внешней БД: структуры и, по желанию, данных
         :param table_name: имя таблицы
         :param source_db: БД-донор, тестовая БД (экземпляр класса менеджера)
+        :param with_data: перенести и строки (порциями по первичному ключу)
+        :param resume: продолжить прерванный перенос данных - уже существующая таблица не пересоздается
+        :param checkpoint: функция записи ключа последней перенесенной порции (журнал миграции)
         """
-        source_cursor = source_db.connection.cursor()
-        target_cursor = self.connection.cursor()
+        if not (resume and table_name in self.get_tables(silent=True)):
+            target_cursor = self.new_cursor()
 
-        # Получение информации о структуре таблицы из исходной БД
-        query = f"SHOW CREATE TABLE {table_name}"
-        source_cursor.execute(query)
-        table_structure = source_cursor.fetchone()[1]
+            # Получение информации о структуре таблицы из исходной БД (из кэша определений, если уже читалась)
+            table_structure = source_db.get_definition(table_name).ddl
+            self.definitions.invalidate(table_name)
 
-        # Создание таблицы с аналогичной структурой в целевой БД
-        target_cursor.execute(f"USE {self.connection.database}")
-        target_cursor.execute(table_structure.replace(table_name, table_name))
+            # Создание таблицы с аналогичной структурой в целевой БД (внешние ключи добавляются после
+            # создания всех новых таблиц)
+            target_cursor.execute(f"USE {self.connection.database}")
+            target_cursor.execute(definitions.strip_foreign_keys(table_structure.replace(table_name, table_name)))
 
-        # Фиксация изменений
-        self.connection.commit()
+            # Фиксация изменений
+            self.connection.commit()
+
+        if with_data:
+            data_copy = datacopy.TableDataCopy(source_db, self, table_name, chunk_size=self.sync_config.chunk_size,
+                                               chunk_sleep=self.sync_config.chunk_sleep, load_throttle=self.throttle,
+                                               checkpoint=checkpoint)
+            copied = data_copy.run(resume=resume)
+            print(' '*6, f'Перенесено строк в таблицу {table_name}: {copied}, порций: {data_copy.copied_chunks}')
 
-    def copy_column(self, column: str, table: str, source_bd: TestManager):
+    def shadow_migrate(self, source: schema.TableInfo, target: schema.TableInfo,
+                       target_schema: schema.SchemaSnapshot, renames: dict = None, operation: str = ''):
         """
-        Копирование отдельного столбца (без данных)
-        :param column: имя столбца
+        Приведение таблицы к виду образца через теневую копию без блокировки записи
+        :param source: таблица-образец (из тестовой БД)
+        :param target: изменяемая таблица боевой БД
+        :param target_schema: структура боевой БД
+        :param renames: переименованные столбцы {старое имя: новое имя}
+        :param operation: операция в журнале миграции (для контрольных точек переноса)
+        """
+        migration = shadow.ShadowMigration(self, source=source, target=target, target_schema=target_schema,
+                                           chunk_size=self.sync_config.chunk_size,
+                                           chunk_sleep=self.sync_config.chunk_sleep, renames=renames,
+                                           load_throttle=self.throttle,
+                                           checkpoint=self._journal_checkpoint(operation))
+        progress = self.journal.progress.get(operation) if self.journal is not None else None
+        # теневая таблица и триггеры остались от прерванного запуска - перенос продолжается после последней порции
+        resume = progress is not None and migration.shadow_name in self.get_tables(silent=True)
+        if resume:
+            migration.last_key = tuple(progress['last_key']) if progress['last_key'] is not None else None
+            print(' '*6, f'Продолжаю перенос строк таблицы {target.name} в теневую копию после ключа '
+                         f'{migration.last_key}')
+        self.definitions.invalidate(target.name)
+        migration.run(resume=resume)
+        self.shadowed_tables.add(target.name)
+        self.ddl_log.append({'table': target.name, 'algorithm': 'SHADOW', 'chunks': migration.copied_chunks})
+        print(' '*6, f'Таблица {target.name} перестроена через теневую копию, порций: {migration.copied_chunks}')
+
+    def _sync_table(self, table: str, migration: plan.MigrationPlan,
+                    test_schema: schema.SchemaSnapshot, prod_schema: schema.SchemaSnapshot):
+        """
+        Приведение одной общей таблицы к виду образца
         :param table: имя таблицы
-        :param source_bd: БД-донор, тестовая БД (экземпляр класса менеджера)
+        :param migration: план миграции
+        :param test_schema: структура тестовой БД
+        :param prod_schema: структура боевой БД
+        :return: строки отчета по таблице (выводятся целиком, чтобы не перемешивались при параллельной работе)
         """
-        column_signature = self.get_column_signature(column=column, table=table, bd=source_bd)
-        self._add_column(table_name=table, column_signature=column_signature)
+        lines = [' '*4 + f'В таблице {table} :']
+        table_change = migration.table_changes.get(table)
+        if table_change is None:
+            return lines
+
+        for change in table_change.changes:
+            if isinstance(change, plan.IndexChange):
+                action = 'Добавляю' if change.action == 'add' else 'Удаляю'
+                lines.append(' '*7 + f'{action} индекс {change.name} таблицы {table}')
+            elif change.action == 'add':
+                lines.append(' '*7 + f'Добавляю столбец {change.column} в таблицу {table}')
+            elif change.action == 'drop':
+                lines.append(' '*7 + f'Удаляю столбец {change.column} таблицы {table}')
+            elif change.action == 'rename':
+                lines.append(' '*7 + f'Переименовываю столбец {change.old_name} в {change.column} таблицы {table}')
+            else:
+                lines.append(' '*7 + f'Нужно заменить столбец {change.column} таблицы {table} '
+                                     f'(различия: {", ".join(change.differences)})')
+                lines.append(' '*7 + f'{change.previous} --> {change.definition}')
+        for item in table_change.review:
+            lines.append(' '*7 + f'Требует проверки разработчиком: {item}')
+        if not table_change.changes:
+            return lines
+        operation = f'alter:{table}'
+        if self._journal_done(operation):
+            lines.append(' '*7 + 'Изменения уже применены в прерванном запуске (по журналу миграции)')
+            return lines
+        self._journal_start(operation, [table])
 
-    def compare_and_fit(self, test_db: TestManager):
+        # все изменения столбцов таблицы отправляются одним ALTER TABLE - таблица перестраивается один раз
+        try:
+            algorithm = self._alter_table(table_change)
+        except BlockingDDLError as exp:
+            if not self.sync_config.shadow_copy:
+                lines.append(' '*7 + f'Изменения не применены: {exp}')
+                self.errors[table] = exp
+                return lines
+            try:
+                renames = {c.old_name: c.column for c in table_change.changes if c.action == 'rename'}
+                self.shadow_migrate(test_schema.tables[table], prod_schema.tables[table], prod_schema, renames,
+                                    operation=operation)
+            except ValueError as shadow_exp:
+                lines.append(' '*7 + f'Изменения не применены: {shadow_exp}')
+                self.errors[table] = shadow_exp
+                return lines
+            algorithm = 'SHADOW'
+        self._journal_complete([operation], [table], algorithm=algorithm)
+        lines.append(' '*7 + f'Изменений выполнено одним ALTER TABLE: {len(table_change.changes)}, '
+                             f'сэкономлено запросов: {table_change.saved_statements}, алгоритм: {algorithm}')
+        #
+        return lines
+
+    def _sync_tables_group(self, pool, tables: list, migration: plan.MigrationPlan,
+                           test_schema: schema.SchemaSnapshot, prod_schema: schema.SchemaSnapshot):
+        """
+        Последовательная обработка группы связанных внешними ключами таблиц на отдельном соединении из пула
+        :return: журнал DDL, словарь ошибок по таблицам и таблицы, перестроенные через теневую копию
+        """
+        worker = ProdManager(self.config, self.sync_config, connection=pool.get_connection(),
+                             load_throttle=self.throttle, query_metrics=self.metrics)
+        worker.journal = self.journal
+        try:
+            with self.metrics.phase('alter'):
+                for table in tables:
+                    try:
+                        print('\n'.join(worker._sync_table(table, migration, test_schema, prod_schema)))
+                    except Exception as exp:
+                        worker.errors[table] = exp
+                        print(' '*3, 'Ошибка при изменении таблицы', table, ':', exp)
+        finally:
+            worker.cursor.close()
+            # для соединения из пула close() возвращает его обратно в пул
+            worker.connection.close()
+        #
+        return worker.ddl_log, worker.errors, worker.shadowed_tables
+
+    def _sync_tables_parallel(self, lanes: list, migration: plan.MigrationPlan,
+                              test_schema: schema.SchemaSnapshot, prod_schema: schema.SchemaSnapshot):
+        """
+        Параллельное приведение общих таблиц к виду образца на нескольких соединениях.
+        Каждое соединение обрабатывает свою очередь таблиц, составленную по оценке стоимости;
+        связанные внешними ключами таблицы всегда в одной очереди, ошибки собираются по таблицам
+        и не прерывают остальную работу
+        :param lanes: очереди таблиц по соединениям (cost.schedule_groups)
+        """
+        workers = len(lanes) or 1
+        print(' '*3, f'Параллельная обработка: таблиц {sum(len(lane) for lane in lanes)}, соединений {workers}')
+        pool = mysql.connector.pooling.MySQLConnectionPool(pool_name=f'sync_{id(self)}', pool_size=workers,
+                                                           **self.config)
+        try:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                futures = [executor.submit(self._sync_tables_group, pool, lane, migration, test_schema,
+                                           prod_schema)
+                           for lane in lanes]
+                for future in futures:
+                    ddl_log, errors, shadowed_tables = future.result()
+                    self.ddl_log.extend(ddl_log)
+                    self.errors.update(errors)
+                    # перестроенным таблицам внешние ключи уже не добавляются
+                    self.shadowed_tables.update(shadowed_tables)
+        finally:
+            # у пула нет публичного close(): закрываются все соединения, вернувшиеся в пул
+            pool._remove_connections()
+        # таблицы изменены на соединениях пула со своими кэшами определений - записи этого кэша устарели
+        for lane in lanes:
+            for table in lane:
+                self.definitions.invalidate(table)
+
+    def _hold_foreign_keys(self, migration: plan.MigrationPlan):
+        """
+        Исключение из плана внешних ключей, которые нельзя добавить без блокирующего COPY (см. hold_foreign_keys)
+        :param migration: план миграции (изменяется на месте)
+        """
+        for table, exp in hold_foreign_keys(migration, self.sync_config, self.empty_tables).items():
+            print(' '*3, f'Внешние ключи таблицы {table} не изменены: {exp}')
+            self.errors.setdefault(table, exp)
+
+    def _validate_foreign_keys(self, table: str) -> bool:
+        """ Проверяются ли существующие строки при добавлении внешних ключей таблицы """
+        return self.sync_config.validate_foreign_keys and table not in self.empty_tables
+
+    def _apply_foreign_keys(self, changes: dict, adding: bool = False):
+        """
+        Удаление или добавление внешних ключей: все изменения таблицы - одним ALTER TABLE
+        :param changes: словарь {таблица: набор изменений внешних ключей}
+        :param adding: добавление (иначе удаление) внешних ключей
+        """
+        phase = 'fk_add' if adding else 'fk_drop'
+        with self.metrics.phase(phase):
+            for table, table_change in changes.items():
+                if adding and table in self.shadowed_tables:
+                    # таблица уже пересоздана по образцу вместе с внешними ключами
+                    continue
+                operation = f'{phase}:{table}'
+                if self._journal_done(operation):
+                    continue
+                self._journal_start(operation, [table])
+                names = ', '.join(change.name for change in table_change.changes)
+                skip_checks = adding and not self._validate_foreign_keys(table)
+                if skip_checks:
+                    # без проверки существующих строк ключ добавляется INPLACE, без сканирования таблицы
+                    self.send_to_db('SET FOREIGN_KEY_CHECKS = 0')
+                try:
+                    algorithm = self._alter_table(table_change)
+                except BlockingDDLError as exp:
+                    print(' '*3, f'Внешние ключи {names} таблицы {table} не изменены: {exp}')
+                    self.errors.setdefault(table, exp)
+                    continue
+                finally:
+                    if skip_checks:
+                        self.send_to_db('SET FOREIGN_KEY_CHECKS = 1')
+                self._journal_complete([operation], [table], algorithm=algorithm)
+                print(' '*3, f'{"Добавлены" if adding else "Удалены"} внешние ключи {names} таблицы {table}, '
+                             f'алгоритм: {algorithm}')
+
+    def _create_table(self, table: str, test_db: Union[TestManager, schema.SchemaSnapshot]):
+        """
+        Создание таблицы по образцу: копированием из живой тестовой БД (с данными при sync.copy_data)
+        или по модели из снимка структуры
+        :param table: имя таблицы
+        :param test_db: БД-донор (экземпляр класса менеджера) или снимок ее структуры
+        :return: признак создания (False - таблица создана в прерванном запуске)
+        """
+        operation = f'create:{table}'
+        if self._journal_done(operation):
+            print(' '*3, 'Уже создана в прерванном запуске:', table)
+            return False
+        # создание было прервано: таблица может уже существовать, тогда продолжается перенос ее строк
+        resume = self.journal is not None and self.journal.is_pending(operation)
+        self._journal_start(operation, [table])
+        if isinstance(test_db, schema.SchemaSnapshot):
+            if not (resume and table in self.get_tables(silent=True)):
+                self.definitions.invalidate(table)
+                self.send_to_db(test_db.tables[table].to_create_sql(foreign_keys=False))
+        else:
+            self.copy_table(table_name=table, source_db=test_db, with_data=self.sync_config.copy_data,
+                            resume=resume, checkpoint=self._journal_checkpoint(operation))
+        self._journal_complete([operation], [table])
+        #
+        return True
+
+    def _journal_done(self, operation: str) -> bool:
+        """ Операция выполнена в прерванном ранее запуске (по журналу миграции) """
+        return self.journal is not None and self.journal.is_done(operation)
+
+    def _journal_start(self, operation: str, tables: list):
+        if self.journal is not None:
+            self.journal.start(operation, tables)
+
+    def _journal_checkpoint(self, operation: str):
+        """ Функция записи ключа последней перенесенной порции в журнал (None - журнал не ведется) """
+        if self.journal is None:
+            return None
+        return functools.partial(self.journal.checkpoint, operation)
+
+    def _journal_complete(self, operations: list, tables: list, **details):
+        """
+        Контрольная точка после выполнения операций: в журнал пишутся отпечатки затронутых таблиц
+        (одна группа запросов к information_schema только по этим таблицам)
+        """
+        if self.journal is None:
+            return
+        fingerprints = self.get_fingerprints(tables=tables)
+        for operation in operations:
+            self.journal.complete(operation, {table: fingerprints.get(table) for table in tables}, **details)
+
+    @staticmethod
+    def _source_state(test_db: Union[TestManager, schema.SchemaSnapshot]) -> dict:
+        """ Состояние образца для журнала: отпечатки таблиц тестовой БД или отпечаток снимка ее структуры """
+        if isinstance(test_db, schema.SchemaSnapshot):
+            return {'snapshot': journal.snapshot_digest(test_db)}
+        return test_db.get_fingerprints()
+
+    def _resume_journal(self, test_db: Union[TestManager, schema.SchemaSnapshot]):
+        """
+        Продолжение прерванного запуска по журналу миграции. Вместо полной загрузки структур сверяются
+        отпечатки таблиц: образец не должен измениться, а боевая БД - отличаться от ожидаемой по журналу.
+        Таблицы незавершенных операций перечитываются и сравниваются заново
+        :param test_db: БД-донор (экземпляр класса менеджера) или снимок ее структуры
+        :return: кортеж (структура тестовой БД, структура боевой БД) или None - журнала нет или он устарел
+        """
+        path = self.sync_config.journal_path
+        previous = journal.MigrationJournal.load(path)
+        if previous is None:
+            return None
+        if self._source_state(test_db) != previous.source_state:
+            print(f'Журнал миграции {path} устарел: структура тестовой БД изменилась. Начинаю заново.')
+            previous.close()
+            return None
+        changed = previous.verify(self.get_fingerprints())
+        if changed:
+            print(f'Журнал миграции {path} устарел: таблицы боевой БД изменены вне миграции {changed}. '
+                  f'Начинаю заново.')
+            previous.close()
+            return None
+
+        test_schema, prod_schema = previous.snapshots()
+        uncertain = [table for table in previous.pending_tables() if table in prod_schema.tables]
+        if uncertain:
+            live = self.get_schema(tables=uncertain)
+            for table in uncertain:
+                if table in live.tables:
+                    prod_schema.tables[table] = live.tables[table]
+                else:
+                    del prod_schema.tables[table]
+        self.journal = previous
+        self.shadowed_tables = {operation.split(':', 1)[1] for operation, record in previous.done.items()
+                                if record.get('algorithm') == 'SHADOW'}
+        print(f'Продолжаю прерванную миграцию по журналу {path}: выполнено операций {len(previous.done)}, '
+              f'перечитаны таблицы незавершенных операций: {uncertain}')
+        #
+        return test_schema, prod_schema
+
+    def _load_schemas(self, test_db: Union[TestManager, schema.SchemaSnapshot]):
+        """
+        Загрузка структур тестовой и боевой БД. В инкрементальном режиме сначала сравниваются отпечатки таблиц:
+        совпадающие таблицы не загружаются вовсе, а описания остальных по возможности берутся из локального кэша
+        :param test_db: БД-донор (экземпляр класса менеджера) или снимок ее структуры
+        :return: кортеж (структура тестовой БД, структура боевой БД)
+        """
+        if isinstance(test_db, schema.SchemaSnapshot):
+            return test_db, self.get_schema()
+        if not self.sync_config.incremental:
+            return test_db.get_schema(), self.get_schema()
+
+        cache = fingerprint.FingerprintCache(self.sync_config.fingerprint_cache)
+        test_fingerprints = test_db.get_fingerprints()
+        prod_fingerprints = self.get_fingerprints()
+        skipped = {table for table, fp in test_fingerprints.items() if prod_fingerprints.get(table) == fp}
+        for table in skipped:
+            cache.keep(test_fingerprints[table])
+
+        # удаляемым таблицам боевой БД описание не нужно - для графа зависимостей хватает внешних ключей
+        test_needed = [table for table in test_fingerprints if table not in skipped]
+        prod_needed = [table for table in prod_fingerprints if table not in skipped and table in test_fingerprints]
+
+        snapshots = []
+        for db, fingerprints, needed in ((test_db, test_fingerprints, test_needed),
+                                         (self, prod_fingerprints, prod_needed)):
+            snapshot = db.get_schema(tables=cache.missing(fingerprints, needed))
+            for table in needed:
+                fp = fingerprints[table]
+                if table in snapshot.partial:
+                    cached = cache.get(fp)
+                    cached.stats = snapshot.tables[table].stats
+                    snapshot.tables[table] = cached
+                    snapshot.partial.remove(table)
+                else:
+                    cache.put(fp, snapshot.tables[table])
+            snapshots.append(snapshot)
+        cache.save()
+        #
+        return tuple(snapshots)
+
+    def compare_and_fit(self, test_db: Union[TestManager, schema.SchemaSnapshot]):
         """
         Комплекс операций по сравнению текущей БД (боевой) с заданной тестовой и приведению к единому виду.
-        :param test_db: БД-донор / тестовая БД (экземпляр класса менеджера)
+        :param test_db: БД-донор / тестовая БД (экземпляр класса менеджера) или снимок ее структуры -
+            в этом случае к тестовому серверу обращений нет
+        :return: план миграции
         """
         print('\nНачинаем сравнивать и приводить боевую БД к виду тестовой')
+        # итоги предыдущего запуска на этом же менеджере не переносятся в новый
+        self.ddl_log = []
+        self.errors = {}
+        self.shadowed_tables = set()
+        self.empty_tables = set()
+        self.budget_exceeded = False
+        # структура могла измениться между запусками - определения таблиц читаются заново
+        self.definitions.invalidate()
+        if not isinstance(test_db, schema.SchemaSnapshot):
+            test_db.definitions.invalidate()
 
-        # сбор данных о структуре баз
-        test_structure = test_db.get_structure()
-        prod_structure = self.get_structure()
-
-        print(f'Тестовая БД состоит из {len(test_structure)} таблиц: {sorted(test_structure.keys())}')
-        print(f'Боевая БД состоит из {len(prod_structure)} таблиц: {sorted(prod_structure.keys())}')
-
-        # В prod нет таблицы которая появилась в test - копируем
-        added_tables = set(test_structure) - set(prod_structure)
-        if added_tables:
-            print(f'Добавленных таблиц в тестовую БД: [{len(added_tables)}]. Создаю их на боевой версии.')
-            for table in added_tables:
-                self.copy_table(table_name=table, source_db=test_db)
-                print(' '*3, 'Создана:', table)
-
-        # В prod есть таблица которой уже нет в test - удаляем
-        dropped_tables = set(prod_structure) - set(test_structure)
-        if dropped_tables:
-            print(f'Удаленных таблиц в тестовой БД: [{len(dropped_tables)}]. Пробую удалить их с боевой.')
-            for table in dropped_tables:
-                is_dropped, _ = self._drop_table(table)
-                if is_dropped:
-                    print(' '*3, 'Удалил:', table)
-                else:
+        # сбор данных о структуре баз: по несколько запросов к information_schema на каждую БД
+        started = time.perf_counter()
+        with self.metrics.phase('introspection'):
+            resumed = self._resume_journal(test_db) if self.sync_config.journal_path else None
+            test_schema, prod_schema = resumed or self._load_schemas(test_db)
+        migration = plan.build_plan(source=test_schema, target=prod_schema, renames=self.sync_config.renames,
+                                    detect_renames=self.sync_config.detect_renames)
+        print(f'Сравнение структур заняло {time.perf_counter() - started:.2f} с, '
+              f'пропущено таблиц с совпадающими отпечатками: {len(migration.skipped_tables)}')
+        if isinstance(test_db, schema.SchemaSnapshot) or not self.sync_config.copy_data:
+            self.empty_tables = set(migration.added_tables)
+        self._hold_foreign_keys(migration)
+
+        print(f'Тестовая БД состоит из {len(test_schema.tables)} таблиц: {sorted(test_schema.tables.keys())}')
+        print(f'Боевая БД состоит из {len(prod_schema.tables)} таблиц: {sorted(prod_schema.tables.keys())}')
+
+        # оценка стоимости операций до каких-либо изменений: по размеру таблиц, алгоритму и числу индексов
+        shadow_copy = self.sync_config.online_ddl and self.sync_config.shadow_copy and not self.sync_config.allow_copy
+        estimates = cost.estimate_plan(migration, test_schema, prod_schema,
+                                       validate_foreign_keys=self.sync_config.validate_foreign_keys,
+                                       shadow_copy=shadow_copy)
+        costs = {estimate.table: estimate for estimate in estimates if estimate.operation == 'alter'}
+        print('Оценка стоимости операций:')
+        print('\n'.join(cost.describe_estimates(estimates)))
+        lanes = []
+        projected = sum(estimate.seconds for estimate in estimates)
+        if self.sync_config.workers > 1 and costs:
+            groups = plan.group_linked_tables(list(costs), test_schema, prod_schema)
+            lanes, makespan = cost.schedule_groups(groups, costs, min(self.sync_config.workers, len(groups)))
+            projected += makespan - sum(estimate.seconds for estimate in costs.values())
+            print(f'Ожидаемое время с учетом параллельной обработки: ~{projected:.1f} с')
+        if self.sync_config.cost_budget and projected > self.sync_config.cost_budget:
+            print(f'Оценка времени (~{projected:.1f} с) превышает бюджет ({self.sync_config.cost_budget} с), '
+                  f'изменения не вносятся. Разбейте миграцию или увеличьте sync.cost_budget.')
+            self.budget_exceeded = True
+            if self.journal is not None:
+                self.journal.close()
+                self.journal = None
+            return migration
+
+        if self.sync_config.journal_path and self.journal is None:
+            self.journal = journal.MigrationJournal.create(
+                self.sync_config.journal_path, test_schema, prod_schema, self._source_state(test_db),
+                self.get_fingerprints(), plan.describe_plan(migration))
+            print(f'План миграции сохранен в журнал {self.sync_config.journal_path}')
+
+        # В prod нет таблицы которая появилась в test - копируем.
+        # Таблицы создаются без внешних ключей (они добавляются последними, вместе с остальными ключами),
+        # поэтому взаимные ссылки не мешают; порядок - по графу: сначала таблицы, на которые ссылаются
+        if migration.added_tables:
+            with self.metrics.phase('create'):
+                print(f'Добавленных таблиц в тестовую БД: [{len(migration.added_tables)}]. '
+                      f'Создаю их на боевой версии.')
+                ordered, cyclic = dependencies.creation_order(migration.added_tables,
+                                                              dependencies.get_dependencies(test_schema))
+                for table in ordered + cyclic:
+                    if self._create_table(table, test_db):
+                        print(' '*3, 'Создана:', table)
+
+        # Внешние ключи, которых нет в test (или которые изменились), удаляются до остальных изменений:
+        # они могут ссылаться на удаляемые таблицы или опираться на удаляемые столбцы и индексы
+        if migration.foreign_key_drops:
+            print(f'Удаляемых внешних ключей в таблицах: [{len(migration.foreign_key_drops)}].')
+            self._apply_foreign_keys(migration.foreign_key_drops)
+
+        # В prod есть таблица которой уже нет в test - удаляем.
+        # Таблицы, на которые ссылаются остающиеся таблицы, не трогаем, остальные удаляем пакетами
+        if migration.dropped_tables:
+            with self.metrics.phase('drop'):
+                print(f'Удаленных таблиц в тестовой БД: [{len(migration.dropped_tables)}]. '
+                      f'Пробую удалить их с боевой.')
+                dropped_fks = {table: {change.name for change in table_change.changes}
+                               for table, table_change in migration.foreign_key_drops.items()}
+                prod_graph = dependencies.get_dependencies(prod_schema, exclude=dropped_fks)
+                blocked = dependencies.blocked_drops(migration.dropped_tables, prod_graph)
+                for table, children in blocked.items():
                     print(' '*3, 'Не удалось удалить таблицу в автоматическом режиме:', table,
-                          'вероятно наличие связанных данных и требуется внимание разработчика.')
+                          f'на нее ссылаются таблицы {children}, требуется внимание разработчика.')
+                droppable = [table for table in migration.dropped_tables if table not in blocked]
+                for batch in dependencies.drop_batches(droppable, prod_graph):
+                    batch = [table for table in batch if not self._journal_done(f'drop:{table}')]
+                    if not batch:
+                        continue
+                    for table in batch:
+                        self._journal_start(f'drop:{table}', [table])
+                    is_dropped, exp = self._drop_tables_batch(batch)
+                    if is_dropped:
+                        self._journal_complete([f'drop:{table}' for table in batch], batch)
+                        print(' '*3, 'Удалил:', ', '.join(batch))
+                    else:
+                        print(' '*3, 'Не удалось удалить таблицы в автоматическом режиме:', ', '.join(batch),
+                              f'({exp}), требуется внимание разработчика.')
 
         # Таблицы которые есть в обеих базах необходимо проверить на единообразие полей (столбцов)
-        intersecting_tables = set(test_structure) & set(prod_structure)
-        print(f'Общих таблиц в тестовой и боевой БД: [{len(intersecting_tables)}]. Проверяю столбцы.')
-        for table in intersecting_tables:
-            # На уровне столбцов та же история: новый / удаленный / измененный столбец
-            print(' '*3, 'В таблице', table, ':')
-            test_columns = test_structure[table]['columns']
-            prod_columns = prod_structure[table]['columns']
-
-            # Столбец который появился в test и отсутствует в prod - добавляем
-            added_columns = set(test_columns) - set(prod_columns)
-            for column in added_columns:
-                self.copy_column(column=column, table=table, source_bd=test_db)
-                print(' '*6, 'Скопировал столбец', column, 'в таблицу', table)
-
-            # Столбец который был удален из test, но еще есть на prod - удаляем
-            dropped_columns = set(prod_columns) - set(test_columns)
-            for column in dropped_columns:
-                self._drop_column(table, column)
-                print(' '*6, 'Удалил столбец', column, 'таблицы', table)
-
-            # Столбцы которые есть и там и там нужно проверить на одинаковость параметров и в случае различий
-            # привести к виду test-столбца
-            intersecting_columns = set(test_columns) & set(prod_columns)
-            for column in intersecting_columns:
-                column_signature_test = self.get_column_signature(column, table, test_db)
-                column_signature_prod = self.get_column_signature(column, table, self)
-                if column_signature_prod != column_signature_test:
-                    print(' '*6, 'Нужно заменить столбец', column, 'таблицы', table)
-                    print(' '*6, column_signature_prod, '-->', column_signature_test)
-                    #
-                    self._change_column(table, column_signature_test)
+        print(f'Общих таблиц в тестовой и боевой БД: [{len(migration.intersecting_tables)}]. Проверяю столбцы.')
+        if lanes:
+            self._sync_tables_parallel(lanes, migration, test_schema, prod_schema)
+        else:
+            # сначала мгновенные изменения, затем по возрастанию стоимости
+            with self.metrics.phase('alter'):
+                for table in cost.order_tables(migration.intersecting_tables, costs):
+                    print('\n'.join(self._sync_table(table, migration, test_schema, prod_schema)))
+
+        # Новые внешние ключи создаются последними, когда все столбцы и индексы уже на месте:
+        # по одному ALTER TABLE на таблицу, чтобы проверка существующих строк выполнялась один раз
+        if migration.foreign_key_adds:
+            print(f'Добавляемых внешних ключей в таблицах: [{len(migration.foreign_key_adds)}].')
+            self._apply_foreign_keys(migration.foreign_key_adds, adding=True)
+
+        if migration.saved_statements:
+            print(f'\nВсего сэкономлено запросов ALTER TABLE: {migration.saved_statements}')
+        if self.throttle is not None and self.throttle.pauses:
+            print(f'Пауз из-за нагрузки на сервер: {self.throttle.pauses}, '
+                  f'общее ожидание: {self.throttle.waited:.1f} с')
+        print('\n'.join(self.metrics.describe()))
+        if not isinstance(test_db, schema.SchemaSnapshot):
+            print(f'Кэш определений таблиц тестовой БД: {test_db.definitions.describe()}')
+        print(f'Кэш определений таблиц боевой БД: {self.definitions.describe()}')
+        if self.sync_config.metrics_path:
+            self.metrics.export(self.sync_config.metrics_path)
+            print(f'Метрики запросов сохранены в {self.sync_config.metrics_path}')
+        if self.journal is not None:
+            # при ошибках журнал остается: повторный запуск продолжит с незавершенных операций
+            self.journal.close(remove=not self.errors)
+            self.journal = None
         #
+        if self.errors:
+            print(f'\nНе удалось изменить таблиц: [{len(self.errors)}], требуется внимание разработчика')
+            for table, exp in self.errors.items():
+                print(' '*3, table, ':', exp)
+            return migration
         print('\n\nГотово! Теперь структура боевой БД приведена к виду тестовой!')
+        return migration
 
 
 class MergeManager:
@@ -353,12 +1014,135 @@ class MergeManager:
         """ Запуск процесса сверки и слияния структур БД"""
         self.db_prod.compare_and_fit(test_db=self.db_test)
 
+    def merge_from_snapshot(self, snapshot_path: str):
+        """
+        Слияние по сохраненному снимку структуры тестовой БД, без подключения к тестовому серверу
+        :param snapshot_path: путь к файлу снимка
+        """
+        self.db_prod.compare_and_fit(test_db=schema.load_snapshot(snapshot_path))
+
+    @staticmethod
+    def _sync_shard(shard_config: DatabaseConfig, sync_config: SyncConfig,
+                    test_schema: schema.SchemaSnapshot) -> ShardResult:
+        """
+        Синхронизация одного шарда по общей структуре образца на собственном соединении
+        :param shard_config: параметры подключения к шарду
+        :param sync_config: настройки синхронизации
+        :param test_schema: структура тестовой БД (загружается один раз на все шарды)
+        :return: итог синхронизации шарда
+        """
+        result = ShardResult(shard=f'{shard_config.host}:{shard_config.port}/{shard_config.database}')
+        suffix = f'{shard_config.host}_{shard_config.port}_{shard_config.database}'
+        if sync_config.journal_path:
+            # у каждого шарда свой журнал миграции
+            sync_config = replace(sync_config, journal_path=f'{sync_config.journal_path}.{suffix}')
+        if sync_config.metrics_path:
+            # и свой файл метрик: имя шарда вставляется перед расширением
+            base, extension = os.path.splitext(sync_config.metrics_path)
+            sync_config = replace(sync_config, metrics_path=f'{base}.{suffix}{extension}')
+        started = time.perf_counter()
+        db_shard = None
+        try:
+            # шарды обрабатываются одновременно - метрики каждого собираются отдельно
+            db_shard = ProdManager(shard_config.to_dict(), sync_config, query_metrics=metrics.Metrics())
+            result.migration = db_shard.compare_and_fit(test_db=test_schema)
+            result.ddl_log = db_shard.ddl_log
+            result.errors = db_shard.errors
+            result.budget_exceeded = db_shard.budget_exceeded
+        except Exception as exp:
+            result.error = exp
+        finally:
+            if db_shard is not None and db_shard.connection is not None:
+                db_shard.disconnect()
+        result.seconds = time.perf_counter() - started
+        #
+        return result
+
+    def merge_shards(self, shard_configs: List[DatabaseConfig], sync_config: SyncConfig,
+                     snapshot_path: str = None) -> List[ShardResult]:
+        """
+        Приведение нескольких боевых шардов к виду тестовой БД. Структура образца загружается один раз,
+        шарды сравниваются и изменяются одновременно (не более sync.shard_workers), ошибка одного шарда
+        не прерывает остальные
+        :param shard_configs: параметры подключения к шардам
+        :param sync_config: настройки синхронизации
+        :param snapshot_path: файл снимка тестовой БД вместо подключения к ней (опционально)
+        :return: итоги по шардам
+        """
+        test_schema = schema.load_snapshot(snapshot_path) if snapshot_path else self.db_test.get_schema()
+        workers = max(min(sync_config.shard_workers, len(shard_configs)), 1)
+        print(f'Синхронизация шардов: {len(shard_configs)}, одновременно: {workers}')
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(lambda shard: self._sync_shard(shard, sync_config, test_schema),
+                                        shard_configs))
+
+        failed = [result for result in results if result.error is not None or result.errors]
+        print(f'\nИтоги по шардам: успешно {len(results) - len(failed)}, с ошибками {len(failed)}')
+        for result in results:
+            print(' '*3, result.describe())
+        #
+        return results
+
+    @staticmethod
+    def save_snapshot(db: BaseManager, snapshot_path: str):
+        """
+        Сохранение снимка структуры БД в файл
+        :param db: БД (экземпляр класса менеджера)
+        :param snapshot_path: путь к файлу снимка (.json или .json.gz)
+        """
+        snapshot = db.get_schema()
+        schema.dump_snapshot(snapshot, snapshot_path)
+        print(f'Снимок структуры БД {snapshot.database} ({len(snapshot.tables)} таблиц) сохранен в {snapshot_path}')
+
+    @staticmethod
+    def diff(source: Union[BaseManager, schema.SchemaSnapshot, str],
+             target: Union[BaseManager, schema.SchemaSnapshot, str]) -> plan.MigrationPlan:
+        """
+        Построение плана миграции между двумя структурами без внесения изменений.
+        Каждая сторона - живая БД, снимок структуры или путь к файлу снимка
+        :param source: образец (тестовая БД)
+        :param target: изменяемая БД (боевая)
+        :return: план миграции
+        """
+        snapshots = []
+        for side in (source, target):
+            if isinstance(side, str):
+                side = schema.load_snapshot(side)
+            elif isinstance(side, BaseManager):
+                side = side.get_schema()
+            snapshots.append(side)
+        migration = plan.build_plan(*snapshots)
+        print('\n'.join(plan.describe_plan(migration)))
+        #
+        return migration
+
+    @staticmethod
+    def data_diff(source: BaseManager, target: BaseManager, tables: list = None, chunk_size: int = 1000,
+                  leaf_size: int = 16) -> List[datadiff.TableDataDiff]:
+        """
+        Сравнение данных общих таблиц по контрольным суммам диапазонов первичного ключа (считаются на серверах)
+        :param source: БД-образец (тестовая)
+        :param target: сравниваемая БД (боевая)
+        :param tables: сравнить только эти таблицы (по умолчанию - все общие)
+        :param chunk_size: число строк в диапазоне верхнего уровня
+        :param leaf_size: размер диапазона, в котором различия ищутся построчно
+        :return: результаты по таблицам
+        """
+        results = datadiff.DataDiff(source, target, chunk_size=chunk_size, leaf_size=leaf_size).diff(
+            source.get_schema(tables=tables), target.get_schema(tables=tables), tables=tables)
+        for result in results:
+            print('\n'.join(result.describe()))
+        different = [result.table for result in results if not result.is_equal]
+        print(f'\nТаблиц сравнено: {len(results)}, с различиями: {len(different)} {different}')
+        #
+        return results
+
     def show_demo(self):
         """
         Демо по слиянию двух версий БД: очистка, наполнение демо-данными, изменение и слияние структур
         """
         self.db_test = TestManager(self.configs_for_demo.database_test.to_dict())
-        self.db_prod = ProdManager(self.configs_for_demo.database_prod.to_dict())
+        self.db_prod = ProdManager(self.configs_for_demo.database_prod.to_dict(), self.configs_for_demo.sync)
         #
         self.db_test.drop_tables()
         self.db_test.make_initial_tables()
@@ -0,0 +1,216 @@
+import csv
+import json
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, fields
+from typing import Callable, Dict, List, Optional
+
+
+# Длина текста запроса, сохраняемого в метриках (полные тексты ALTER TABLE и INSERT бывают огромными)
+STATEMENT_PREVIEW = 200
+
+
+@dataclass
+class QueryMetric:
+    """
+    Метрики одного запроса
+    """
+    phase: str
+    database: str
+    statement: str
+    wall_time: float = 0.0
+    round_trips: int = 1
+    rows: int = 0
+    started_at: float = 0.0
+    error: str = ''
+
+
+class Metrics:
+    """
+    Сборщик метрик запросов: время, число обращений к серверу, число строк и этап работы, к которому
+    относится запрос. Этап задается контекстным менеджером phase() отдельно в каждом потоке
+    """
+    def __init__(self):
+        self.records: List[QueryMetric] = []
+        self.hooks: List[Callable[[QueryMetric], None]] = []
+        self.phase_times: Dict[str, float] = {}
+        self.lock = threading.Lock()
+        self.local = threading.local()
+
+    @property
+    def current_phase(self) -> str:
+        stack = getattr(self.local, 'phases', None)
+        return stack[-1] if stack else ''
+
+    @contextmanager
+    def phase(self, name: str):
+        """
+        Отнесение всех запросов внутри блока к этапу name (этапы могут быть вложенными: 'sync/alter')
+        """
+        stack = getattr(self.local, 'phases', None)
+        if stack is None:
+            stack = self.local.phases = []
+        full_name = f'{stack[-1]}/{name}' if stack else name
+        stack.append(full_name)
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            stack.pop()
+            with self.lock:
+                self.phase_times[full_name] = self.phase_times.get(full_name, 0.0) + time.perf_counter() - started
+
+    def add_hook(self, hook: Callable[[QueryMetric], None]):
+        """
+        Подписка на метрики: hook вызывается после выполнения каждого запроса
+        (для SELECT число строк дописывается в метрику позже, по мере чтения результата)
+        """
+        self.hooks.append(hook)
+
+    def record(self, metric: QueryMetric):
+        with self.lock:
+            self.records.append(metric)
+        for hook in self.hooks:
+            hook(metric)
+
+    def summary(self) -> Dict[str, dict]:
+        """
+        Сводка по этапам
+        :return: словарь {этап: {queries, round_trips, rows, query_time, phase_time}}
+        """
+        result = {}
+        for metric in self.records:
+            item = result.setdefault(metric.phase, {'queries': 0, 'round_trips': 0, 'rows': 0, 'query_time': 0.0})
+            item['queries'] += 1
+            item['round_trips'] += metric.round_trips
+            item['rows'] += max(metric.rows, 0)
+            item['query_time'] += metric.wall_time
+        for phase, seconds in self.phase_times.items():
+            result.setdefault(phase, {'queries': 0, 'round_trips': 0, 'rows': 0, 'query_time': 0.0})
+            result[phase]['phase_time'] = seconds
+        #
+        return result
+
+    def slowest(self, limit: int = 10) -> List[QueryMetric]:
+        return sorted(self.records, key=lambda metric: metric.wall_time, reverse=True)[:limit]
+
+    def describe(self, limit: int = 5) -> List[str]:
+        """
+        Текстовый отчет: сводка по этапам и самые медленные запросы
+        :param limit: число медленных запросов в отчете
+        :return: строки отчета
+        """
+        lines = ['Метрики запросов по этапам:']
+        for phase, item in sorted(self.summary().items()):
+            lines.append(' '*4 + f'{phase or "-"}: запросов {item["queries"]}, обращений {item["round_trips"]}, '
+                                 f'строк {item["rows"]}, время запросов {item["query_time"]:.3f} с'
+                                 + (f', время этапа {item["phase_time"]:.3f} с' if 'phase_time' in item else ''))
+        lines.append('Самые медленные запросы:')
+        for metric in self.slowest(limit):
+            lines.append(' '*4 + f'{metric.wall_time:.3f} с [{metric.phase or "-"}] {metric.statement[:100]}')
+        #
+        return lines
+
+    def to_json(self, path: str):
+        """ Выгрузка метрик и сводки по этапам в JSON """
+        with open(path, mode='w', encoding='utf-8') as f:
+            json.dump({'summary': self.summary(), 'queries': [asdict(metric) for metric in self.records]},
+                      f, ensure_ascii=False, indent=2)
+
+    def to_csv(self, path: str):
+        """ Выгрузка метрик запросов в CSV (одна строка на запрос) """
+        with open(path, mode='w', encoding='utf-8', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=[item.name for item in fields(QueryMetric)])
+            writer.writeheader()
+            for metric in self.records:
+                writer.writerow(asdict(metric))
+
+    def export(self, path: str):
+        """ Выгрузка в формате по расширению файла: .csv или .json """
+        if path.endswith('.csv'):
+            self.to_csv(path)
+        else:
+            self.to_json(path)
+
+    def reset(self):
+        with self.lock:
+            self.records = []
+            self.phase_times = {}
+
+
+# Общий сборщик метрик: по умолчанию его используют все менеджеры
+default_metrics = Metrics()
+
+
+class InstrumentedCursor:
+    """
+    Обертка курсора, записывающая метрики каждого запроса. Остальные методы и свойства курсора
+    доступны без изменений
+    """
+    def __init__(self, cursor, metrics: Metrics = None, database: str = ''):
+        self._cursor = cursor
+        self._metrics = metrics or default_metrics
+        self._database = database
+        self._last: Optional[QueryMetric] = None
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def _run(self, method, query: str, params, round_trips: int):
+        metric = QueryMetric(phase=self._metrics.current_phase, database=self._database,
+                             statement=' '.join(str(query).split())[:STATEMENT_PREVIEW],
+                             round_trips=round_trips, started_at=time.time())
+        started = time.perf_counter()
+        try:
+            return method(query, params) if params is not None else method(query)
+        except Exception as exp:
+            metric.error = str(exp)
+            raise
+        finally:
+            metric.wall_time = time.perf_counter() - started
+            metric.rows = max(self._cursor.rowcount or 0, 0)
+            self._last = metric
+            self._metrics.record(metric)
+
+    def execute(self, query: str, params=None):
+        return self._run(self._cursor.execute, query, params, round_trips=1)
+
+    def execute_multi(self, query: str):
+        """ Несколько запросов через ';' одним обращением к серверу; результаты всех запросов вычитываются сразу """
+        return self._run(lambda statements: list(self._cursor.execute(statements, multi=True)), query, None,
+                         round_trips=1)
+
+    def executemany(self, query: str, params):
+        # INSERT/REPLACE драйвер склеивает в один многострочный запрос, прочие запросы отправляются по одному
+        batched = query.lstrip().upper().startswith(('INSERT', 'REPLACE'))
+        return self._run(self._cursor.executemany, query, params, round_trips=1 if batched else len(params))
+
+    def _fetched(self, started: float, rows: int = 0):
+        """ Учет чтения результата: время и число прочитанных строк дописываются в метрику последнего запроса """
+        if self._last is not None:
+            self._last.wall_time += time.perf_counter() - started
+            self._last.rows = max(self._last.rows, self._cursor.rowcount or 0, rows)
+
+    def fetchone(self):
+        started = time.perf_counter()
+        row = self._cursor.fetchone()
+        self._fetched(started, rows=int(row is not None))
+        return row
+
+    def fetchmany(self, size: int = 1):
+        started = time.perf_counter()
+        rows = self._cursor.fetchmany(size)
+        if self._last is not None:
+            self._last.wall_time += time.perf_counter() - started
+            self._last.rows += len(rows)
+        return rows
+
+    def fetchall(self):
+        started = time.perf_counter()
+        rows = self._cursor.fetchall()
+        self._fetched(started, rows=len(rows))
+        return rows
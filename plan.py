@@ -0,0 +1,363 @@
+from dataclasses import dataclass, field
+from typing import Dict, List, Union
+
+import column_def
+from schema import ForeignKeyInfo, IndexInfo, SchemaSnapshot, TableInfo, quote_name
+
+
+@dataclass
+class ColumnChange:
+    """
+    Отдельное изменение столбца: добавление, удаление, переименование или изменение параметров
+    """
+    action: str  # 'add' | 'drop' | 'modify' | 'rename'
+    column: str
+    definition: str = ''
+    previous: str = ''
+    differences: List[str] = field(default_factory=list)
+    old_name: str = ''
+
+    def to_sql(self) -> str:
+        """ Фрагмент ALTER TABLE для этого изменения """
+        if self.action == 'add':
+            return f'ADD COLUMN {self.definition}'
+        if self.action == 'drop':
+            return f'DROP COLUMN {quote_name(self.column)}'
+        if self.action == 'rename':
+            if self.differences:
+                # переименование с одновременным изменением параметров
+                return f'CHANGE COLUMN {quote_name(self.old_name)} {self.definition}'
+            # только метаданные: данные столбца сохраняются, таблица не перестраивается
+            return f'RENAME COLUMN {quote_name(self.old_name)} TO {quote_name(self.column)}'
+        return f'MODIFY COLUMN {self.definition}'
+
+
+@dataclass
+class IndexChange:
+    """
+    Добавление или удаление индекса (первичного, уникального, обычного)
+    """
+    action: str  # 'add' | 'drop'
+    name: str
+    definition: str = ''
+
+    def to_sql(self) -> str:
+        """ Фрагмент ALTER TABLE для этого изменения """
+        if self.action == 'add':
+            return f'ADD {self.definition}'
+        if self.name == 'PRIMARY':
+            return 'DROP PRIMARY KEY'
+        return f'DROP INDEX {quote_name(self.name)}'
+
+
+@dataclass
+class ForeignKeyChange:
+    """
+    Добавление или удаление внешнего ключа
+    """
+    action: str  # 'add' | 'drop'
+    name: str
+    definition: str = ''
+
+    def to_sql(self) -> str:
+        """ Фрагмент ALTER TABLE для этого изменения """
+        if self.action == 'add':
+            return f'ADD {self.definition}'
+        return f'DROP FOREIGN KEY {quote_name(self.name)}'
+
+
+@dataclass
+class TableChange:
+    """
+    Все изменения одной таблицы, которые выполняются единым ALTER TABLE
+    """
+    table: str
+    changes: List[Union[ColumnChange, IndexChange, ForeignKeyChange]] = field(default_factory=list)
+    # неоднозначные случаи, которые не выполняются автоматически и требуют решения разработчика
+    review: List[str] = field(default_factory=list)
+
+    def clauses(self) -> List[str]:
+        return [change.to_sql() for change in self.changes]
+
+    def to_sql(self) -> str:
+        """ Объединенный запрос ALTER TABLE t ADD ..., DROP ..., MODIFY ... """
+        return f"ALTER TABLE {quote_name(self.table)} {', '.join(self.clauses())}"
+
+    @property
+    def saved_statements(self) -> int:
+        """ Сколько отдельных ALTER TABLE сэкономлено объединением изменений """
+        return max(len(self.changes) - 1, 0)
+
+
+@dataclass
+class MigrationPlan:
+    """
+    План приведения целевой БД к виду БД-образца
+    """
+    added_tables: List[str] = field(default_factory=list)
+    dropped_tables: List[str] = field(default_factory=list)
+    intersecting_tables: List[str] = field(default_factory=list)
+    table_changes: Dict[str, TableChange] = field(default_factory=dict)
+    # внешние ключи удаляются до всех остальных изменений (они могут мешать удалению столбцов, индексов
+    # и таблиц), а создаются после них - когда все столбцы и индексы уже на месте
+    foreign_key_drops: Dict[str, TableChange] = field(default_factory=dict)
+    foreign_key_adds: Dict[str, TableChange] = field(default_factory=dict)
+    # общие таблицы, не сравнивавшиеся из-за совпадения отпечатков структуры
+    skipped_tables: List[str] = field(default_factory=list)
+
+    @property
+    def saved_statements(self) -> int:
+        changes = [*self.table_changes.values(), *self.foreign_key_drops.values(), *self.foreign_key_adds.values()]
+        return sum(change.saved_statements for change in changes)
+
+    @property
+    def review(self) -> List[str]:
+        return [f'{table}: {item}' for table, change in self.table_changes.items() for item in change.review]
+
+
+def _column_signature(table: TableInfo, column: str) -> tuple:
+    """ Семантическая сигнатура столбца без учета имени - для поиска переименованных столбцов """
+    return column_def.normalize_column(table.columns[column], table.collation)
+
+
+def detect_renames(source: TableInfo, target: TableInfo, added: List[str], dropped: List[str],
+                   explicit: Dict[str, str] = None):
+    """
+    Поиск переименованных столбцов среди добавленных и удаленных
+    :param source: таблица из БД-образца (тестовой)
+    :param target: таблица из целевой БД (боевой)
+    :param added: столбцы, которых нет в целевой таблице
+    :param dropped: столбцы, которых нет в образце
+    :param explicit: явно заданные переименования {старое имя: новое имя}
+    :return: кортеж (словарь {старое имя: новое имя}, словарь неоднозначных случаев {старое имя: кандидаты})
+    """
+    renames = {}
+    ambiguous = {}
+    for old, new in (explicit or {}).items():
+        if old in dropped and new in added:
+            renames[old] = new
+
+    # автоматически: совпадение сигнатуры и позиции в таблице. Совпадение одной сигнатуры не доказывает
+    # переименование (удален один столбец и добавлен другой того же типа) - такие пары идут на проверку
+    free_added = [column for column in added if column not in renames.values()]
+    free_dropped = [column for column in dropped if column not in renames]
+    for old in free_dropped:
+        signature = _column_signature(target, old)
+        candidates = [new for new in free_added if _column_signature(source, new) == signature]
+        if not candidates:
+            continue
+        match = [new for new in candidates if source.columns[new].position == target.columns[old].position]
+        if len(match) == 1:
+            renames[old] = match[0]
+            free_added.remove(match[0])
+        else:
+            ambiguous[old] = candidates
+    #
+    return renames, ambiguous
+
+
+def _index_signature(index: IndexInfo, renames: Dict[str, str]) -> tuple:
+    """ Сигнатура индекса для сравнения (столбцы целевой таблицы - с учетом переименований) """
+    columns = tuple(renames.get(column, column) for column in index.columns)
+    return columns, tuple(index.sub_parts), tuple(index.descending), index.is_unique, index.index_type
+
+
+def _foreign_key_signature(fk: ForeignKeyInfo, renames: Dict[str, str]) -> tuple:
+    """ Сигнатура внешнего ключа для сравнения (столбцы целевой таблицы - с учетом переименований) """
+    columns = tuple(renames.get(column, column) for column in fk.columns)
+    return columns, fk.ref_table, tuple(fk.ref_columns), fk.on_update, fk.on_delete
+
+
+def diff_indexes(source: TableInfo, target: TableInfo, renames: Dict[str, str] = None) -> List[IndexChange]:
+    """
+    Сравнение индексов таблицы-образца и целевой таблицы. Измененный индекс пересоздается
+    (удаление и добавление в одном ALTER TABLE)
+    :param source: таблица из БД-образца (тестовой)
+    :param target: таблица из целевой БД (боевой)
+    :param renames: переименования столбцов целевой таблицы {старое имя: новое имя}
+    :return: список изменений индексов
+    """
+    renames = renames or {}
+    drops, adds = [], []
+    for name, index in target.indexes.items():
+        if name not in source.indexes or \
+                _index_signature(source.indexes[name], {}) != _index_signature(index, renames):
+            drops.append(IndexChange('drop', name))
+    for name, index in source.indexes.items():
+        if name not in target.indexes or any(drop.name == name for drop in drops):
+            adds.append(IndexChange('add', name, definition=index.to_sql()))
+    #
+    return drops + adds
+
+
+def diff_foreign_keys(source: TableInfo, target: TableInfo, renames: Dict[str, str] = None):
+    """
+    Сравнение внешних ключей таблицы-образца и целевой таблицы
+    :param source: таблица из БД-образца (тестовой)
+    :param target: таблица из целевой БД (боевой)
+    :param renames: переименования столбцов целевой таблицы {старое имя: новое имя}
+    :return: кортеж (удаляемые внешние ключи, добавляемые внешние ключи)
+    """
+    renames = renames or {}
+    drops = [ForeignKeyChange('drop', name) for name, fk in target.foreign_keys.items()
+             if name not in source.foreign_keys
+             or _foreign_key_signature(source.foreign_keys[name], {}) != _foreign_key_signature(fk, renames)]
+    dropped = {drop.name for drop in drops}
+    adds = [ForeignKeyChange('add', name, definition=fk.to_sql()) for name, fk in source.foreign_keys.items()
+            if name not in target.foreign_keys or name in dropped]
+    #
+    return drops, adds
+
+
+def diff_table(source: TableInfo, target: TableInfo, renames: Dict[str, str] = None,
+               detect: bool = True) -> TableChange:
+    """
+    Сравнение столбцов таблицы-образца и целевой таблицы
+    :param source: таблица из БД-образца (тестовой)
+    :param target: таблица из целевой БД (боевой)
+    :param renames: явно заданные переименования столбцов {старое имя: новое имя}
+    :param detect: искать переименования автоматически (по сигнатуре и позиции столбца)
+    :return: набор изменений для целевой таблицы
+    """
+    change = TableChange(table=source.name)
+    added = [column for column in source.columns if column not in target.columns]
+    dropped = [column for column in target.columns if column not in source.columns]
+
+    # Пара "удаленный + добавленный" столбец с одинаковой сигнатурой и позицией - это переименование:
+    # вместо копирования и удаления (две перестройки таблицы и потеря данных) - один RENAME COLUMN
+    if detect:
+        found, held = detect_renames(source, target, added, dropped, renames)
+    else:
+        found, held = {old: new for old, new in (renames or {}).items() if old in dropped and new in added}, {}
+    for old, candidates in held.items():
+        change.review.append(f'столбец {old} мог быть переименован в один из {candidates} - не удаляю, '
+                             f'укажите переименование явно (sync.renames) или удалите столбец вручную')
+    for old, new in found.items():
+        differences = column_def.column_differences(source.columns[new], source.collation,
+                                                    target.columns[old], target.collation)
+        change.changes.append(ColumnChange('rename', new, definition=source.column_sql(new),
+                                           previous=target.column_sql(old), differences=differences,
+                                           old_name=old))
+
+    # Столбец который появился в образце и отсутствует в целевой таблице - добавляем
+    for column in added:
+        if column not in found.values():
+            change.changes.append(ColumnChange('add', column, definition=source.column_sql(column)))
+
+    # Столбец который был удален из образца, но еще есть в целевой таблице - удаляем
+    # (кроме неоднозначных кандидатов на переименование - они остаются до решения разработчика)
+    for column in dropped:
+        if column not in found and column not in held:
+            change.changes.append(ColumnChange('drop', column))
+
+    # Общие столбцы приводим к виду столбца-образца, если они различаются по существу: расхождения
+    # в написании (ширина int, неявный charset, DEFAULT NULL, версия сервера) не приводят к MODIFY COLUMN
+    for column in source.columns:
+        if column in target.columns:
+            differences = column_def.column_differences(source.columns[column], source.collation,
+                                                        target.columns[column], target.collation)
+            if differences:
+                change.changes.append(ColumnChange('modify', column,
+                                                   definition=source.column_sql(column),
+                                                   previous=target.column_sql(column),
+                                                   differences=differences))
+
+    # Все добавления и удаления индексов - в том же ALTER TABLE, вторичные индексы строятся за один проход
+    change.changes.extend(diff_indexes(source, target, renames=found))
+    #
+    return change
+
+
+def build_plan(source: SchemaSnapshot, target: SchemaSnapshot, renames: Dict[str, Dict[str, str]] = None,
+               detect_renames: bool = True) -> MigrationPlan:
+    """
+    Построение плана миграции по двум моделям структуры БД (без обращений к серверу)
+    :param source: структура БД-образца (тестовой)
+    :param target: структура целевой БД (боевой)
+    :param renames: явно заданные переименования столбцов {таблица: {старое имя: новое имя}}
+    :param detect_renames: искать переименования столбцов автоматически
+    :return: план миграции
+    """
+    plan = MigrationPlan(
+        added_tables=sorted(set(source.tables) - set(target.tables)),
+        dropped_tables=sorted(set(target.tables) - set(source.tables)),
+        intersecting_tables=sorted(set(source.tables) & set(target.tables)),
+    )
+    # новые таблицы создаются без внешних ключей - ключи добавляются вместе с остальными в конце,
+    # когда все таблицы, на которые они ссылаются, уже существуют
+    for table in plan.added_tables:
+        fk_adds = [ForeignKeyChange('add', name, definition=fk.to_sql())
+                   for name, fk in source.tables[table].foreign_keys.items()]
+        if fk_adds:
+            plan.foreign_key_adds[table] = TableChange(table=table, changes=fk_adds)
+    for table in plan.intersecting_tables:
+        if table in source.partial or table in target.partial:
+            plan.skipped_tables.append(table)
+            continue
+        change = diff_table(source.tables[table], target.tables[table],
+                            renames=(renames or {}).get(table), detect=detect_renames)
+        if change.changes or change.review:
+            plan.table_changes[table] = change
+
+        found = {c.old_name: c.column for c in change.changes
+                 if isinstance(c, ColumnChange) and c.action == 'rename'}
+        fk_drops, fk_adds = diff_foreign_keys(source.tables[table], target.tables[table], renames=found)
+        if fk_drops:
+            plan.foreign_key_drops[table] = TableChange(table=table, changes=fk_drops)
+        if fk_adds:
+            plan.foreign_key_adds[table] = TableChange(table=table, changes=fk_adds)
+    #
+    return plan
+
+
+def group_linked_tables(tables: List[str], *snapshots: SchemaSnapshot) -> List[List[str]]:
+    """
+    Разбиение таблиц на группы, связанные внешними ключами хотя бы в одной из структур.
+    Таблицы разных групп независимы и могут изменяться параллельно
+    :param tables: имена таблиц
+    :param snapshots: структуры БД, из которых берутся внешние ключи
+    :return: список групп (порядок таблиц внутри группы сохраняется)
+    """
+    parent = {table: table for table in tables}
+
+    def find(table):
+        while parent[table] != table:
+            parent[table] = parent[parent[table]]
+            table = parent[table]
+        return table
+
+    for snapshot in snapshots:
+        for table in tables:
+            info = snapshot.tables.get(table)
+            if info is None:
+                continue
+            for fk in info.foreign_keys.values():
+                if fk.ref_table in parent:
+                    parent[find(table)] = find(fk.ref_table)
+
+    groups = {}
+    for table in tables:
+        groups.setdefault(find(table), []).append(table)
+    #
+    return list(groups.values())
+
+
+def describe_plan(plan: MigrationPlan) -> List[str]:
+    """
+    Текстовое описание плана миграции
+    :param plan: план миграции
+    :return: строки отчета
+    """
+    lines = [f'Создать таблиц: [{len(plan.added_tables)}] {plan.added_tables}',
+             f'Удалить таблиц: [{len(plan.dropped_tables)}] {plan.dropped_tables}']
+    for title, changes in (('Удалить внешние ключи', plan.foreign_key_drops),
+                           ('Изменить таблиц', plan.table_changes),
+                           ('Добавить внешние ключи', plan.foreign_key_adds)):
+        lines.append(f'{title}: [{len(changes)}]')
+        for change in changes.values():
+            if change.changes:
+                lines.append(' '*4 + change.to_sql())
+    for item in plan.review:
+        lines.append(f'Требует проверки: {item}')
+    #
+    return lines
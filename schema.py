@@ -0,0 +1,485 @@
+import gzip
+import json
+from dataclasses import asdict, dataclass, field
+from typing import Dict, List, Optional
+
+
+# Набор set-based запросов к information_schema: каждый возвращает данные сразу по всем таблицам текущей БД,
+# поэтому число обращений к серверу не зависит от количества таблиц и столбцов.
+# Самые объемные запросы (столбцы и индексы) можно ограничить списком таблиц через {table_filter}
+SCHEMA_QUERIES = {
+    'tables': """
+        SELECT TABLE_NAME, ENGINE, TABLE_COLLATION, TABLE_ROWS, DATA_LENGTH, INDEX_LENGTH
+        FROM information_schema.TABLES
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_TYPE = 'BASE TABLE'
+    """,
+    'columns': """
+        SELECT TABLE_NAME, COLUMN_NAME, ORDINAL_POSITION, COLUMN_DEFAULT, IS_NULLABLE, DATA_TYPE, COLUMN_TYPE,
+               CHARACTER_SET_NAME, COLLATION_NAME, EXTRA, COLUMN_COMMENT, GENERATION_EXPRESSION
+        FROM information_schema.COLUMNS
+        WHERE TABLE_SCHEMA = DATABASE() {table_filter}
+        ORDER BY TABLE_NAME, ORDINAL_POSITION
+    """,
+    'indexes': """
+        SELECT TABLE_NAME, INDEX_NAME, NON_UNIQUE, SEQ_IN_INDEX, COLUMN_NAME, SUB_PART, INDEX_TYPE, COLLATION
+        FROM information_schema.STATISTICS
+        WHERE TABLE_SCHEMA = DATABASE() {table_filter}
+        ORDER BY TABLE_NAME, INDEX_NAME, SEQ_IN_INDEX
+    """,
+    'foreign_keys': """
+        SELECT k.TABLE_NAME, k.CONSTRAINT_NAME, k.COLUMN_NAME, k.REFERENCED_TABLE_NAME, k.REFERENCED_COLUMN_NAME,
+               r.UPDATE_RULE, r.DELETE_RULE
+        FROM information_schema.KEY_COLUMN_USAGE k
+        JOIN information_schema.REFERENTIAL_CONSTRAINTS r
+            ON r.CONSTRAINT_SCHEMA = k.CONSTRAINT_SCHEMA
+            AND r.CONSTRAINT_NAME = k.CONSTRAINT_NAME
+            AND r.TABLE_NAME = k.TABLE_NAME
+        WHERE k.TABLE_SCHEMA = DATABASE() AND k.REFERENCED_TABLE_NAME IS NOT NULL
+        ORDER BY k.TABLE_NAME, k.CONSTRAINT_NAME, k.ORDINAL_POSITION
+    """,
+}
+
+# Версия формата файла со снимком структуры БД
+SNAPSHOT_FORMAT = 1
+
+# Сколько таблиц проверяется на пустоту одним запросом (SELECT ... UNION ALL SELECT ...)
+EMPTINESS_BATCH = 200
+
+# Типы, значения по умолчанию для которых пишутся без кавычек
+NUMERIC_TYPES = {
+    'tinyint', 'smallint', 'mediumint', 'int', 'integer', 'bigint',
+    'decimal', 'numeric', 'float', 'double', 'real', 'bit', 'year',
+}
+
+
+def as_text(value):
+    """ Приведение значения из information_schema к строке (коннектор иногда отдает bytes) """
+    if isinstance(value, (bytes, bytearray)):
+        return value.decode()
+    return value
+
+
+def quote_name(name: str) -> str:
+    """ Экранирование имени таблицы, столбца или индекса обратными кавычками """
+    return '`' + name.replace('`', '``') + '`'
+
+
+@dataclass
+class ColumnInfo:
+    """
+    Описание столбца таблицы
+    """
+    name: str
+    position: int
+    data_type: str
+    column_type: str
+    is_nullable: bool = True
+    default: Optional[str] = None
+    extra: str = ''
+    charset: Optional[str] = None
+    collation: Optional[str] = None
+    comment: str = ''
+    generation_expression: str = ''
+
+    def _default_sql(self):
+        """ Формирование части DEFAULT для определения столбца """
+        extra = self.extra.lower()
+        if self.default is None:
+            return 'DEFAULT NULL' if self.is_nullable else ''
+        if 'default_generated' in extra:
+            # выражение по умолчанию (CURRENT_TIMESTAMP или произвольное выражение в скобках)
+            if self.default.upper().startswith('CURRENT_TIMESTAMP'):
+                return f'DEFAULT {self.default}'
+            return f'DEFAULT ({self.default})'
+        if self.data_type.lower() in NUMERIC_TYPES:
+            return f'DEFAULT {self.default}'
+        escaped = self.default.replace('\\', '\\\\').replace("'", "''")
+        return f"DEFAULT '{escaped}'"
+
+    def to_sql(self, table_collation: Optional[str] = None) -> str:
+        """
+        Формирование определения столбца в том виде, в котором его показывает SHOW CREATE TABLE
+        :param table_collation: collation таблицы; совпадающие с ним charset/collation столбца не выводятся
+        :return: строка с параметрами столбца (имя, тип, прочее)
+        """
+        parts = [quote_name(self.name), self.column_type]
+        if self.collation and self.collation != table_collation:
+            parts.append(f'CHARACTER SET {self.charset} COLLATE {self.collation}')
+
+        extra = self.extra.lower()
+        if self.generation_expression:
+            kind = 'STORED' if 'stored' in extra else 'VIRTUAL'
+            parts.append(f'GENERATED ALWAYS AS ({self.generation_expression}) {kind}')
+            if not self.is_nullable:
+                parts.append('NOT NULL')
+        else:
+            if not self.is_nullable:
+                parts.append('NOT NULL')
+            default = self._default_sql()
+            if default:
+                parts.append(default)
+            attributes = extra.replace('default_generated', '').strip()
+            if attributes:
+                parts.append(attributes)
+
+        if self.comment:
+            escaped = self.comment.replace('\\', '\\\\').replace("'", "''")
+            parts.append(f"COMMENT '{escaped}'")
+        #
+        return ' '.join(parts)
+
+
+@dataclass
+class IndexInfo:
+    """
+    Описание индекса (в т.ч. первичного и уникального ключей)
+    """
+    name: str
+    columns: List[str] = field(default_factory=list)
+    sub_parts: List[Optional[int]] = field(default_factory=list)
+    descending: List[bool] = field(default_factory=list)
+    is_unique: bool = False
+    index_type: str = 'BTREE'
+
+    @property
+    def is_primary(self):
+        return self.name == 'PRIMARY'
+
+    def _columns_sql(self):
+        """ Список столбцов индекса с длиной префикса и направлением сортировки """
+        parts = []
+        for column, sub_part, desc in zip(self.columns, self.sub_parts, self.descending):
+            part = quote_name(column)
+            if sub_part:
+                part += f'({sub_part})'
+            if desc:
+                part += ' DESC'
+            parts.append(part)
+        return ', '.join(parts)
+
+    def to_sql(self) -> str:
+        """ Определение индекса для CREATE TABLE / ALTER TABLE ADD """
+        if self.is_primary:
+            return f'PRIMARY KEY ({self._columns_sql()})'
+        if self.index_type in ('FULLTEXT', 'SPATIAL'):
+            kind = f'{self.index_type} KEY'
+        elif self.is_unique:
+            kind = 'UNIQUE KEY'
+        else:
+            kind = 'KEY'
+        return f'{kind} {quote_name(self.name)} ({self._columns_sql()})'
+
+
+@dataclass
+class ForeignKeyInfo:
+    """
+    Описание внешнего ключа
+    """
+    name: str
+    columns: List[str] = field(default_factory=list)
+    ref_table: str = ''
+    ref_columns: List[str] = field(default_factory=list)
+    on_update: str = 'RESTRICT'
+    on_delete: str = 'RESTRICT'
+
+    def to_sql(self, name: Optional[str] = None) -> str:
+        """
+        Определение внешнего ключа для CREATE TABLE / ALTER TABLE ADD
+        :param name: альтернативное имя ограничения (по умолчанию - исходное)
+        """
+        columns = ', '.join(quote_name(c) for c in self.columns)
+        ref_columns = ', '.join(quote_name(c) for c in self.ref_columns)
+        return (f'CONSTRAINT {quote_name(name or self.name)} FOREIGN KEY ({columns}) '
+                f'REFERENCES {quote_name(self.ref_table)} ({ref_columns}) '
+                f'ON DELETE {self.on_delete} ON UPDATE {self.on_update}')
+
+
+@dataclass
+class TableStats:
+    """
+    Статистика таблицы: оценки из information_schema.TABLES и точный признак пустоты
+    """
+    rows_estimate: int = 0
+    data_length: int = 0
+    index_length: int = 0
+    is_empty: Optional[bool] = None
+
+    @property
+    def total_length(self) -> int:
+        return self.data_length + self.index_length
+
+
+@dataclass
+class TableInfo:
+    """
+    Описание таблицы: столбцы (в порядке следования), индексы, внешние ключи и статистика
+    """
+    name: str
+    engine: Optional[str] = None
+    collation: Optional[str] = None
+    columns: Dict[str, ColumnInfo] = field(default_factory=dict)
+    indexes: Dict[str, IndexInfo] = field(default_factory=dict)
+    foreign_keys: Dict[str, ForeignKeyInfo] = field(default_factory=dict)
+    stats: TableStats = field(default_factory=TableStats)
+
+    def column_sql(self, column: str) -> str:
+        """ Определение столбца таблицы по его имени """
+        return self.columns[column].to_sql(self.collation)
+
+    @property
+    def primary_key(self) -> List[str]:
+        """ Столбцы первичного ключа (пустой список, если ключа нет) """
+        primary = self.indexes.get('PRIMARY')
+        return list(primary.columns) if primary else []
+
+    def to_create_sql(self, name: Optional[str] = None, constraint_prefix: str = '',
+                      foreign_keys: bool = True) -> str:
+        """
+        Формирование CREATE TABLE по модели таблицы
+        :param name: имя создаваемой таблицы (по умолчанию - имя исходной)
+        :param constraint_prefix: префикс имен внешних ключей (имена ограничений уникальны в пределах БД)
+        :param foreign_keys: включать внешние ключи (иначе они добавляются отдельным ALTER TABLE)
+        :return: строка с SQL-запросом
+        """
+        lines = [self.column_sql(column) for column in self.columns]
+        indexes = sorted(self.indexes.values(), key=lambda index: not index.is_primary)
+        lines.extend(index.to_sql() for index in indexes)
+        if foreign_keys:
+            lines.extend(fk.to_sql(name=constraint_prefix + fk.name) for fk in self.foreign_keys.values())
+
+        options = []
+        if self.engine:
+            options.append(f'ENGINE={self.engine}')
+        if self.collation:
+            options.append(f'COLLATE={self.collation}')
+        body = ',\n  '.join(lines)
+        #
+        return f"CREATE TABLE {quote_name(name or self.name)} (\n  {body}\n) {' '.join(options)}".rstrip()
+
+    def to_dict(self, stats: bool = True) -> dict:
+        """
+        Модель таблицы в словарь
+        :param stats: включать статистику (число строк и размер меняются от запуска к запуску)
+        """
+        data = asdict(self)
+        if not stats:
+            data.pop('stats')
+        return data
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'TableInfo':
+        """ Восстановление модели таблицы из словаря (см. to_dict) """
+        return cls(
+            name=data['name'],
+            engine=data.get('engine'),
+            collation=data.get('collation'),
+            columns={name: ColumnInfo(**column) for name, column in data['columns'].items()},
+            indexes={name: IndexInfo(**index) for name, index in data['indexes'].items()},
+            foreign_keys={name: ForeignKeyInfo(**fk) for name, fk in data['foreign_keys'].items()},
+            stats=TableStats(**data.get('stats', {})),
+        )
+
+
+@dataclass
+class SchemaSnapshot:
+    """
+    Структура БД целиком, собранная за несколько запросов к information_schema
+    """
+    database: str
+    tables: Dict[str, TableInfo] = field(default_factory=dict)
+    # таблицы, для которых загружены только статистика и внешние ключи (без столбцов и индексов)
+    partial: List[str] = field(default_factory=list)
+
+    def to_dict(self, stats: bool = True) -> dict:
+        if self.partial:
+            raise ValueError(f'Структура таблиц {self.partial} загружена не полностью')
+        return {
+            'format': SNAPSHOT_FORMAT,
+            'database': self.database,
+            'tables': {name: table.to_dict(stats=stats) for name, table in self.tables.items()},
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'SchemaSnapshot':
+        """ Восстановление модели структуры БД из словаря (см. to_dict) """
+        if data.get('format') != SNAPSHOT_FORMAT:
+            raise ValueError(f"Неподдерживаемый формат снимка структуры БД: {data.get('format')}")
+        return cls(
+            database=data['database'],
+            tables={name: TableInfo.from_dict(table) for name, table in data['tables'].items()},
+        )
+
+
+def dump_snapshot(snapshot: SchemaSnapshot, path: str, stats: bool = False):
+    """
+    Сохранение снимка структуры БД в файл: компактный JSON, сжатый gzip если имя оканчивается на .gz
+    :param snapshot: структура БД
+    :param path: путь к файлу
+    :param stats: сохранять статистику таблиц - без нее повторный снимок неизменной структуры
+        совпадает с прежним (удобно хранить снимок в системе контроля версий)
+    """
+    payload = json.dumps(snapshot.to_dict(stats=stats), ensure_ascii=False, separators=(',', ':'), sort_keys=True)
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, mode='wt', encoding='utf-8') as f:
+        f.write(payload)
+
+
+def load_snapshot(path: str) -> SchemaSnapshot:
+    """
+    Загрузка снимка структуры БД из файла (см. dump_snapshot)
+    :param path: путь к файлу
+    :return: датакласс со структурой БД
+    """
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, mode='rt', encoding='utf-8') as f:
+        return SchemaSnapshot.from_dict(json.load(f))
+
+
+def build_snapshot(database: str, rows: Dict[str, list]) -> SchemaSnapshot:
+    """
+    Сборка модели структуры БД из результатов запросов SCHEMA_QUERIES
+    :param database: имя БД
+    :param rows: словарь {ключ запроса: список строк результата}
+    :return: датакласс со структурой БД
+    """
+    snapshot = SchemaSnapshot(database=database)
+    tables = snapshot.tables
+
+    for table_name, engine, collation, rows_estimate, data_length, index_length in rows['tables']:
+        table_name = as_text(table_name)
+        tables[table_name] = TableInfo(name=table_name, engine=as_text(engine), collation=as_text(collation),
+                                       stats=TableStats(rows_estimate=int(rows_estimate or 0),
+                                                        data_length=int(data_length or 0),
+                                                        index_length=int(index_length or 0)))
+
+    for (table_name, column_name, position, default, is_nullable, data_type, column_type,
+         charset, collation, extra, comment, generation_expression) in rows['columns']:
+        table = tables.get(as_text(table_name))
+        if table is None:
+            # столбцы представлений (VIEW) не интересуют
+            continue
+        column_name = as_text(column_name)
+        table.columns[column_name] = ColumnInfo(
+            name=column_name,
+            position=int(position),
+            data_type=as_text(data_type),
+            column_type=as_text(column_type),
+            is_nullable=as_text(is_nullable) == 'YES',
+            default=as_text(default),
+            extra=as_text(extra) or '',
+            charset=as_text(charset),
+            collation=as_text(collation),
+            comment=as_text(comment) or '',
+            generation_expression=as_text(generation_expression) or '',
+        )
+
+    for table_name, index_name, non_unique, _, column_name, sub_part, index_type, order in rows['indexes']:
+        table = tables.get(as_text(table_name))
+        if table is None or column_name is None:
+            # функциональные индексы (без столбца) не поддерживаются
+            continue
+        index_name = as_text(index_name)
+        index = table.indexes.setdefault(index_name, IndexInfo(
+            name=index_name, is_unique=not int(non_unique), index_type=as_text(index_type)
+        ))
+        index.columns.append(as_text(column_name))
+        index.sub_parts.append(int(sub_part) if sub_part else None)
+        index.descending.append(as_text(order) == 'D')
+
+    for table_name, fk_name, column_name, ref_table, ref_column, on_update, on_delete in rows['foreign_keys']:
+        table = tables.get(as_text(table_name))
+        if table is None:
+            continue
+        fk_name = as_text(fk_name)
+        fk = table.foreign_keys.setdefault(fk_name, ForeignKeyInfo(
+            name=fk_name, ref_table=as_text(ref_table), on_update=as_text(on_update), on_delete=as_text(on_delete)
+        ))
+        fk.columns.append(as_text(column_name))
+        fk.ref_columns.append(as_text(ref_column))
+    #
+    return snapshot
+
+
+def emptiness_requests(table_names: List[str]) -> List[tuple]:
+    """
+    Запросы проверки таблиц на пустоту без полного подсчета строк: EXISTS останавливается на первой найденной
+    строке, а проверки для многих таблиц объединяются в один запрос через UNION ALL
+    :param table_names: имена таблиц
+    :return: список пар (запрос, параметры) - по одному запросу на каждые EMPTINESS_BATCH таблиц
+    """
+    requests = []
+    for start in range(0, len(table_names), EMPTINESS_BATCH):
+        batch = table_names[start:start + EMPTINESS_BATCH]
+        query = ' UNION ALL '.join(
+            f'SELECT %s, EXISTS(SELECT 1 FROM {quote_name(table)} LIMIT 1)' for table in batch
+        )
+        requests.append((query, batch))
+    #
+    return requests
+
+
+def load_emptiness(cursor, table_names: List[str]) -> Dict[str, bool]:
+    """
+    Проверка таблиц на пустоту (см. emptiness_requests)
+    :param cursor: курсор подключения к БД
+    :param table_names: имена таблиц
+    :return: словарь {таблица: пуста ли она}
+    """
+    emptiness = {}
+    for query, params in emptiness_requests(table_names):
+        cursor.execute(query, params)
+        for table_name, has_rows in cursor.fetchall():
+            emptiness[as_text(table_name)] = not bool(has_rows)
+    #
+    return emptiness
+
+
+def schema_requests(tables: Optional[List[str]] = None) -> List[tuple]:
+    """
+    Запросы загрузки структуры БД
+    :param tables: загрузить столбцы и индексы только этих таблиц (по умолчанию - всех)
+    :return: список троек (ключ запроса, запрос, параметры); запрос None - результат заведомо пуст
+    """
+    requests = []
+    for key, query in SCHEMA_QUERIES.items():
+        params = []
+        table_filter = ''
+        if tables is not None and key in ('columns', 'indexes'):
+            if not tables:
+                requests.append((key, None, params))
+                continue
+            table_filter = f"AND TABLE_NAME IN ({', '.join(['%s'] * len(tables))})"
+            params = list(tables)
+        requests.append((key, query.format(table_filter=table_filter), params))
+    #
+    return requests
+
+
+def load_schema(cursor, database: str, probe_empty: bool = True,
+                tables: Optional[List[str]] = None) -> SchemaSnapshot:
+    """
+    Загрузка структуры всей БД за фиксированное число запросов (по одному на каждый вид метаданных)
+    :param cursor: курсор подключения к БД
+    :param database: имя БД
+    :param probe_empty: проверить таблицы на пустоту (один дополнительный запрос на каждые EMPTINESS_BATCH таблиц)
+    :param tables: загрузить столбцы и индексы только этих таблиц (по умолчанию - всех);
+        статистика и внешние ключи загружаются для всех таблиц, они нужны для графа зависимостей
+    :return: датакласс со структурой БД
+    """
+    rows = {}
+    for key, query, params in schema_requests(tables):
+        if query is None:
+            rows[key] = []
+            continue
+        cursor.execute(query, params)
+        rows[key] = cursor.fetchall()
+    snapshot = build_snapshot(database, rows)
+    if tables is not None:
+        snapshot.partial = sorted(set(snapshot.tables) - set(tables))
+
+    detailed = [table for table in snapshot.tables if table not in snapshot.partial]
+    if probe_empty and detailed:
+        for table_name, is_empty in load_emptiness(cursor, detailed).items():
+            snapshot.tables[table_name].stats.is_empty = is_empty
+    #
+    return snapshot
@@ -0,0 +1,206 @@
+import time
+from typing import Callable, Dict
+
+from schema import SchemaSnapshot, TableInfo, quote_name
+
+
+# Префикс имен внешних ключей теневой таблицы: имена ограничений уникальны в пределах БД,
+# пока существует исходная таблица, ключи копии не могут называться так же
+CONSTRAINT_PREFIX = '_'
+
+
+class ShadowMigration:
+    """
+    Миграция таблицы через теневую копию: создание копии со структурой образца, перенос данных порциями
+    по первичному ключу, синхронизация изменений триггерами и атомарная подмена через RENAME TABLE.
+    Запись в таблицу во время миграции не блокируется.
+    """
+    def __init__(self, manager, source: TableInfo, target: TableInfo, target_schema: SchemaSnapshot,
+                 chunk_size: int = 1000, chunk_sleep: float = 0.0, renames: Dict[str, str] = None,
+                 load_throttle=None, checkpoint: Callable = None):
+        """
+        :param manager: менеджер целевой БД (боевой)
+        :param source: таблица-образец (из тестовой БД)
+        :param target: изменяемая таблица целевой БД
+        :param target_schema: структура целевой БД (для проверки ссылок на таблицу)
+        :param chunk_size: число строк, переносимых за один запрос
+        :param chunk_sleep: пауза между порциями в секундах
+        :param renames: переименованные столбцы {старое имя: новое имя} - их данные переносятся под новым именем
+        :param load_throttle: ограничитель нагрузки (throttle.Throttle) - проверяется перед каждой порцией
+        :param checkpoint: функция записи контрольной точки checkpoint(last_key, transient) - вызывается
+            после каждой порции (журнал миграции)
+        """
+        self.manager = manager
+        self.source = source
+        self.target = target
+        self.target_schema = target_schema
+        self.chunk_size = chunk_size
+        self.chunk_sleep = chunk_sleep
+        self.throttle = load_throttle
+        self.checkpoint = checkpoint
+        #
+        self.table = target.name
+        self.shadow_name = f'_{self.table}_new'
+        self.old_name = f'_{self.table}_old'
+        # соответствие столбцов теневой таблицы столбцам исходной {новое имя: старое имя}
+        renamed = {new: old for old, new in (renames or {}).items()}
+        self.columns = {c: c if c in target.columns else renamed[c] for c in source.columns
+                        if c in target.columns or c in renamed}
+        self.key = target.primary_key
+        self.last_key = None
+        self.copied_chunks = 0
+
+    def _trigger_name(self, event: str) -> str:
+        return f'_{self.table}_shadow_{event}'
+
+    def check(self):
+        """
+        Проверка применимости миграции через теневую таблицу
+        """
+        if not self.key:
+            raise ValueError(f'У таблицы {self.table} нет первичного ключа - порционный перенос невозможен')
+        if any(column not in self.source.columns for column in self.key):
+            raise ValueError(f'Первичный ключ таблицы {self.table} изменяется - перенос по ключу невозможен')
+        referencing = [table.name for table in self.target_schema.tables.values() if table.name != self.table
+                       and any(fk.ref_table == self.table for fk in table.foreign_keys.values())]
+        if referencing:
+            # после RENAME TABLE внешние ключи этих таблиц остались бы на старой копии
+            raise ValueError(f'На таблицу {self.table} ссылаются внешние ключи таблиц {referencing}')
+        if self.shadow_name in self.target_schema.tables or self.old_name in self.target_schema.tables:
+            raise ValueError(f'Остались таблицы от прерванной миграции: {self.shadow_name} / {self.old_name}')
+
+    def _key_list(self, prefix: str = '') -> str:
+        return ', '.join(prefix + quote_name(c) for c in self.key)
+
+    def _key_match(self, row: str) -> str:
+        """ Условие совпадения первичного ключа теневой таблицы со строкой OLD/NEW триггера """
+        return ' AND '.join(f'{quote_name(c)} = {row}.{quote_name(c)}' for c in self.key)
+
+    def create_shadow(self):
+        """ Создание теневой таблицы по образцу """
+        self.manager.send_to_db(self.source.to_create_sql(name=self.shadow_name, constraint_prefix=CONSTRAINT_PREFIX))
+
+    def create_triggers(self):
+        """ Триггеры, переносящие в теневую таблицу все изменения, сделанные во время миграции """
+        table = quote_name(self.table)
+        shadow = quote_name(self.shadow_name)
+        columns = ', '.join(quote_name(c) for c in self.columns)
+        new_values = ', '.join(f'NEW.{quote_name(c)}' for c in self.columns.values())
+        replace_new = f'REPLACE INTO {shadow} ({columns}) VALUES ({new_values})'
+        delete_old = f'DELETE IGNORE FROM {shadow} WHERE {self._key_match("OLD")}'
+
+        self.manager.send_to_db(f'CREATE TRIGGER {quote_name(self._trigger_name("ins"))} '
+                                f'AFTER INSERT ON {table} FOR EACH ROW {replace_new}')
+        self.manager.send_to_db(f'CREATE TRIGGER {quote_name(self._trigger_name("upd"))} '
+                                f'AFTER UPDATE ON {table} FOR EACH ROW BEGIN {delete_old}; {replace_new}; END')
+        self.manager.send_to_db(f'CREATE TRIGGER {quote_name(self._trigger_name("del"))} '
+                                f'AFTER DELETE ON {table} FOR EACH ROW {delete_old}')
+
+    def drop_triggers(self):
+        for event in ('ins', 'upd', 'del'):
+            self.manager.send_to_db(f'DROP TRIGGER IF EXISTS {quote_name(self._trigger_name(event))}')
+
+    def _next_bound(self):
+        """
+        Поиск верхней границы следующей порции (ключ последней строки порции)
+        :return: кортеж значений ключа или None, если оставшиеся строки умещаются в одну порцию
+        """
+        query = f'SELECT {self._key_list()} FROM {quote_name(self.table)}'
+        params = []
+        if self.last_key is not None:
+            query += f' WHERE ({self._key_list()}) > ({", ".join(["%s"] * len(self.key))})'
+            params.extend(self.last_key)
+        query += f' ORDER BY {self._key_list()} LIMIT 1 OFFSET {self.chunk_size - 1}'
+        self.manager.cursor.execute(query, params)
+        row = self.manager.cursor.fetchone()
+        return tuple(row) if row else None
+
+    def copy_chunk(self, upper):
+        """
+        Перенос одной порции строк: ключ в диапазоне (last_key, upper]
+        :param upper: верхняя граница порции (None - до конца таблицы)
+        """
+        columns = ', '.join(quote_name(c) for c in self.columns)
+        source_columns = ', '.join(quote_name(c) for c in self.columns.values())
+        placeholders = ', '.join(['%s'] * len(self.key))
+        conditions, params = [], []
+        if self.last_key is not None:
+            conditions.append(f'({self._key_list()}) > ({placeholders})')
+            params.extend(self.last_key)
+        if upper is not None:
+            conditions.append(f'({self._key_list()}) <= ({placeholders})')
+            params.extend(upper)
+        where = f" WHERE {' AND '.join(conditions)}" if conditions else ''
+
+        query = (f'INSERT LOW_PRIORITY IGNORE INTO {quote_name(self.shadow_name)} ({columns}) '
+                 f'SELECT {source_columns} FROM {quote_name(self.table)} FORCE INDEX (PRIMARY){where} '
+                 f'LOCK IN SHARE MODE')
+        self.manager.cursor.execute(query, params)
+        self.manager.connection.commit()
+        self.last_key = upper
+        self.copied_chunks += 1
+
+    def backfill(self):
+        """
+        Перенос существующих строк порциями по первичному ключу с паузой между порциями
+        и ожиданием допустимой нагрузки на сервер перед каждой порцией
+        """
+        while True:
+            if self.throttle is not None:
+                self.throttle.wait()
+            upper = self._next_bound()
+            self.copy_chunk(upper)
+            self._checkpoint()
+            if upper is None:
+                break
+            if self.chunk_sleep:
+                time.sleep(self.chunk_sleep)
+
+    def swap(self):
+        """ Атомарная подмена таблицы теневой копией и удаление старой версии """
+        self.manager.send_to_db(f'RENAME TABLE {quote_name(self.table)} TO {quote_name(self.old_name)}, '
+                                f'{quote_name(self.shadow_name)} TO {quote_name(self.table)}')
+        self.drop_triggers()
+        self.manager.send_to_db(f'DROP TABLE {quote_name(self.old_name)}')
+        self.restore_constraint_names()
+
+    def restore_constraint_names(self):
+        """
+        Возврат исходных имен внешних ключей после подмены - одним ALTER TABLE. Строки уже проверены
+        ключами теневой таблицы, поэтому ключи пересоздаются без проверки (INPLACE, без копирования)
+        """
+        foreign_keys = list(self.source.foreign_keys.values())
+        if not foreign_keys:
+            return
+        clauses = [f'DROP FOREIGN KEY {quote_name(CONSTRAINT_PREFIX + fk.name)}' for fk in foreign_keys]
+        clauses.extend(f'ADD {fk.to_sql()}' for fk in foreign_keys)
+        self.manager.send_to_db('SET FOREIGN_KEY_CHECKS = 0')
+        try:
+            self.manager.send_to_db(f"ALTER TABLE {quote_name(self.table)} {', '.join(clauses)}")
+        finally:
+            self.manager.send_to_db('SET FOREIGN_KEY_CHECKS = 1')
+
+    def _checkpoint(self):
+        if self.checkpoint is not None:
+            self.checkpoint(self.last_key, [self.shadow_name])
+
+    def run(self, resume: bool = False):
+        """
+        Полный цикл миграции. При ошибке до подмены триггеры и теневая таблица удаляются,
+        исходная таблица остается нетронутой
+        :param resume: продолжить прерванный перенос после last_key - теневая таблица и триггеры
+            остались от прерванного запуска (триггеры все это время переносили изменения)
+        """
+        self.check()
+        if not resume:
+            self.create_shadow()
+        try:
+            if not resume:
+                self.create_triggers()
+                self._checkpoint()
+            self.backfill()
+        except Exception as exp:
+            self.drop_triggers()
+            self.manager.send_to_db(f'DROP TABLE IF EXISTS {quote_name(self.shadow_name)}')
+            raise exp
+        self.swap()
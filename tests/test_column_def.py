@@ -0,0 +1,97 @@
+import pytest
+
+from column_def import column_differences, normalize_default, normalize_type
+from schema import ColumnInfo
+
+
+@pytest.mark.parametrize('column_type, expected', [
+    ('int(11)', 'int'),
+    ('INT(10) UNSIGNED', 'int unsigned'),
+    ('integer', 'int'),
+    ('tinyint(1)', 'tinyint'),
+    ('int(5) unsigned zerofill', 'int(5) unsigned zerofill'),
+    ('bigint signed', 'bigint'),
+    ('DECIMAL(10, 2)', 'decimal(10,2)'),
+    ('numeric', 'decimal(10,0)'),
+    ('double precision', 'double'),
+    ("enum('a', 'b')", "enum('a','b')"),
+    ('varchar(255)', 'varchar(255)'),
+])
+def test_normalize_type(column_type, expected):
+    assert normalize_type(column_type) == expected
+
+
+def _column(default, data_type='varchar', column_type='varchar(10)', **kwargs):
+    return ColumnInfo(name='c', position=1, data_type=data_type, column_type=column_type, default=default, **kwargs)
+
+
+@pytest.mark.parametrize('default, expected', [
+    (None, None),
+    ('NULL', None),
+    ('null', None),
+    ("'abc'", 'abc'),
+    ("'it''s'", "it's"),
+    ('abc', 'abc'),
+])
+def test_normalize_default_text(default, expected):
+    assert normalize_default(_column(default)) == expected
+
+
+@pytest.mark.parametrize('default, expected', [
+    ('current_timestamp()', 'CURRENT_TIMESTAMP'),
+    ('now()', 'CURRENT_TIMESTAMP'),
+    ('CURRENT_TIMESTAMP', 'CURRENT_TIMESTAMP'),
+    ('CURRENT_TIMESTAMP(3)', 'CURRENT_TIMESTAMP(3)'),
+    ('CURRENT_TIMESTAMP(0)', 'CURRENT_TIMESTAMP'),
+])
+def test_normalize_default_current_timestamp(default, expected):
+    assert normalize_default(_column(default, data_type='datetime', column_type='datetime')) == expected
+
+
+@pytest.mark.parametrize('default, expected', [
+    ('0.00', '0'),
+    ("'1.50'", '1.5'),
+    ('-2.0', '-2'),
+])
+def test_normalize_default_numeric(default, expected):
+    assert normalize_default(_column(default, data_type='decimal', column_type='decimal(10,2)')) == expected
+
+
+def test_normalize_default_numeric_representation():
+    defaults = ['10', '10.00', "'10.0'"]
+    normalized = {normalize_default(_column(default, data_type='int', column_type='int')) for default in defaults}
+    assert len(normalized) == 1
+
+
+def test_column_differences_equivalent():
+    source = ColumnInfo(name='id', position=1, data_type='int', column_type='int(11)', is_nullable=False,
+                        default="'0'", collation='utf8_general_ci')
+    target = ColumnInfo(name='id', position=1, data_type='int', column_type='int', is_nullable=False,
+                        default='0', collation='utf8mb3_general_ci')
+    assert column_differences(source, None, target, None) == []
+
+
+def test_column_differences_aspects():
+    source = ColumnInfo(name='name', position=1, data_type='varchar', column_type='varchar(20)', is_nullable=False,
+                        default="'x'", comment='имя')
+    target = ColumnInfo(name='name', position=1, data_type='varchar', column_type='varchar(10)', is_nullable=True,
+                        default=None)
+    assert column_differences(source, None, target, None) == ['type', 'nullable', 'default', 'comment']
+
+
+def test_column_differences_table_collation():
+    # collation столбца, совпадающий с collation таблицы, равносилен неуказанному
+    source = ColumnInfo(name='s', position=1, data_type='varchar', column_type='varchar(10)',
+                        collation='utf8mb4_general_ci')
+    target = ColumnInfo(name='s', position=1, data_type='varchar', column_type='varchar(10)')
+    assert column_differences(source, 'utf8mb4_general_ci', target, 'utf8mb4_general_ci') == []
+    target.collation = 'latin1_swedish_ci'
+    assert column_differences(source, 'utf8mb4_general_ci', target, 'utf8mb4_general_ci') == ['collation']
+
+
+def test_column_differences_generated_ignores_default():
+    source = ColumnInfo(name='g', position=1, data_type='int', column_type='int', extra='VIRTUAL GENERATED',
+                        generation_expression='(`a`  +  1)')
+    target = ColumnInfo(name='g', position=1, data_type='int', column_type='int', extra='virtual generated',
+                        generation_expression='(`a` + 1)', default='5')
+    assert column_differences(source, None, target, None) == []
@@ -0,0 +1,85 @@
+from definitions import DefinitionCache, ddl_tables, parse_table_definition, strip_foreign_keys
+
+
+DDL = """CREATE TABLE `orders` (
+  `id` int NOT NULL AUTO_INCREMENT,
+  `customer_id` int DEFAULT NULL,
+  `total` decimal(10,2) NOT NULL DEFAULT '0.00',
+  `created` datetime DEFAULT (now()),
+  `doubled` decimal(11,2) GENERATED ALWAYS AS ((`total` * 2)) VIRTUAL,
+  PRIMARY KEY (`id`),
+  UNIQUE KEY `uq_customer_created` (`customer_id`,`created`),
+  KEY `idx_total` (`total`),
+  CONSTRAINT `fk_customer` FOREIGN KEY (`customer_id`) REFERENCES `customers` (`id`),
+  CONSTRAINT `chk_total` CHECK ((`total` >= 0))
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4"""
+
+
+def test_parse_table_definition():
+    definition = parse_table_definition('orders', DDL)
+    assert list(definition.columns) == ['id', 'customer_id', 'total', 'created', 'doubled']
+    assert [column.position for column in definition.columns.values()] == [1, 2, 3, 4, 5]
+    assert definition.column_sql['total'] == "`total` decimal(10,2) NOT NULL DEFAULT '0.00'"
+    assert definition.columns['doubled'].extra == 'VIRTUAL GENERATED'
+    assert definition.columns['created'].extra == 'DEFAULT_GENERATED'
+    assert list(definition.indexes) == ['PRIMARY', 'uq_customer_created', 'idx_total']
+    assert list(definition.constraints) == ['fk_customer', 'chk_total']
+    assert definition.primary_key == ['id']
+
+
+def test_primary_key_composite_and_missing():
+    ddl = 'CREATE TABLE `t` (\n  `a` int NOT NULL,\n  `b` int NOT NULL,\n  PRIMARY KEY (`a`,`b`)\n) ENGINE=InnoDB'
+    assert parse_table_definition('t', ddl).primary_key == ['a', 'b']
+    assert parse_table_definition('t', 'CREATE TABLE `t` (\n  `a` int\n) ENGINE=InnoDB').primary_key == []
+
+
+def test_strip_foreign_keys():
+    stripped = strip_foreign_keys(DDL)
+    assert 'FOREIGN KEY' not in stripped
+    assert 'CONSTRAINT `chk_total` CHECK ((`total` >= 0))\n) ENGINE=InnoDB' in stripped
+    assert list(parse_table_definition('orders', stripped).constraints) == ['chk_total']
+
+
+def test_ddl_tables():
+    assert ddl_tables('ALTER TABLE `orders` ADD COLUMN `note` text, ALGORITHM=INSTANT') == ['orders']
+    assert ddl_tables('ALTER TABLE t RENAME COLUMN a TO b') == ['t']
+    assert ddl_tables('ALTER TABLE `db`.`a` RENAME TO `b`') == ['a', 'b']
+    assert ddl_tables('RENAME TABLE `a` TO `_a_old`, `_a_new` TO `a`') == ['a', '_a_old', '_a_new', 'a']
+    assert ddl_tables('DROP TABLE IF EXISTS `a`, b') == ['a', 'b']
+    assert ddl_tables('CREATE TABLE `n` (\n  `id` int\n)') == ['n']
+    assert ddl_tables("INSERT INTO `a` VALUES (1)") == []
+    assert ddl_tables('SELECT * FROM a') == []
+
+
+class Loader:
+    """ Источник текста CREATE TABLE со счетчиком обращений к серверу """
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self, table):
+        self.calls += 1
+        return f'CREATE TABLE `{table}` (\n  `id` int NOT NULL,\n  PRIMARY KEY (`id`)\n) ENGINE=InnoDB'
+
+
+def test_cache_hits_and_misses():
+    cache, load = DefinitionCache(), Loader()
+    for _ in range(3):
+        cache.get('a', load)
+    assert (load.calls, cache.hits, cache.misses) == (1, 2, 1)
+    assert round(cache.hit_ratio, 2) == 0.67
+
+
+def test_cache_invalidated_by_ddl():
+    cache, load = DefinitionCache(), Loader()
+    for table in ('a', 'b', 'c'):
+        cache.get(table, load)
+    cache.invalidate_statement('INSERT INTO `a` VALUES (1)')
+    assert set(cache.tables) == {'a', 'b', 'c'}
+    cache.invalidate_statement('ALTER TABLE `a` ADD COLUMN `x` int')
+    assert set(cache.tables) == {'b', 'c'}
+    cache.invalidate_statement('RENAME TABLE `b` TO `b_old`')
+    assert set(cache.tables) == {'c'}
+    cache.get('a', load)
+    cache.invalidate_statement('DROP TABLE `a`, `c`')
+    assert cache.tables == {}
+    assert load.calls == 4
@@ -0,0 +1,69 @@
+from plan import build_plan, detect_renames
+from schema import ColumnInfo, ForeignKeyInfo, SchemaSnapshot, TableInfo
+
+
+def _table(*columns):
+    """ Таблица из пар (имя, тип столбца) в порядке следования """
+    return TableInfo(name='t', columns={
+        name: ColumnInfo(name=name, position=position, data_type=column_type.split('(')[0], column_type=column_type)
+        for position, (name, column_type) in enumerate(columns, start=1)
+    })
+
+
+def test_detect_renames_explicit():
+    source = _table(('id', 'int'), ('title', 'varchar(10)'))
+    target = _table(('id', 'int'), ('name', 'text'))
+    renames, ambiguous = detect_renames(source, target, ['title'], ['name'], explicit={'name': 'title'})
+    assert renames == {'name': 'title'}
+    assert ambiguous == {}
+
+
+def test_detect_renames_by_signature_and_position():
+    source = _table(('id', 'int'), ('title', 'varchar(10)'))
+    target = _table(('id', 'int'), ('name', 'varchar(10)'))
+    renames, ambiguous = detect_renames(source, target, ['title'], ['name'])
+    assert renames == {'name': 'title'}
+    assert ambiguous == {}
+
+
+def test_detect_renames_different_signature():
+    source = _table(('id', 'int'), ('title', 'varchar(20)'))
+    target = _table(('id', 'int'), ('name', 'varchar(10)'))
+    assert detect_renames(source, target, ['title'], ['name']) == ({}, {})
+
+
+def test_detect_renames_several_candidates_by_position():
+    source = _table(('id', 'int'), ('first', 'varchar(10)'), ('second', 'varchar(10)'))
+    target = _table(('id', 'int'), ('a', 'varchar(10)'), ('b', 'varchar(10)'))
+    renames, ambiguous = detect_renames(source, target, ['first', 'second'], ['a', 'b'])
+    assert renames == {'a': 'first', 'b': 'second'}
+    assert ambiguous == {}
+
+
+def test_detect_renames_several_candidates_ambiguous():
+    source = _table(('id', 'int'), ('x', 'int'), ('y', 'int'), ('first', 'varchar(10)'), ('second', 'varchar(10)'))
+    target = _table(('id', 'int'), ('a', 'varchar(10)'), ('b', 'varchar(10)'))
+    renames, ambiguous = detect_renames(source, target, ['x', 'y', 'first', 'second'], ['a', 'b'])
+    assert renames == {}
+    assert ambiguous == {'a': ['first', 'second'], 'b': ['first', 'second']}
+
+
+def test_detect_renames_single_candidate_other_position():
+    # единственный кандидат с той же сигнатурой, но в другой позиции - не переименование, а случай на проверку
+    source = _table(('id', 'int'), ('code', 'int'), ('title', 'varchar(10)'))
+    target = _table(('id', 'int'), ('name', 'varchar(10)'), ('code', 'int'))
+    renames, ambiguous = detect_renames(source, target, ['title'], ['name'])
+    assert renames == {}
+    assert ambiguous == {'name': ['title']}
+
+
+def test_build_plan_defers_foreign_keys_of_new_tables():
+    parent = _table(('id', 'int'))
+    child = _table(('id', 'int'), ('parent_id', 'int'))
+    child.name = 'child'
+    child.foreign_keys['fk_parent'] = ForeignKeyInfo('fk_parent', ['parent_id'], 't', ['id'])
+    migration = build_plan(SchemaSnapshot(database='test', tables={'t': parent, 'child': child}),
+                           SchemaSnapshot(database='prod', tables={'t': parent}))
+    assert migration.added_tables == ['child']
+    assert [change.name for change in migration.foreign_key_adds['child'].changes] == ['fk_parent']
+    assert 'FOREIGN KEY' not in child.to_create_sql(foreign_keys=False)
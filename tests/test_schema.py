@@ -0,0 +1,23 @@
+from schema import ColumnInfo, SchemaSnapshot, TableInfo, TableStats, dump_snapshot, load_snapshot
+
+
+def _snapshot(rows_estimate):
+    table = TableInfo(name='t', columns={'id': ColumnInfo(name='id', position=1, data_type='int', column_type='int')},
+                      stats=TableStats(rows_estimate=rows_estimate, data_length=16384))
+    return SchemaSnapshot(database='db', tables={'t': table})
+
+
+def test_dump_snapshot_without_stats(tmp_path):
+    # статистика меняется от запуска к запуску - снимки неизменной структуры должны совпадать
+    first, second = tmp_path / 'first.json', tmp_path / 'second.json'
+    dump_snapshot(_snapshot(10), str(first))
+    dump_snapshot(_snapshot(20), str(second))
+    assert first.read_text(encoding='utf-8') == second.read_text(encoding='utf-8')
+    assert 'stats' not in first.read_text(encoding='utf-8')
+    assert load_snapshot(str(first)).tables['t'].columns['id'].column_type == 'int'
+
+
+def test_dump_snapshot_with_stats(tmp_path):
+    path = tmp_path / 'snapshot.json.gz'
+    dump_snapshot(_snapshot(10), str(path), stats=True)
+    assert load_snapshot(str(path)).tables['t'].stats.rows_estimate == 10
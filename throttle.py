@@ -0,0 +1,178 @@
+import threading
+import time
+from typing import Dict, List, Optional
+
+import mysql.connector
+
+from schema import as_text
+
+
+# Запросы показателей нагрузки сервера
+STATUS_QUERIES = {
+    'threads_running': "SHOW GLOBAL STATUS LIKE 'Threads_running'",
+    # длина списка истории InnoDB: растет, когда очистка (purge) не успевает за изменениями
+    'history_length': "SELECT `COUNT` FROM information_schema.INNODB_METRICS WHERE NAME = 'trx_rseg_history_len'",
+}
+# Показатель недоступен: нет привилегии (INNODB_METRICS требует PROCESS) или таблицы на этом сервере
+UNAVAILABLE_STATUS_ERRORS = {1044, 1109, 1142, 1146, 1227}
+# SHOW REPLICA STATUS появился в 8.0.22, на более старых версиях - SHOW SLAVE STATUS
+REPLICA_STATUS_QUERIES = (
+    ('SHOW REPLICA STATUS', 'Seconds_Behind_Source'),
+    ('SHOW SLAVE STATUS', 'Seconds_Behind_Master'),
+)
+
+
+class ThrottleTimeoutError(Exception):
+    """
+    Нагрузка на сервер не снизилась до допустимой за отведенное время ожидания
+    """
+
+
+class Throttle:
+    """
+    Ограничитель нагрузки: перед каждой операцией проверяет показатели сервера и при превышении порогов
+    делает паузу с экспоненциально растущей длительностью, пока нагрузка не спадет.
+    Показатели читаются по отдельному соединению и не чаще check_interval секунд; один экземпляр
+    может использоваться из нескольких потоков
+    """
+    def __init__(self, db_config: dict, replica_config: dict = None, max_threads_running: int = 32,
+                 max_history_length: int = 100000, max_replica_lag: float = 10.0, check_interval: float = 1.0,
+                 initial_delay: float = 0.5, max_delay: float = 30.0, max_wait: float = 600.0):
+        """
+        :param db_config: параметры подключения к наблюдаемой (боевой) БД
+        :param replica_config: параметры подключения к реплике для контроля отставания (опционально)
+        :param max_threads_running: порог числа одновременно выполняющихся запросов
+        :param max_history_length: порог длины списка истории InnoDB
+        :param max_replica_lag: порог отставания реплики в секундах
+        :param check_interval: как часто перечитывать показатели, пока нагрузка в норме (сек)
+        :param initial_delay: первая пауза при превышении порогов (сек), далее удваивается
+        :param max_delay: предельная длительность одной паузы (сек)
+        :param max_wait: предельное суммарное ожидание перед одной операцией (сек, 0 - без ограничения)
+        """
+        self.db_config = db_config
+        self.replica_config = replica_config
+        self.max_threads_running = max_threads_running
+        self.max_history_length = max_history_length
+        self.max_replica_lag = max_replica_lag
+        self.check_interval = check_interval
+        self.initial_delay = initial_delay
+        self.max_delay = max_delay
+        self.max_wait = max_wait
+        #
+        self.connections = {}
+        self.lock = threading.Lock()
+        self.last_check = 0.0
+        self.pauses = 0
+        self.waited = 0.0
+        # показатели, которые не удалось прочитать: больше не запрашиваются и не учитываются
+        self.disabled = set()
+
+    def _cursor(self, key: str, config: dict):
+        """ Курсор служебного соединения (создается при первом обращении и переподключается при обрыве) """
+        connection = self.connections.get(key)
+        if connection is None or not connection.is_connected():
+            connection = mysql.connector.connect(**config)
+            connection.autocommit = True
+            self.connections[key] = connection
+        return connection.cursor()
+
+    def _replica_lag(self) -> Optional[float]:
+        """
+        Отставание реплики в секундах
+        :return: отставание или None, если репликация остановлена или не настроена
+        """
+        cursor = self._cursor('replica', self.replica_config)
+        try:
+            for query, field in REPLICA_STATUS_QUERIES:
+                try:
+                    cursor.execute(query)
+                except mysql.connector.Error:
+                    continue
+                row = cursor.fetchone()
+                if row is None:
+                    return None
+                value = dict(zip(cursor.column_names, row)).get(field)
+                return float(value) if value is not None else None
+            return None
+        finally:
+            cursor.close()
+
+    def read_status(self) -> Dict[str, Optional[float]]:
+        """
+        Текущие показатели нагрузки сервера
+        :return: словарь {показатель: значение}
+        """
+        status = {}
+        cursor = self._cursor('source', self.db_config)
+        try:
+            for key, query in STATUS_QUERIES.items():
+                if key in self.disabled:
+                    continue
+                try:
+                    cursor.execute(query)
+                except mysql.connector.Error as exp:
+                    if exp.errno not in UNAVAILABLE_STATUS_ERRORS:
+                        raise exp
+                    self.disabled.add(key)
+                    print(' '*6, f'Показатель нагрузки {key} недоступен ({exp}), ограничитель его не учитывает')
+                    continue
+                row = cursor.fetchone()
+                status[key] = float(as_text(row[-1])) if row else None
+        finally:
+            cursor.close()
+        if self.replica_config:
+            status['replica_lag'] = self._replica_lag()
+        #
+        return status
+
+    def overloaded(self, status: Dict[str, Optional[float]]) -> List[str]:
+        """
+        Превышенные пороги нагрузки
+        :param status: показатели сервера
+        :return: список описаний превышений (пустой - нагрузка в норме)
+        """
+        reasons = []
+        threads = status.get('threads_running')
+        if threads is not None and threads > self.max_threads_running:
+            reasons.append(f'Threads_running {threads:.0f} > {self.max_threads_running}')
+        history = status.get('history_length')
+        if history is not None and history > self.max_history_length:
+            reasons.append(f'длина истории InnoDB {history:.0f} > {self.max_history_length}')
+        if 'replica_lag' in status:
+            lag = status['replica_lag']
+            if lag is None:
+                # остановленная репликация не позволяет оценить отставание - безопаснее подождать
+                reasons.append('отставание реплики неизвестно (репликация остановлена?)')
+            elif lag > self.max_replica_lag:
+                reasons.append(f'отставание реплики {lag:.0f} с > {self.max_replica_lag} с')
+        #
+        return reasons
+
+    def wait(self):
+        """
+        Ожидание допустимой нагрузки перед очередной операцией
+        """
+        with self.lock:
+            if time.monotonic() - self.last_check < self.check_interval:
+                return
+            delay = self.initial_delay
+            waited = 0.0
+            while True:
+                reasons = self.overloaded(self.read_status())
+                if not reasons:
+                    self.last_check = time.monotonic()
+                    return
+                if self.max_wait and waited >= self.max_wait:
+                    raise ThrottleTimeoutError(f'Нагрузка не снизилась за {waited:.0f} с: {"; ".join(reasons)}')
+                print(' '*6, f'Нагрузка на сервер выше допустимой ({"; ".join(reasons)}), пауза {delay:.1f} с')
+                time.sleep(delay)
+                waited += delay
+                self.pauses += 1
+                self.waited += delay
+                delay = min(delay * 2, self.max_delay)
+
+    def close(self):
+        for connection in self.connections.values():
+            if connection.is_connected():
+                connection.close()
+        self.connections = {}
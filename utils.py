@@ -1,6 +1,6 @@
 import uuid
 from datetime import date, time
-from random import randint, choice, sample
+from random import Random, randint, choice, sample
 
 
 def get_next_char():
@@ -176,3 +176,123 @@ def get_initial_data(as_tuples=True):
         managers_data = [(f["first_name"], f["last_name"], f["email"]) for f in managers_data]
     #
     return festivals_data, bands_data, schedules_data, managers_data
+
+
+def iter_initial_data(lim: int = 5) -> dict:
+    """
+    Ленивая генерация демо данных для таблиц произвольного размера: строки создаются по мере чтения
+    :param lim: число фестивалей, групп и менеджеров; расписаний - lim * 5
+    :return: словарь {таблица: (список столбцов, генератор строк-кортежей)} в порядке наполнения
+    """
+    genres = [
+        f"{choice(['Indi-', 'Hard-', ''])}{get_random_name(4,6)}{choice(['-Rock', '-Metal', ''])}" for i in range(10)
+    ]
+    domain = get_random_name()
+    festivals = ((i+1, get_random_name(), get_random_name(), date(2024, randint(1, 12), randint(1, 28)))
+                 for i in range(lim))
+    bands = ((i+1, get_random_name(), choice(genres), get_random_name()) for i in range(lim))
+    schedules = ((randint(1, lim), randint(1, lim), time(randint(12, 22), choice([0, 30])))
+                 for i in range(lim * 5))
+    managers = ((first_name, last_name, f"({first_name}.{last_name}@{domain}-festivals.com")
+                for i in range(lim)
+                for first_name in [get_random_name(3, 6)]
+                for last_name in [get_random_name(5, 10)])
+    #
+    return {
+        'festivals': (['festival_id', 'name', 'place', 'date'], festivals),
+        'bands': (['band_id', 'name', 'genre', 'city'], bands),
+        'schedules': (['festival_id', 'band_id', 'time'], schedules),
+        'managers': (['first_name', 'last_name', 'email'], managers),
+    }
+
+
+# Типы столбцов синтетических таблиц (по кругу) и их "измененные" варианты для расхождения схем
+SYNTHETIC_TYPES = ['INT', 'VARCHAR(64)', 'DATETIME', 'DECIMAL(12,2)', 'BIGINT', 'VARCHAR(255)', 'DATE', 'TEXT']
+SYNTHETIC_DRIFT_TYPES = {
+    'INT': 'BIGINT', 'VARCHAR(64)': 'VARCHAR(128)', 'DATETIME': 'TIMESTAMP NULL', 'DECIMAL(12,2)': 'DECIMAL(14,2)',
+    'BIGINT': 'BIGINT UNSIGNED', 'VARCHAR(255)': 'VARCHAR(512)', 'DATE': 'DATETIME', 'TEXT': 'MEDIUMTEXT',
+}
+
+
+def get_synthetic_table_name(index: int) -> str:
+    return f't_{index:05d}'
+
+
+def get_synthetic_columns(columns: int) -> list:
+    """
+    Столбцы синтетической таблицы (кроме первичного ключа и ссылки на родителя)
+    :param columns: число столбцов
+    :return: список пар (имя, тип)
+    """
+    return [(f'c_{j:03d}', SYNTHETIC_TYPES[j % len(SYNTHETIC_TYPES)]) for j in range(columns)]
+
+
+def get_synthetic_tables(tables: int = 50, columns: int = 10, indexes: int = 2, fk_chain: int = 5,
+                         seed: int = 0) -> list:
+    """
+    Генерация SQL запросов для создания синтетической схемы заданного размера
+    :param tables: число таблиц
+    :param columns: число столбцов в каждой таблице (кроме первичного ключа)
+    :param indexes: число вторичных индексов в каждой таблице
+    :param fk_chain: длина цепочек внешних ключей: таблица ссылается на предыдущую внутри цепочки (0 - без ключей)
+    :param seed: начальное значение генератора случайных чисел (одинаковые параметры - одинаковая схема)
+    :return: список запросов CREATE TABLE в порядке, допустимом для внешних ключей
+    """
+    random = Random(seed)
+    column_list = get_synthetic_columns(columns)
+    indexable = [name for name, column_type in column_list if column_type != 'TEXT']
+    queries = []
+    for i in range(tables):
+        lines = ['id BIGINT AUTO_INCREMENT PRIMARY KEY']
+        lines += [f'{name} {column_type} NULL' for name, column_type in column_list]
+        has_parent = fk_chain and i % fk_chain != 0
+        if has_parent:
+            lines.append('parent_id BIGINT NULL')
+        for k, name in enumerate(random.sample(indexable, min(indexes, len(indexable)))):
+            lines.append(f'KEY ix_{k}_{name} ({name})')
+        if has_parent:
+            lines.append(f'CONSTRAINT fk_{get_synthetic_table_name(i)}_parent FOREIGN KEY (parent_id) '
+                         f'REFERENCES {get_synthetic_table_name(i - 1)} (id)')
+        queries.append(f'CREATE TABLE IF NOT EXISTS {get_synthetic_table_name(i)} (\n    '
+                       + ',\n    '.join(lines) + '\n)')
+    #
+    return queries
+
+
+def get_synthetic_drift(tables: int = 50, columns: int = 10, fk_chain: int = 5, drift: float = 0.1,
+                        seed: int = 0) -> list:
+    """
+    Генерация SQL запросов, вносящих расхождения в синтетическую схему (применяются к тестовой БД)
+    :param tables: число таблиц схемы
+    :param columns: число столбцов в каждой таблице
+    :param fk_chain: длина цепочек внешних ключей схемы
+    :param drift: доля измененных таблиц (0..1); новых и удаленных таблиц - по пятой части от этой доли
+    :param seed: начальное значение генератора случайных чисел
+    :return: список запросов ALTER / CREATE / DROP TABLE
+    """
+    random = Random(seed + 1)
+    column_list = get_synthetic_columns(columns)
+    changed = random.sample(range(tables), round(tables * drift))
+    queries = []
+    for i in changed:
+        table = get_synthetic_table_name(i)
+        name, column_type = random.choice(column_list)
+        variant = random.choice(['add', 'drop', 'modify', 'index'])
+        if variant == 'add':
+            queries.append(f'ALTER TABLE {table} ADD COLUMN extra_{i} VARCHAR(32) NULL')
+        elif variant == 'drop':
+            queries.append(f'ALTER TABLE {table} DROP COLUMN {name}')
+        elif variant == 'modify':
+            queries.append(f'ALTER TABLE {table} MODIFY COLUMN {name} {SYNTHETIC_DRIFT_TYPES[column_type]}')
+        elif column_type != 'TEXT':
+            queries.append(f'ALTER TABLE {table} ADD INDEX ix_drift_{name} ({name})')
+
+    # удаляются только концы цепочек: на них никто не ссылается
+    chain_ends = [i for i in range(tables) if not fk_chain or (i + 1) % fk_chain == 0 or i == tables - 1]
+    for i in random.sample(chain_ends, min(len(chain_ends), round(tables * drift / 5))):
+        queries.append(f'DROP TABLE {get_synthetic_table_name(i)}')
+    for i in range(round(tables * drift / 5)):
+        queries.append(f'CREATE TABLE new_{i:05d} (id BIGINT AUTO_INCREMENT PRIMARY KEY, '
+                       f'name VARCHAR(64) NULL, created DATETIME NULL)')
+    #
+    return queries